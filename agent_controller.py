@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - agent循环控制
+限制一次开关门事件中agent多轮交互的轮数、总耗时和token用量，并记录每次事件的指标：
+轮数、各工具调用次数、每轮的模型/工具耗时、token用量和结束原因
+- 每轮开始前检查限制，已经返回的tool call仍会执行完，保证对话消息完整
+- 正在进行的模型请求不会被中断，异步版本会用剩余时间作为请求超时
+"""
+
+import os
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 单次事件最多调用模型的轮数
+AGENT_MAX_TURNS = int(os.getenv("AGENT_MAX_TURNS", "8"))
+# 单次事件的总耗时上限（秒），0表示不限制
+AGENT_DEADLINE_SECONDS = float(os.getenv("AGENT_DEADLINE_SECONDS", "60"))
+# 单次事件的token用量上限，0表示不限制
+AGENT_TOKEN_BUDGET = int(os.getenv("AGENT_TOKEN_BUDGET", "20000"))
+
+# 结束原因
+STOP_COMPLETED = "completed"
+STOP_NO_RESPONSE = "no_response"
+STOP_MAX_TURNS = "max_turns"
+STOP_DEADLINE = "deadline"
+STOP_TOKEN_BUDGET = "token_budget"
+
+
+def extract_usage(resp: Dict[str, Any]) -> Dict[str, int]:
+    """从agent api响应（dict）中读取token用量，兼容有Response包装和直接返回两种格式"""
+    usage = resp.get("Response", {}).get("Usage") or resp.get("Usage") or {}
+    return {
+        "prompt_tokens": int(usage.get("PromptTokens") or 0),
+        "completion_tokens": int(usage.get("CompletionTokens") or 0),
+        "total_tokens": int(usage.get("TotalTokens") or 0),
+    }
+
+
+class AgentLoopController:
+    """一次agent循环的限制与指标，每个开关门事件使用一个实例"""
+
+    def __init__(
+        self,
+        max_turns: Optional[int] = None,
+        deadline_seconds: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        初始化控制器
+
+        Args:
+            max_turns: 最多调用模型的轮数，默认读取AGENT_MAX_TURNS
+            deadline_seconds: 总耗时上限（秒），默认读取AGENT_DEADLINE_SECONDS，0表示不限制
+            token_budget: token用量上限，默认读取AGENT_TOKEN_BUDGET，0表示不限制
+            clock: 计时函数，默认time.monotonic
+        """
+        self.max_turns = AGENT_MAX_TURNS if max_turns is None else max_turns
+        self.deadline_seconds = AGENT_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
+        self.token_budget = AGENT_TOKEN_BUDGET if token_budget is None else token_budget
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        """清空指标，重新开始计时"""
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stop_reason: Optional[str] = None
+        self.turns: List[Dict[str, Any]] = []
+        self.tool_calls_by_name: Dict[str, int] = {}
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        self._turn_started_at: Optional[float] = None
+
+    def start(self):
+        """开始一次agent循环"""
+        self.reset()
+        self.started_at = self._clock()
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        finished_at = self._clock() if self.finished_at is None else self.finished_at
+        return finished_at - self.started_at
+
+    def remaining_seconds(self) -> Optional[float]:
+        """距离截止时间的秒数，不限制时返回None"""
+        if not self.deadline_seconds:
+            return None
+        return max(0.0, self.deadline_seconds - self.elapsed())
+
+    def should_continue(self) -> bool:
+        """
+        每轮调用模型前检查限制，超出时记录结束原因并返回False
+
+        Returns:
+            bool: 是否可以开始下一轮
+        """
+        if self.started_at is None:
+            self.start()
+        if self.max_turns and len(self.turns) >= self.max_turns:
+            return self._stop(STOP_MAX_TURNS)
+        if self.deadline_seconds and self.elapsed() >= self.deadline_seconds:
+            return self._stop(STOP_DEADLINE)
+        if self.token_budget and self.usage["total_tokens"] >= self.token_budget:
+            return self._stop(STOP_TOKEN_BUDGET)
+        self._turn_started_at = self._clock()
+        return True
+
+    def _stop(self, reason: str) -> bool:
+        logger.warning(f"agent循环达到限制({reason})，提前结束: {len(self.turns)} 轮, {self.usage['total_tokens']} tokens, {self.elapsed():.2f}s")
+        self.finish(reason)
+        return False
+
+    def _since(self, now: float) -> float:
+        """本阶段的开始时间，没有记录时返回now（时钟读数可能为0，不能按真假判断）"""
+        return now if self._turn_started_at is None else self._turn_started_at
+
+    def record_response(self, resp: Dict[str, Any]):
+        """记录一轮模型响应的耗时和token用量"""
+        now = self._clock()
+        usage = extract_usage(resp)
+        for key, value in usage.items():
+            self.usage[key] += value
+        self.turns.append({
+            "turn": len(self.turns) + 1,
+            "model_seconds": round(now - self._since(now), 3),
+            "tool_seconds": 0.0,
+            "tool_calls": 0,
+            "tokens": usage["total_tokens"],
+        })
+        self._turn_started_at = now
+
+    def record_tool_calls(self, tool_calls: List[Dict[str, Any]]):
+        """记录本轮执行的工具调用和耗时（在工具全部执行完后调用）"""
+        if not self.turns:
+            return
+        now = self._clock()
+        turn = self.turns[-1]
+        turn["tool_calls"] += len(tool_calls)
+        turn["tool_seconds"] = round(turn["tool_seconds"] + now - self._since(now), 3)
+        for tool_call in tool_calls:
+            name = tool_call.get("Function", {}).get("Name", "unknown")
+            self.tool_calls_by_name[name] = self.tool_calls_by_name.get(name, 0) + 1
+        self._turn_started_at = now
+
+    def finish(self, reason: str = STOP_COMPLETED):
+        """结束循环，已经结束时不覆盖之前的结束原因"""
+        if self.finished_at is not None:
+            return
+        if self.started_at is None:
+            self.started_at = self._clock()
+        self.finished_at = self._clock()
+        self.stop_reason = reason
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        本次事件的指标
+
+        Returns:
+            Dict: turns、tool_calls、tool_calls_by_name、turn_latencies（每轮总耗时）、turn_details、
+                api_usage、elapsed_seconds、stop_reason（agent循环未运行时为None）和limits
+        """
+        return {
+            "turns": len(self.turns),
+            "tool_calls": sum(self.tool_calls_by_name.values()),
+            "tool_calls_by_name": dict(self.tool_calls_by_name),
+            "turn_latencies": [round(turn["model_seconds"] + turn["tool_seconds"], 3) for turn in self.turns],
+            "turn_details": [dict(turn) for turn in self.turns],
+            "api_usage": dict(self.usage),
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "stop_reason": self.stop_reason,
+            "limits": {
+                "max_turns": self.max_turns,
+                "deadline_seconds": self.deadline_seconds,
+                "token_budget": self.token_budget,
+            },
+        }
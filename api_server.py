@@ -8,13 +8,14 @@ import os
 import json
 import logging
 from datetime import datetime, timezone
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
 # 导入自定义模块
-from db import SessionLocal, get_items_for_recommendation, get_current_fridge_summary
+from db import SessionLocal, get_items_for_recommendation, get_current_fridge_summary, get_device_snapshot
 from meal_recommendation_agent import MealRecommendationAgent
+from ingestion_queue import QueueFullError, IngestionWorkerPool, get_ingestion_queue, parse_detected_at
 
 # 加载环境变量
 load_dotenv()
@@ -35,6 +36,20 @@ except Exception as e:
     logger.error(f"菜谱推荐代理初始化失败: {e}")
     recommendation_agent = None
 
+# 开关门事件工作线程池，导入模块时不启动：直接运行 python api_server.py 且INGESTION_EMBEDDED_WORKERS为true时
+# 在本进程内启动；WSGI多进程部署单独运行 python ingestion_queue.py，或在需要的进程中调用start_embedded_ingestion_workers
+INGESTION_EMBEDDED_WORKERS = os.getenv('INGESTION_EMBEDDED_WORKERS', 'true').lower() in ('1', 'true', 'yes')
+ingestion_pool = None
+
+
+def start_embedded_ingestion_workers():
+    """在本进程内启动开关门事件工作线程池，已启动时直接返回"""
+    global ingestion_pool
+    if ingestion_pool is None:
+        ingestion_pool = IngestionWorkerPool(get_ingestion_queue())
+        ingestion_pool.start()
+    return ingestion_pool
+
 
 @app.route('/api/meal-recommendation', methods=['POST'])
 def meal_recommendation():
@@ -67,10 +82,20 @@ def meal_recommendation():
                 "timestamp": datetime.now(timezone.utc).isoformat()
             }), 400
         
+        # 不指定设备会读取所有设备的食材
+        if not device_id:
+            return jsonify({
+                "success": False,
+                "error": "缺少device_id参数",
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }), 400
+        
         # 可选参数
         meal_type = data.get('meal_type')
         dietary_preferences = data.get('dietary_preferences')
         urgency_level = data.get('urgency_level', 'medium')
+        fast_mode = bool(data.get('fast_mode', False))
+        shortlist_mode = bool(data.get('shortlist_mode', False))
         
         logger.info(f"收到菜谱推荐请求 - 设备ID: {device_id}, 消息: {user_message}")
         
@@ -83,10 +108,32 @@ def meal_recommendation():
                 "device_id": device_id
             }), 503
         
+        request_info = {
+            "meal_type": meal_type,
+            "urgency_level": urgency_level,
+            "dietary_preferences": dietary_preferences,
+            "user_message": user_message,
+            "fast_mode": fast_mode,
+            "shortlist_mode": shortlist_mode
+        }
+        
         # 从数据库获取食材数据
         session = SessionLocal()
         try:
-            food_items = get_items_for_recommendation(session, device_id)
+            # 先用设备库存快照的指纹查推荐缓存，命中时不需要读取食材列表
+            snapshot = get_device_snapshot(session, device_id)
+            inventory_fingerprint = snapshot.inventory_fingerprint if snapshot is not None else None
+            if inventory_fingerprint and snapshot.item_count:
+                cached_result = recommendation_agent.get_cached_recommendation(
+                    device_id, inventory_fingerprint, user_message, meal_type, dietary_preferences, shortlist_mode,
+                    fast_mode=fast_mode
+                )
+                if cached_result is not None:
+                    cached_result["request_info"] = request_info
+                    logger.info(f"菜谱推荐命中缓存 - 设备ID: {device_id}")
+                    return jsonify(cached_result)
+            
+            food_items = get_items_for_recommendation(session, device_id, include_json=False)
             logger.info(f"从数据库获取到 {len(food_items)} 个食材")
             
             if not food_items:
@@ -118,17 +165,15 @@ def meal_recommendation():
                 user_message=user_message,
                 device_id=device_id,
                 meal_type=meal_type,
-                dietary_preferences=dietary_preferences
+                dietary_preferences=dietary_preferences,
+                inventory_fingerprint=inventory_fingerprint,
+                fast_mode=fast_mode,
+                shortlist_mode=shortlist_mode
             )
             
             # 添加请求信息到响应
             recommendation_result.update({
-                "request_info": {
-                    "meal_type": meal_type,
-                    "urgency_level": urgency_level,
-                    "dietary_preferences": dietary_preferences,
-                    "user_message": user_message
-                }
+                "request_info": request_info
             })
             
             logger.info(f"成功生成菜谱推荐 - 设备ID: {device_id}")
@@ -147,19 +192,144 @@ def meal_recommendation():
         }), 500
 
 
+def _sse_event(event: str, data: dict) -> str:
+    """格式化一条server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/meal-recommendation/stream', methods=['POST'])
+def meal_recommendation_stream():
+    """
+    菜谱推荐API端点（SSE流式版本）
+    
+    请求体与 /api/meal-recommendation 相同。响应为text/event-stream，
+    先立即推送本地计算的食材分类和提醒(inventory)，再逐个推送模型生成的菜谱(recipe)，
+    最后推送完整结果(done)；失败时推送error事件。
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            "success": False,
+            "error": "请求体为空或格式无效",
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }), 400
+    
+    device_id = data.get('device_id')
+    user_message = data.get('user_message')
+    if not user_message:
+        return jsonify({
+            "success": False,
+            "error": "缺少用户消息参数",
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }), 400
+    
+    if not device_id:
+        return jsonify({
+            "success": False,
+            "error": "缺少device_id参数",
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }), 400
+    
+    if not recommendation_agent:
+        return jsonify({
+            "success": False,
+            "error": "推荐服务暂时不可用，请稍后重试",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "device_id": device_id
+        }), 503
+    
+    meal_type = data.get('meal_type')
+    dietary_preferences = data.get('dietary_preferences')
+    request_info = {
+        "meal_type": meal_type,
+        "urgency_level": data.get('urgency_level', 'medium'),
+        "dietary_preferences": dietary_preferences,
+        "user_message": user_message
+    }
+    logger.info(f"收到流式菜谱推荐请求 - 设备ID: {device_id}, 消息: {user_message}")
+    
+    session = SessionLocal()
+    try:
+        food_items = get_items_for_recommendation(session, device_id, include_json=False)
+    except Exception as e:
+        logger.error(f"读取食材数据异常: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"服务器内部错误: {str(e)}",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "device_id": device_id
+        }), 500
+    finally:
+        session.close()
+    
+    def generate():
+        if not food_items:
+            yield _sse_event("done", {
+                "success": True,
+                "message": "当前冰箱中没有食材，建议先添加一些新鲜食材。",
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "device_id": device_id,
+                "food_inventory": {
+                    "total_items": 0,
+                    "fresh_items": [],
+                    "expiring_soon": [],
+                    "needs_attention": [],
+                    "expired_items": []
+                },
+                "meal_recommendations": [],
+                "food_alerts": {
+                    "urgent_count": 0,
+                    "expiring_today": 0,
+                    "expired_count": 0,
+                    "recommendations": ["冰箱中暂无食材，建议购买一些新鲜食物"]
+                },
+                "request_info": request_info,
+                "api_usage": None
+            })
+            return
+        for event, payload in recommendation_agent.recommend_meals_stream(
+            food_items=food_items,
+            user_message=user_message,
+            device_id=device_id,
+            meal_type=meal_type,
+            dietary_preferences=dietary_preferences
+        ):
+            if event in ("done", "error"):
+                payload["request_info"] = request_info
+            yield _sse_event(event, payload)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭nginx缓冲，保证事件即时到达
+        }
+    )
+
+
 @app.route('/api/fridge-status', methods=['GET'])
 def fridge_status():
     """
     获取冰箱状态摘要
     
-    返回当前冰箱中所有食材的基本统计信息
+    返回指定设备当前所有食材的基本统计信息，include_items=false时不返回食材列表，只读取库存快照
+    缺少device_id时返回400，不做跨设备的全表查询
     """
+    device_id = request.args.get('device_id')
+    if not device_id:
+        return jsonify({
+            "success": False,
+            "error": "缺少device_id参数",
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }), 400
+    
     try:
-        device_id = request.args.get('device_id')
+        include_items = request.args.get('include_items', 'true').lower() not in ('false', '0', 'no')
         
         session = SessionLocal()
         try:
-            summary = get_current_fridge_summary(session, device_id)
+            summary = get_current_fridge_summary(session, device_id, include_items=include_items)
             logger.info(f"获取冰箱状态摘要 - 设备ID: {device_id}, 总计: {summary['total_items']} 个食材")
             
             return jsonify({
@@ -178,8 +348,104 @@ def fridge_status():
             "success": False,
             "error": f"获取冰箱状态失败: {str(e)}",
             "timestamp": datetime.now(timezone.utc).isoformat(),
-            "device_id": request.args.get('device_id')
+            "device_id": device_id
+        }), 500
+
+
+@app.route('/api/door-events', methods=['POST'])
+def enqueue_door_event():
+    """
+    开关门事件接入端点
+    
+    将冰箱图片事件写入持久化队列后立即返回202，由工作线程池异步完成识别和数据库更新；
+    参数缺失或detected_at不是ISO格式时返回400，队列已满时返回429
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            "success": False,
+            "error": "请求体为空或格式无效",
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }), 400
+    
+    device_id = data.get('device_id')
+    image_url = data.get('image_url')
+    if not device_id or not image_url:
+        return jsonify({
+            "success": False,
+            "error": "缺少device_id或image_url参数",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "device_id": device_id
+        }), 400
+    
+    try:
+        detected_at = parse_detected_at(data.get('detected_at'))
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "detected_at格式无效，应为ISO 8601时间，例如2024-09-23T07:30:00Z",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "device_id": device_id
+        }), 400
+    
+    try:
+        event_id = get_ingestion_queue().enqueue(device_id, image_url, detected_at.isoformat() if detected_at else None)
+    except QueueFullError as e:
+        logger.warning(f"开关门事件被拒绝 - 设备ID: {device_id}, {e}")
+        response = jsonify({
+            "success": False,
+            "error": "事件队列已满，请稍后重试",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "device_id": device_id,
+            "queue_depth": e.depth
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    except Exception as e:
+        logger.error(f"开关门事件入队异常: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"服务器内部错误: {str(e)}",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "device_id": device_id
         }), 500
+    
+    logger.info(f"开关门事件已入队 - 设备ID: {device_id}, 事件ID: {event_id}")
+    return jsonify({
+        "success": True,
+        "event_id": event_id,
+        "status": "pending",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "device_id": device_id
+    }), 202
+
+
+@app.route('/api/door-events/<int:event_id>', methods=['GET'])
+def get_door_event(event_id: int):
+    """查询开关门事件的处理状态"""
+    event = get_ingestion_queue().get_event(event_id)
+    if event is None:
+        return jsonify({
+            "success": False,
+            "error": "事件不存在",
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }), 404
+    return jsonify({
+        "success": True,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "event": event
+    })
+
+
+@app.route('/api/ingestion/metrics', methods=['GET'])
+def ingestion_metrics():
+    """开关门事件队列和工作线程池指标"""
+    return jsonify({
+        "success": True,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "queue": get_ingestion_queue().metrics(),
+        "workers": ingestion_pool.metrics() if ingestion_pool is not None else None
+    })
 
 
 @app.route('/api/health', methods=['GET'])
@@ -205,7 +471,11 @@ def index():
         "description": "智能冰箱管理系统API服务",
         "endpoints": {
             "POST /api/meal-recommendation": "获取个性化菜谱推荐",
+            "POST /api/meal-recommendation/stream": "获取个性化菜谱推荐（SSE流式）",
             "GET /api/fridge-status": "获取冰箱状态摘要",
+            "POST /api/door-events": "提交开关门图片事件（异步处理）",
+            "GET /api/door-events/<event_id>": "查询开关门事件处理状态",
+            "GET /api/ingestion/metrics": "事件队列和工作线程池指标",
             "GET /api/health": "服务健康检查"
         },
         "timestamp": datetime.now(timezone.utc).isoformat()
@@ -250,4 +520,7 @@ if __name__ == '__main__':
     debug = os.getenv('FLASK_ENV') == 'development'
     
     logger.info(f"启动FreshTrackAI API服务器 - 端口: {port}, 调试模式: {debug}")
+    # 调试模式的自动重载会再启动一个子进程，只在实际处理请求的进程中启动工作线程池
+    if INGESTION_EMBEDDED_WORKERS and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_embedded_ingestion_workers()
     app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
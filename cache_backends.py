@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 缓存后端模块
+可插拔的键值缓存后端，支持TTL过期和LRU淘汰
+固定条目（如推荐缓存的失效代数）单独保存，不过期也不参与LRU淘汰
+sqlite/database后端每写入CACHE_EVICT_INTERVAL次才清理一次过期和超出上限的条目，条目数可能短暂超出上限
+多个缓存共用同一个文件或数据库时用namespace区分：键自动加上"namespace:"前缀，
+条目数统计、LRU淘汰和clear都只作用于本命名空间
+- memory: 进程内缓存
+- sqlite: 本地SQLite文件，多进程共享
+- database: 复用DATABASE_URL对应的数据库（cache_entries表）
+"""
+
+import os
+import time
+import sqlite3
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# sqlite/database后端每写入多少次执行一次淘汰（统计条目数需要扫描全表）
+CACHE_EVICT_INTERVAL = int(os.getenv("CACHE_EVICT_INTERVAL", "100"))
+
+
+class CacheBackend:
+    """缓存后端接口，值统一为字符串（调用方负责序列化）"""
+
+    namespace = ""
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}" if self.namespace else key
+
+    def _key_range(self) -> Optional[Tuple[str, str]]:
+        """本命名空间的键范围[lower, upper)，没有命名空间时返回None表示整张表"""
+        if not self.namespace:
+            return None
+        # ';'紧跟在':'之后，范围条件可以直接使用主键索引
+        return f"{self.namespace}:", f"{self.namespace};"
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def get_pinned(self, key: str) -> Optional[str]:
+        """读取固定条目"""
+        raise NotImplementedError
+
+    def set_pinned(self, key: str, value: str):
+        """写入固定条目，固定条目不过期、不参与LRU淘汰，也不会被clear清除"""
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """进程内LRU缓存"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._pinned: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_pinned(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._pinned.get(key)
+
+    def set_pinned(self, key: str, value: str):
+        with self._lock:
+            self._pinned[key] = value
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """SQLite文件缓存，同一台机器上的多个进程可共享"""
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        evict_interval: int = CACHE_EVICT_INTERVAL,
+        namespace: str = ""
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.evict_interval = max(1, evict_interval)
+        self._writes = itertools.count(1)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "cache_key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, last_access REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_last_access ON cache_entries (last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_pinned_entries (cache_key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3连接不能跨线程使用，每个线程各自持有一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _scope(self) -> Tuple[str, tuple]:
+        """本命名空间的WHERE条件和参数"""
+        key_range = self._key_range()
+        if key_range is None:
+            return "1 = 1", ()
+        return "cache_key >= ? AND cache_key < ?", key_range
+
+    def get(self, key: str) -> Optional[str]:
+        key = self._key(key)
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM cache_entries WHERE cache_key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE cache_entries SET last_access = ? WHERE cache_key = ?", (now, key))
+        conn.commit()
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        key = self._key(key)
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (cache_key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, value, now + ttl if ttl else None, now),
+        )
+        if next(self._writes) % self.evict_interval == 0:
+            self._evict(conn, now)
+        conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        scope, params = self._scope()
+        conn.execute(f"DELETE FROM cache_entries WHERE {scope} AND expires_at IS NOT NULL AND expires_at <= ?", (*params, now))
+        count = conn.execute(f"SELECT COUNT(*) FROM cache_entries WHERE {scope}", params).fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE cache_key IN ("
+                f"SELECT cache_key FROM cache_entries WHERE {scope} ORDER BY last_access LIMIT ?)",
+                (*params, count - self.max_entries),
+            )
+
+    def delete(self, key: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_entries WHERE cache_key = ?", (self._key(key),))
+        conn.commit()
+
+    def clear(self):
+        scope, params = self._scope()
+        conn = self._conn()
+        conn.execute(f"DELETE FROM cache_entries WHERE {scope}", params)
+        conn.commit()
+
+    def get_pinned(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM cache_pinned_entries WHERE cache_key = ?", (self._key(key),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_pinned(self, key: str, value: str):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_pinned_entries (cache_key, value) VALUES (?, ?)", (self._key(key), value)
+        )
+        conn.commit()
+
+
+class DatabaseCacheBackend(CacheBackend):
+    """使用现有SQL数据库的cache_entries表，部署多台服务器时共享缓存"""
+
+    def __init__(self, max_entries: int = 100000, evict_interval: int = CACHE_EVICT_INTERVAL, namespace: str = ""):
+        from db import CacheEntry, PinnedCacheEntry, SessionLocal
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.evict_interval = max(1, evict_interval)
+        self._writes = itertools.count(1)
+        self._model = CacheEntry
+        self._pinned_model = PinnedCacheEntry
+        self._session_factory = SessionLocal
+
+    def get(self, key: str) -> Optional[str]:
+        session = self._session_factory()
+        try:
+            entry = session.get(self._model, self._key(key))
+            if entry is None:
+                return None
+            now = datetime.now(timezone.utc)
+            expires_at = entry.expires_at
+            if expires_at is not None and expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at is not None and expires_at <= now:
+                session.delete(entry)
+                session.commit()
+                return None
+            entry.last_access = now
+            value = entry.value
+            session.commit()
+            return value
+        finally:
+            session.close()
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        session = self._session_factory()
+        try:
+            now = datetime.now(timezone.utc)
+            session.merge(self._model(
+                cache_key=self._key(key),
+                value=value,
+                expires_at=now + timedelta(seconds=ttl) if ttl else None,
+                last_access=now,
+            ))
+            session.commit()
+            if next(self._writes) % self.evict_interval == 0:
+                self._evict(session, now)
+        finally:
+            session.close()
+
+    def _scoped_query(self, session, *columns):
+        """只包含本命名空间条目的查询"""
+        query = session.query(*(columns or (self._model,)))
+        key_range = self._key_range()
+        if key_range is not None:
+            query = query.filter(self._model.cache_key >= key_range[0], self._model.cache_key < key_range[1])
+        return query
+
+    def _evict(self, session, now: datetime):
+        model = self._model
+        self._scoped_query(session).filter(
+            model.expires_at.isnot(None), model.expires_at <= now
+        ).delete(synchronize_session=False)
+        count = self._scoped_query(session).count()
+        if count > self.max_entries:
+            stale_keys = [
+                row.cache_key for row in
+                self._scoped_query(session, model.cache_key).order_by(model.last_access).limit(count - self.max_entries)
+            ]
+            session.query(model).filter(model.cache_key.in_(stale_keys)).delete(synchronize_session=False)
+        session.commit()
+
+    def delete(self, key: str):
+        session = self._session_factory()
+        try:
+            session.query(self._model).filter(self._model.cache_key == self._key(key)).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def clear(self):
+        session = self._session_factory()
+        try:
+            self._scoped_query(session).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def get_pinned(self, key: str) -> Optional[str]:
+        session = self._session_factory()
+        try:
+            entry = session.get(self._pinned_model, self._key(key))
+            return entry.value if entry is not None else None
+        finally:
+            session.close()
+
+    def set_pinned(self, key: str, value: str):
+        session = self._session_factory()
+        try:
+            session.merge(self._pinned_model(cache_key=self._key(key), value=value))
+            session.commit()
+        finally:
+            session.close()
+
+
+def create_cache_backend(
+    kind: str,
+    max_entries: int,
+    sqlite_path: Optional[str] = None,
+    namespace: str = ""
+) -> Optional[CacheBackend]:
+    """
+    按名称创建缓存后端
+
+    Args:
+        kind: memory / sqlite / database / none
+        max_entries: 本命名空间的最大缓存条目数，超出时按LRU淘汰
+        sqlite_path: sqlite后端使用的文件路径
+        namespace: 缓存命名空间，共用同一个文件或数据库的缓存各自计数、淘汰和清空
+
+    Returns:
+        CacheBackend: 缓存后端，kind为none时返回None
+    """
+    kind = (kind or "none").lower()
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return MemoryCacheBackend(max_entries)
+    if kind == "sqlite":
+        return SQLiteCacheBackend(
+            sqlite_path or os.getenv("CACHE_SQLITE_PATH", "freshtrack_cache.sqlite3"), max_entries, namespace=namespace
+        )
+    if kind == "database":
+        return DatabaseCacheBackend(max_entries, namespace=namespace)
+    raise ValueError(f"不支持的缓存后端: {kind}")
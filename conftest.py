@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+pytest公共配置
+单元测试使用临时SQLite数据库和内存缓存，不依赖外部数据库和混元API
+"""
+
+import os
+import tempfile
+
+_test_dir = tempfile.mkdtemp(prefix="freshtrack_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_test_dir, 'freshtrack.sqlite3')}"
+os.environ.setdefault("RECOMMENDATION_CACHE_BACKEND", "memory")
+os.environ.setdefault("RECOGNITION_CACHE_BACKEND", "memory")
+os.environ.setdefault("INGESTION_QUEUE_PATH", os.path.join(_test_dir, "ingestion.sqlite3"))
+
+import pytest
+
+# test_full_pipeline.py需要真实的腾讯云密钥和数据库，作为脚本单独运行
+collect_ignore = ["test_full_pipeline.py"]
+
+
+@pytest.fixture
+def fridge_db():
+    """建表并在每个测试后清空冰箱相关的表"""
+    from db import Base, SessionLocal, create_tables, engine
+    create_tables()
+    yield SessionLocal
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
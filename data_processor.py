@@ -11,25 +11,48 @@ data_processor.py
 
 import os
 import json
+import asyncio
+import threading
+from functools import partial
 from typing import List, Dict, Any, Optional
 import requests
+from sqlalchemy.exc import IntegrityError
 from db import (
-    get_all_items,
+    FRIDGE_ITEM_FIELDS,
+    apply_fridge_changes,
+    get_items_by_device,
     get_item_by_id,
+    parse_time_fields,
+    refresh_device_snapshots,
     add_fridge_item,
     delete_item,
 )
+from item_reconciler import UPDATABLE_FIELDS, ReconcileResult, reconcile_items
+from prompt_encoding import (
+    AGENT_COMPACT_HISTORY,
+    build_field_legend,
+    build_new_item_refs,
+    compact_agent_history,
+    encode_reconcile_items,
+    merge_new_item_ref,
+)
+from hunyuan_pool import get_hunyuan_client, chat_completions, achat_completions
+from recommendation_cache import invalidate_device_recommendations
+from tool_executor import AGENT_PARALLEL_TOOL_CALLS, execute_tool_calls, aexecute_tool_calls
+from agent_controller import STOP_COMPLETED, STOP_DEADLINE, STOP_NO_RESPONSE, AgentLoopController
 
 from db import SessionLocal
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
-def get_current_fridge_items() -> List[Dict[str, Any]]:
-    """获取数据库中当前所有冰箱物品"""
+def get_current_fridge_items(device_id: Optional[str]) -> List[Dict[str, Any]]:
+    """获取指定设备当前的冰箱物品（走索引），不提供device_id时抛出ValueError，不读取所有设备的物品"""
+    if not device_id:
+        raise ValueError("读取冰箱物品需要device_id")
     session = SessionLocal()
     try:
-        items = get_all_items(session)
+        items = get_items_by_device(session, device_id)
         # 转为dict列表，排除SQLAlchemy内部字段
         result = []
         for item in items:
@@ -56,6 +79,37 @@ def get_current_fridge_items() -> List[Dict[str, Any]]:
         session.close()
 
 
+class FridgeItemsSnapshot:
+    """
+    一次agent会话内get_current_fridge_items结果的缓存
+    第一次调用时读取数据库，之后直接返回内存中的结果，直到本会话通过工具调用写入数据库时失效；
+    不感知其他会话或进程的写入，只应在单次对比处理期间使用
+    """
+
+    def __init__(self, device_id: Optional[str] = None):
+        self.device_id = device_id
+        self.hits = 0
+        self.loads = 0
+        self._items: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> List[Dict[str, Any]]:
+        """返回当前物品列表，缓存失效时重新读取"""
+        # 读取期间持有锁，并行执行的写操作要等读取完成后才能使缓存失效，不会留下过期结果
+        with self._lock:
+            if self._items is None:
+                self._items = get_current_fridge_items(self.device_id)
+                self.loads += 1
+            else:
+                self.hits += 1
+            return self._items
+
+    def invalidate(self):
+        """本会话写入数据库后调用"""
+        with self._lock:
+            self._items = None
+
+
 def get_item_image_by_id(item_id: int) -> Optional[str]:
     """通过id获取物品截图（调用agent api的tool）"""
     # TODO: 调用agent api获取图片
@@ -86,16 +140,16 @@ def get_hunyuan_tools_schema() -> List[Dict[str, Any]]:
             "Type": "function",
             "Function": {
                 "Name": "add_fridge_item",
-                "Description": "新增物品到冰箱数据库",
-                "Parameters": '{"type": "object", "properties": {"item_info": {"type": "object"}}, "required": ["item_info"]}'
+                "Description": "新增物品到冰箱数据库，传识别结果引用编号new_item_ref，或传包含name和image_url的完整item_info",
+                "Parameters": '{"type": "object", "properties": {"new_item_ref": {"type": "string"}, "item_info": {"type": "object"}}}'
             }
         },
         {
             "Type": "function",
             "Function": {
                 "Name": "update_fridge_item",
-                "Description": "根据id更新冰箱物品信息",
-                "Parameters": '{"type": "object", "properties": {"item_id": {"type": "integer"}, "item_info": {"type": "object"}}, "required": ["item_id", "item_info"]}'
+                "Description": "根据id更新冰箱物品信息，可以用new_item_ref指定对应的识别结果",
+                "Parameters": '{"type": "object", "properties": {"item_id": {"type": "integer"}, "new_item_ref": {"type": "string"}, "item_info": {"type": "object"}}, "required": ["item_id"]}'
             }
         },
         {
@@ -109,29 +163,9 @@ def get_hunyuan_tools_schema() -> List[Dict[str, Any]]:
     ]
 
 
-def call_hunyuan_agent_api(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], tool_choice: str = "auto") -> Dict[str, Any]:
-    """调用腾讯混元 functioncall agent api，返回响应（使用官方SDK）"""
-    from tencentcloud.common import credential
-    from tencentcloud.common.profile.client_profile import ClientProfile
-    from tencentcloud.common.profile.http_profile import HttpProfile
-    from tencentcloud.hunyuan.v20230901 import hunyuan_client, models
-    import logging
-
-    secret_id = os.getenv("TENCENTCLOUD_SECRET_ID")
-    secret_key = os.getenv("TENCENTCLOUD_SECRET_KEY")
-    if not secret_id or not secret_key:
-        raise ValueError("请设置腾讯云API密钥环境变量")
-
-    cred = credential.Credential(secret_id, secret_key)
-    httpProfile = HttpProfile()
-    httpProfile.endpoint = "hunyuan.tencentcloudapi.com"
-    httpProfile.reqTimeout = 120
-    clientProfile = ClientProfile()
-    clientProfile.httpProfile = httpProfile
-    client = hunyuan_client.HunyuanClient(cred, "", clientProfile)
-
-    # 构造请求参数
-    params = {
+def build_agent_params(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], tool_choice: str = "auto") -> Dict[str, Any]:
+    """构造functioncall agent的请求参数"""
+    return {
         "Model": "hunyuan-functioncall",
         "Stream": False,
         "Messages": messages,
@@ -140,66 +174,131 @@ def call_hunyuan_agent_api(messages: List[Dict[str, Any]], tools: List[Dict[str,
         "Temperature": 0.1,
         "TopP": 0.9
     }
-    req = models.ChatCompletionsRequest()
-    req.from_json_string(json.dumps(params, ensure_ascii=False))
+
+
+def _response_to_dict(resp: Any) -> Dict[str, Any]:
+    """SDK返回对象可能为generator或对象，统一转换为dict"""
+    if hasattr(resp, 'to_json_string'):
+        return json.loads(resp.to_json_string()) # type: ignore
+    elif isinstance(resp, dict):
+        return resp
+    else:
+        # 兼容generator等
+        return json.loads(json.dumps(resp, default=lambda o: o.__dict__))
+
+
+def call_hunyuan_agent_api(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], tool_choice: str = "auto") -> Dict[str, Any]:
+    """调用腾讯混元 functioncall agent api，返回响应（使用进程内共享的SDK客户端）"""
+    client = get_hunyuan_client()
+
+    # 构造请求参数
+    params = build_agent_params(messages, tools, tool_choice)
     try:
-        resp = client.ChatCompletions(req)
-        # SDK返回对象可能为generator或对象，需兼容
-        if hasattr(resp, 'to_json_string'):
-            resp_dict = json.loads(resp.to_json_string()) # type: ignore
-        elif isinstance(resp, dict):
-            resp_dict = resp
-        else:
-            # 兼容generator等
-            resp_dict = json.loads(json.dumps(resp, default=lambda o: o.__dict__))
-        return resp_dict
+        resp = chat_completions(params, client=client)
+        return _response_to_dict(resp)
+    except Exception as e:
+        logging.error(f"调用混元agent api失败: {e}")
+        return {"error": str(e)}
+
+
+async def acall_hunyuan_agent_api(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]], tool_choice: str = "auto") -> Dict[str, Any]:
+    """call_hunyuan_agent_api的异步版本，通过异步HTTP传输发送请求"""
+    client = get_hunyuan_client()
+    params = build_agent_params(messages, tools, tool_choice)
+    try:
+        resp = await achat_completions(params, client=client)
+        return _response_to_dict(resp)
     except Exception as e:
         logging.error(f"调用混元agent api失败: {e}")
         return {"error": str(e)}
 
 
-def execute_tool_call(tool_call: Dict[str, Any]) -> Dict[str, Any]:
-    """根据agent返回的ToolCall，自动调用本地对应函数并返回结果"""
+# 通过new_item_ref更新物品时从识别结果合并的字段，不覆盖put_in_time
+REF_UPDATE_FIELDS = UPDATABLE_FIELDS + ("detected_at",)
+# 新增物品时必须有值的字段（fridge_items的NOT NULL列）
+ADD_ITEM_REQUIRED_FIELDS = ("name", "image_url")
+
+
+def _validate_item_args(args: Dict[str, Any], new_item_refs: Optional[Dict[str, Dict[str, Any]]]) -> Optional[str]:
+    """检查新增/更新工具的new_item_ref和item_info参数，有问题时返回给模型的错误说明"""
+    ref = args.get("new_item_ref")
+    if ref and ref not in (new_item_refs or {}):
+        return f"未知的识别结果引用编号: {ref}，请使用表格中的new_item_ref"
+    if args.get("item_info") is not None and not isinstance(args.get("item_info"), dict):
+        return "item_info必须是对象"
+    return None
+
+
+def execute_tool_call(
+    tool_call: Dict[str, Any],
+    device_id: Optional[str] = None,
+    new_item_refs: Optional[Dict[str, Dict[str, Any]]] = None,
+    snapshot: Optional[FridgeItemsSnapshot] = None
+) -> Dict[str, Any]:
+    """
+    根据agent返回的ToolCall，自动调用本地对应函数并返回结果
+
+    Args:
+        tool_call: agent返回的ToolCall
+        device_id: 本次处理的设备ID，读取和新增物品时限定在该设备范围内
+        new_item_refs: 识别结果引用编号 -> 识别结果，用于补全只传了new_item_ref的工具调用
+        snapshot: 本次会话的物品列表缓存，get_current_fridge_items从中读取，写操作成功后使其失效
+
+    参数不完整（未知的new_item_ref、新增时缺少必填字段）或写入违反数据库约束时返回{"error": ...}，
+    由模型在下一轮修正，不中断agent循环
+    """
     name = tool_call["Function"]["Name"]
     args = json.loads(tool_call["Function"].get("Arguments", "{}"))
     logging.info("[execute_tool_call] name: %s, args: %s", name, args)
     if name == "get_current_fridge_items":
-        items = get_current_fridge_items()
+        items = snapshot.get() if snapshot is not None else get_current_fridge_items(device_id)
         return {"items": items}  # items已经是字典列表了
     elif name == "get_item_image_by_id":
         item_id = args.get("item_id")
         return {"image_url": get_item_image_by_id(item_id)}
     elif name == "add_fridge_item":
-        info = args.get("item_info")
-        item = add_item_to_db(info)
+        error = _validate_item_args(args, new_item_refs)
+        if error:
+            return {"error": error}
+        info = merge_new_item_ref(args.get("item_info"), args.get("new_item_ref"), new_item_refs)
+        missing = [field for field in ADD_ITEM_REQUIRED_FIELDS if not info.get(field)]
+        if missing:
+            return {"error": f"缺少必填字段 {', '.join(missing)}：请传new_item_ref，或在item_info中提供完整字段"}
+        if device_id and not info.get("device_id"):
+            info["device_id"] = device_id
+        try:
+            item = add_item_to_db(info)
+        except IntegrityError as e:
+            return {"error": f"新增物品失败: {e.orig}"}
+        if snapshot is not None:
+            snapshot.invalidate()
         return {"item_id": item.id}
     elif name == "update_fridge_item":
         item_id = args.get("item_id")
-        info = args.get("item_info")
-        item = update_item_in_db(item_id, info)
+        error = _validate_item_args(args, new_item_refs)
+        if error:
+            return {"error": error}
+        info = merge_new_item_ref(args.get("item_info"), args.get("new_item_ref"), new_item_refs, REF_UPDATE_FIELDS)
+        try:
+            item = update_item_in_db(item_id, info)
+        except IntegrityError as e:
+            return {"error": f"更新物品失败: {e.orig}"}
+        if item and snapshot is not None:
+            snapshot.invalidate()
         return {"item_id": item.id if item else None}
     elif name == "delete_fridge_item":
         item_id = args.get("item_id")
         ok = delete_item_from_db(item_id)
+        if ok and snapshot is not None:
+            snapshot.invalidate()
         return {"success": ok}
     else:
         return {"error": f"Unknown tool: {name}"}
 
 
-def agent_process_and_update(new_items: List[Dict[str, Any]]):
-    """
-    主流程：
-    - 构造messages和tools
-    - 调用agent api
-    - 自动执行tool call并多轮交互
-    - 最终完成数据库自动更新
-    """
-    tools = get_hunyuan_tools_schema()
-    logging.info("[agent_process_and_update] 启动，new_items: %s", json.dumps(new_items, ensure_ascii=False))
-    # 获取数据库中上次冰箱物品信息
-    last_items = get_current_fridge_items()
-    # 说明部分
-    instruction = (
+def build_agent_instruction(item_count: int) -> str:
+    """构造agent对比处理的说明部分"""
+    return (
         "你是FreshTrackAI智能冰箱管理系统的agent。请严格按照如下流程处理：\n\n"
         "**第一步：数据对比分析**\n"
         "1. 对比【数据库中上次冰箱物品信息】和【本次冰箱照片识别结果】\n"
@@ -212,14 +311,301 @@ def agent_process_and_update(new_items: List[Dict[str, Any]]):
         "- ❌ **删除物品**: 如果数据库中的物品在本次识别中消失，调用delete_fridge_item删除\n"
         "- ✅ **无变化**: 如果物品信息完全一致，无需操作\n\n"
         "**重要说明**:\n"
-        "- 必须处理所有15个识别物品，不能遗漏\n"
+        f"- 必须处理所有{item_count}个识别物品，不能遗漏\n"
         "- 优先基于物品名称和分类进行匹配，图片比对为辅助手段\n"
         "- 当无法确定是否为同一物品时，倾向于新增而非忽略\n"
         "- 完成所有操作后提供操作摘要\n\n"
         "请现在开始处理，确保每个识别出的物品都得到妥善处理。"
     )
-    # 组装message
-    messages = [
+
+
+def _extract_agent_message(resp: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """从agent响应中取出回复消息，没有Choices时返回None"""
+    logging.info("[agent_process_and_update] agent api resp: %s", json.dumps(resp, ensure_ascii=False))
+    # 兼容两种响应格式：有Response包装和直接Choices
+    choices = resp.get("Response", {}).get("Choices", [])
+    if not choices:
+        choices = resp.get("Choices", [])
+    if not choices:
+        return None
+    return choices[0]["Message"]
+
+
+def _tool_result_message(tool_call: Dict[str, Any], tool_result: Dict[str, Any]) -> Dict[str, Any]:
+    logging.info("[agent_process_and_update] tool_result: %s", tool_result)
+    return {
+        "Role": "tool",
+        "ToolCallId": tool_call.get("Id", ""),
+        "Content": json.dumps(tool_result, ensure_ascii=False)
+    }
+
+
+def run_agent_loop(
+    messages: List[Dict[str, Any]],
+    tools: List[Dict[str, Any]],
+    device_id: Optional[str] = None,
+    new_item_refs: Optional[Dict[str, Dict[str, Any]]] = None,
+    parallel_tools: Optional[bool] = None,
+    controller: Optional[AgentLoopController] = None,
+    compact_history: Optional[bool] = None
+) -> List[Dict[str, Any]]:
+    """
+    多轮调用agent api并执行tool call，直到agent不再调用工具或达到controller的限制
+
+    parallel_tools为True时同一轮中操作不同物品的tool call并行执行、同一item_id的调用串行执行（见tool_executor），
+    默认读取AGENT_PARALLEL_TOOL_CALLS；controller不提供时按AGENT_MAX_TURNS等环境变量创建；
+    compact_history为True时发送给模型的是压缩后的历史消息（见prompt_encoding.compact_agent_history），
+    返回的messages仍是完整对话，默认读取AGENT_COMPACT_HISTORY；
+    同一次循环内重复的get_current_fridge_items由FridgeItemsSnapshot从内存返回，本次循环写入后才重新读取
+    """
+    parallel_tools = AGENT_PARALLEL_TOOL_CALLS if parallel_tools is None else parallel_tools
+    compact_history = AGENT_COMPACT_HISTORY if compact_history is None else compact_history
+    controller = controller or AgentLoopController()
+    snapshot = FridgeItemsSnapshot(device_id)
+    execute = partial(execute_tool_call, device_id=device_id, new_item_refs=new_item_refs, snapshot=snapshot)
+    controller.start()
+    while controller.should_continue():
+        resp = call_hunyuan_agent_api(compact_agent_history(messages) if compact_history else messages, tools)
+        controller.record_response(resp)
+        msg = _extract_agent_message(resp)
+        if msg is None:
+            controller.finish(STOP_NO_RESPONSE)
+            break
+        messages.append(msg)
+        tool_calls = msg.get("ToolCalls", [])
+        logging.info("[agent_process_and_update] tool_calls: %s", tool_calls)
+        if not tool_calls:
+            controller.finish(STOP_COMPLETED)
+            break
+        # 执行所有tool call
+        if parallel_tools and len(tool_calls) > 1:
+            logging.info("[agent_process_and_update] 并行执行 %d 个tool_call", len(tool_calls))
+            tool_results = execute_tool_calls(tool_calls, execute)
+            messages.extend(_tool_result_message(tool_call, tool_result) for tool_call, tool_result in zip(tool_calls, tool_results))
+        else:
+            for tool_call in tool_calls:
+                logging.info("[agent_process_and_update] 执行tool_call: %s", tool_call)
+                tool_result = execute(tool_call)
+                messages.append(_tool_result_message(tool_call, tool_result))
+        controller.record_tool_calls(tool_calls)
+    logging.info(
+        "[agent_process_and_update] agent循环指标: %s, 物品列表读取 %d 次, 缓存命中 %d 次",
+        controller.metrics(), snapshot.loads, snapshot.hits
+    )
+    return messages
+
+
+async def arun_agent_loop(
+    messages: List[Dict[str, Any]],
+    tools: List[Dict[str, Any]],
+    device_id: Optional[str] = None,
+    new_item_refs: Optional[Dict[str, Dict[str, Any]]] = None,
+    parallel_tools: Optional[bool] = None,
+    controller: Optional[AgentLoopController] = None,
+    compact_history: Optional[bool] = None
+) -> List[Dict[str, Any]]:
+    """
+    run_agent_loop的异步版本，数据库操作放到线程池执行，不阻塞事件循环
+    模型请求以controller的剩余时间为超时，超时后结束循环
+    """
+    parallel_tools = AGENT_PARALLEL_TOOL_CALLS if parallel_tools is None else parallel_tools
+    compact_history = AGENT_COMPACT_HISTORY if compact_history is None else compact_history
+    controller = controller or AgentLoopController()
+    snapshot = FridgeItemsSnapshot(device_id)
+    execute = partial(execute_tool_call, device_id=device_id, new_item_refs=new_item_refs, snapshot=snapshot)
+    controller.start()
+    while controller.should_continue():
+        try:
+            request_messages = compact_agent_history(messages) if compact_history else messages
+            resp = await asyncio.wait_for(acall_hunyuan_agent_api(request_messages, tools), controller.remaining_seconds())
+        except asyncio.TimeoutError:
+            logging.warning("[aagent_process_and_update] agent api请求超过截止时间")
+            controller.finish(STOP_DEADLINE)
+            break
+        controller.record_response(resp)
+        msg = _extract_agent_message(resp)
+        if msg is None:
+            controller.finish(STOP_NO_RESPONSE)
+            break
+        messages.append(msg)
+        tool_calls = msg.get("ToolCalls", [])
+        logging.info("[aagent_process_and_update] tool_calls: %s", tool_calls)
+        if not tool_calls:
+            controller.finish(STOP_COMPLETED)
+            break
+        if parallel_tools and len(tool_calls) > 1:
+            logging.info("[aagent_process_and_update] 并行执行 %d 个tool_call", len(tool_calls))
+            tool_results = await aexecute_tool_calls(tool_calls, execute)
+            messages.extend(_tool_result_message(tool_call, tool_result) for tool_call, tool_result in zip(tool_calls, tool_results))
+        else:
+            for tool_call in tool_calls:
+                logging.info("[aagent_process_and_update] 执行tool_call: %s", tool_call)
+                tool_result = await asyncio.to_thread(execute, tool_call)
+                messages.append(_tool_result_message(tool_call, tool_result))
+        controller.record_tool_calls(tool_calls)
+    logging.info(
+        "[aagent_process_and_update] agent循环指标: %s, 物品列表读取 %d 次, 缓存命中 %d 次",
+        controller.metrics(), snapshot.loads, snapshot.hits
+    )
+    return messages
+
+
+def _infer_device_id(new_items: List[Dict[str, Any]]) -> Optional[str]:
+    """识别结果都来自同一台设备时返回该设备ID"""
+    device_ids = {item.get("device_id") for item in new_items if item.get("device_id")}
+    if len(device_ids) == 1:
+        return device_ids.pop()
+    return None
+
+
+def _require_device_id(device_id: Optional[str], new_items: List[Dict[str, Any]]) -> str:
+    """确定本次对比的设备，无法确定时拒绝处理：否则会读取并删除所有设备的物品"""
+    device_id = device_id or _infer_device_id(new_items)
+    if not device_id:
+        raise ValueError("无法确定设备ID：请传入device_id，或保证识别结果来自同一台设备且包含device_id")
+    return device_id
+
+
+def apply_reconcile_result(result: ReconcileResult) -> Optional[Dict[str, Any]]:
+    """将本地对比得到的新增/更新/删除集合在一个事务中批量写入数据库"""
+    if not (result.to_add or result.to_update or result.to_delete):
+        return None
+    session = SessionLocal()
+    try:
+        applied = apply_fridge_changes(
+            session,
+            adds=[_to_orm_fields(item_info) for item_info in result.to_add],
+            updates=[(item_id, _to_orm_fields(changes)) for item_id, changes in result.to_update],
+            deletes=result.to_delete
+        )
+    finally:
+        session.close()
+    logging.info("[apply_reconcile_result] 批量写入完成: %s", applied)
+    for device_id in applied["device_ids"]:
+        invalidate_device_recommendations(device_id)
+    return applied
+
+
+def agent_process_and_update(
+    new_items: List[Dict[str, Any]],
+    use_local_diff: bool = True,
+    confidence_threshold: Optional[float] = None,
+    device_id: Optional[str] = None,
+    compact_prompt: bool = True,
+    parallel_tools: Optional[bool] = None,
+    controller: Optional[AgentLoopController] = None,
+    compact_history: Optional[bool] = None,
+):
+    """
+    主流程：
+    - 本地规则对比，直接处理高置信度的新增/更新/删除
+    - 只把有歧义的物品交给agent api
+    - 自动执行tool call并多轮交互
+    - 最终完成数据库自动更新
+
+    Args:
+        new_items: 本次识别结果
+        use_local_diff: 是否先使用本地对比引擎，False时全部交给agent
+        confidence_threshold: 本地直接匹配的置信度阈值，默认读取RECONCILE_CONFIDENCE_THRESHOLD
+        device_id: 设备ID，不提供时从new_items中推断；只读取和对比该设备的物品
+        compact_prompt: 是否用紧凑表格编码提示词中的物品数据，False时使用完整JSON
+        parallel_tools: 是否并行执行同一轮中的tool call，默认读取AGENT_PARALLEL_TOOL_CALLS
+        controller: agent循环的轮数/截止时间/token限制，调用结束后可通过controller.metrics()读取本次事件的指标
+        compact_history: 是否压缩每轮发送给模型的历史消息，默认读取AGENT_COMPACT_HISTORY
+
+    Returns:
+        List[Dict]: agent对话消息，本地已处理完全部物品时为空列表
+
+    Raises:
+        ValueError: 未提供device_id且无法从new_items中推断（识别结果缺少device_id或来自多台设备）
+    """
+    tools = get_hunyuan_tools_schema()
+    logging.info("[agent_process_and_update] 启动，new_items: %s", json.dumps(new_items, ensure_ascii=False))
+    device_id = _require_device_id(device_id, new_items)
+    # 获取数据库中该设备上次的冰箱物品信息
+    last_items = get_current_fridge_items(device_id)
+
+    if use_local_diff:
+        result = reconcile_items(last_items, new_items, confidence_threshold=confidence_threshold, device_id=device_id)
+        apply_reconcile_result(result)
+        logging.info("[agent_process_and_update] 本地对比已处理: %s", result.summary())
+        if not result.has_ambiguity:
+            return []
+        # 只把歧义部分交给agent
+        last_items = result.ambiguous_existing
+        new_items = result.ambiguous_new
+
+    messages = build_agent_messages(last_items, new_items, compact=compact_prompt)
+    # 最终结果
+    return run_agent_loop(messages, tools, device_id, build_new_item_refs(new_items), parallel_tools, controller, compact_history)
+
+
+async def aagent_process_and_update(
+    new_items: List[Dict[str, Any]],
+    use_local_diff: bool = True,
+    confidence_threshold: Optional[float] = None,
+    device_id: Optional[str] = None,
+    compact_prompt: bool = True,
+    parallel_tools: Optional[bool] = None,
+    controller: Optional[AgentLoopController] = None,
+    compact_history: Optional[bool] = None,
+):
+    """
+    agent_process_and_update的异步版本
+    模型调用走异步HTTP传输，数据库读写在线程池中执行，单个事件循环可同时处理多台冰箱的事件
+
+    参数和返回值与agent_process_and_update相同
+    """
+    tools = get_hunyuan_tools_schema()
+    logging.info("[aagent_process_and_update] 启动，new_items: %s", json.dumps(new_items, ensure_ascii=False))
+    device_id = _require_device_id(device_id, new_items)
+    last_items = await asyncio.to_thread(get_current_fridge_items, device_id)
+
+    if use_local_diff:
+        result = reconcile_items(last_items, new_items, confidence_threshold=confidence_threshold, device_id=device_id)
+        await asyncio.to_thread(apply_reconcile_result, result)
+        logging.info("[aagent_process_and_update] 本地对比已处理: %s", result.summary())
+        if not result.has_ambiguity:
+            return []
+        last_items = result.ambiguous_existing
+        new_items = result.ambiguous_new
+
+    messages = build_agent_messages(last_items, new_items, compact=compact_prompt)
+    return await arun_agent_loop(messages, tools, device_id, build_new_item_refs(new_items), parallel_tools, controller, compact_history)
+
+
+def build_agent_messages(
+    last_items: List[Dict[str, Any]],
+    new_items: List[Dict[str, Any]],
+    compact: bool = True,
+    token_budget: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    组装agent对话的初始message
+
+    Args:
+        last_items: 数据库中上次冰箱物品
+        new_items: 本次识别结果
+        compact: 是否使用紧凑表格编码（见prompt_encoding）
+        token_budget: 紧凑编码的token预算，默认读取AGENT_PROMPT_TOKEN_BUDGET
+    """
+    instruction = build_agent_instruction(len(new_items))
+    if compact:
+        items_text, stats = encode_reconcile_items(last_items, new_items, token_budget)
+        logging.info("[build_agent_messages] 提示词物品数据token估算: %s", stats)
+        return [
+            {
+                "Role": "user",
+                "Content": (
+                    instruction +
+                    "\n\n**数据格式**: 以下物品数据为表格，第一行是字段名，用|分隔。"
+                    f"字段说明：{build_field_legend()}。"
+                    "新增或更新识别结果中的物品时，在工具参数中传new_item_ref（如n1）即可，无需重复填写item_info中的字段。" +
+                    f"\n\n{items_text}"
+                )
+            }
+        ]
+    return [
         {
             "Role": "user",
             "Content": (
@@ -229,44 +615,11 @@ def agent_process_and_update(new_items: List[Dict[str, Any]]):
             )
         }
     ]
-    while True:
-        resp = call_hunyuan_agent_api(messages, tools)
-        logging.info("[agent_process_and_update] agent api resp: %s", json.dumps(resp, ensure_ascii=False))
-        # 兼容两种响应格式：有Response包装和直接Choices
-        choices = resp.get("Response", {}).get("Choices", [])
-        if not choices:
-            choices = resp.get("Choices", [])
-        if not choices:
-            break
-        msg = choices[0]["Message"]
-        messages.append(msg)
-        tool_calls = msg.get("ToolCalls", [])
-        logging.info("[agent_process_and_update] tool_calls: %s", tool_calls)
-        if not tool_calls:
-            break
-        # 执行所有tool call
-        for tool_call in tool_calls:
-            logging.info("[agent_process_and_update] 执行tool_call: %s", tool_call)
-            tool_result = execute_tool_call(tool_call)
-            logging.info("[agent_process_and_update] tool_result: %s", tool_result)
-            messages.append({
-                "Role": "tool",
-                "ToolCallId": tool_call.get("Id", ""),
-                "Content": json.dumps(tool_result, ensure_ascii=False)
-            })
-    # 最终结果
-    return messages
 
 
-def add_item_to_db(item_info: Dict[str, Any]):
-    logging.info("[add_item_to_db] item_info: %s", item_info)
-    # 只保留ORM支持的字段，丢弃 quantity、estimated_size、fridge_closed_time
-    orm_fields = {
-        'name', 'category', 'subcategory', 'brand', 'confidence', 'image_url', 'position',
-        'item_amount_desc', 'freshness', 'expiry_estimate', 'additional_info', 'detected_at',
-        'device_id', 'put_in_time'
-    }
-    filtered_info = {k: v for k, v in item_info.items() if k in orm_fields}
+def _to_orm_fields(item_info: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留ORM支持的字段（丢弃 quantity、estimated_size、fridge_closed_time），并转换字段类型"""
+    filtered_info = {k: v for k, v in item_info.items() if k in FRIDGE_ITEM_FIELDS}
     # 类型处理：position/additional_info 必须为 dict
     for key in ['position', 'additional_info']:
         if key in filtered_info and not isinstance(filtered_info[key], dict):
@@ -274,10 +627,18 @@ def add_item_to_db(item_info: Dict[str, Any]):
                 filtered_info[key] = json.loads(filtered_info[key])
             except Exception:
                 filtered_info[key] = None
+    parse_time_fields(filtered_info)
+    return filtered_info
+
+
+def add_item_to_db(item_info: Dict[str, Any]):
+    logging.info("[add_item_to_db] item_info: %s", item_info)
+    filtered_info = _to_orm_fields(item_info)
     session = SessionLocal()
     try:
         item = add_fridge_item(session, item_data=filtered_info)
         logging.info("[add_item_to_db] 新增物品id: %s", getattr(item, 'id', None))
+        invalidate_device_recommendations(filtered_info.get('device_id'))
         return item
     except Exception as e:
         logging.error("[add_item_to_db] 插入异常: %s", e)
@@ -294,10 +655,17 @@ def update_item_in_db(item_id: int, item_info: Dict[str, Any]):
         item = session.query(FridgeItem).filter_by(id=item_id).first()
         if not item:
             return None
+        item_info = dict(item_info)
+        parse_time_fields(item_info)
+        previous_device_id = item.device_id
         for k, v in item_info.items():
             setattr(item, k, v)
+        session.flush()
+        refresh_device_snapshots(session, [previous_device_id, item.device_id])
         session.commit()
         session.refresh(item)
+        for device_id in {previous_device_id, item.device_id}:
+            invalidate_device_recommendations(device_id)
         return item
     finally:
         session.close()
@@ -305,9 +673,14 @@ def update_item_in_db(item_id: int, item_info: Dict[str, Any]):
 
 def delete_item_from_db(item_id: int):
     """删除数据库中的物品"""
+    from db import FridgeItem
     session = SessionLocal()
     try:
-        return delete_item(session, item_id)
+        device_id = session.query(FridgeItem.device_id).filter_by(id=item_id).scalar()
+        deleted = delete_item(session, item_id)
+        if deleted:
+            invalidate_device_recommendations(device_id)
+        return deleted
     finally:
         session.close()
 
@@ -351,7 +724,7 @@ if __name__ == "__main__":
     for item in new_items_json:
         item["fridge_closed_time"] = fridge_closed_time
 
-    # 调用agent自动处理
-    result = agent_process_and_update(new_items_json)
+    # 调用agent自动处理（只对比该设备的物品）
+    result = agent_process_and_update(new_items_json, device_id="fridge_001")
     print("\nAgent多轮处理结果:")
     print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -1,9 +1,16 @@
 from dotenv import load_dotenv
 load_dotenv()
-from typing import Optional
-from sqlalchemy import create_engine, Column, Integer, String, Numeric, Text, JSON, TIMESTAMP
+from typing import Optional, List, Tuple, Dict, Any
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, Column, Integer, String, Numeric, Text, JSON, TIMESTAMP, Index, func, insert, update, delete, select, event, inspect
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
+from recommendation_cache import compute_inventory_fingerprint
 import os
 
 Base = declarative_base()
@@ -25,21 +32,151 @@ class FridgeItem(Base):
     detected_at = Column(TIMESTAMP(timezone=True))
     device_id = Column(String(100))
     put_in_time = Column(TIMESTAMP(timezone=True))
+    # 过期提醒任务上次计算的新鲜度分类，以及下一次需要重新计算的时间
+    # 写入put_in_time/freshness时next_transition_at置为当前时间，由提醒任务重新计算
+    freshness_bucket = Column(String(20))
+    next_transition_at = Column(TIMESTAMP(timezone=True), index=True)
+
+    # 所有读路径都按设备过滤，复合索引让单设备查询的代价不随总行数增长
+    __table_args__ = (
+        Index('ix_fridge_items_device_put_in_time', 'device_id', 'put_in_time'),
+        Index('ix_fridge_items_device_category', 'device_id', 'category'),
+    )
+
+
+# 影响新鲜度分类的字段
+FRESHNESS_FIELDS = ('put_in_time', 'freshness')
+
+
+@event.listens_for(FridgeItem, 'before_insert')
+def _mark_new_item_for_freshness(mapper, connection, target):
+    target.next_transition_at = datetime.now(timezone.utc)
+
+
+@event.listens_for(FridgeItem, 'before_update')
+def _mark_changed_item_for_freshness(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if any(attrs[field].history.has_changes() for field in FRESHNESS_FIELDS):
+        target.next_transition_at = datetime.now(timezone.utc)
+
+
+class FridgeAlert(Base):
+    """过期提醒，由expiry_alerts任务在食材新鲜度分类变化时写入"""
+    __tablename__ = 'fridge_alerts'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String(100))
+    item_id = Column(Integer)
+    item_name = Column(String(100))
+    category = Column(String(50))
+    bucket = Column(String(20), nullable=False)  # expiring_soon / needs_attention / expired
+    previous_bucket = Column(String(20))
+    days_in_fridge = Column(Integer)
+    created_at = Column(TIMESTAMP(timezone=True))
+    delivered_at = Column(TIMESTAMP(timezone=True))  # 推送到手机端后由消费方填写
+
+    __table_args__ = (
+        Index('ix_fridge_alerts_device_created_at', 'device_id', 'created_at'),
+    )
+
+
+class CacheEntry(Base):
+    """结果缓存（识别结果、菜谱推荐等），cache_key带有"namespace:"前缀，各缓存按前缀范围计数和淘汰"""
+    __tablename__ = 'cache_entries'
+    cache_key = Column(String(255), primary_key=True)
+    value = Column(Text, nullable=False)  # 缓存内容JSON
+    expires_at = Column(TIMESTAMP(timezone=True))
+    last_access = Column(TIMESTAMP(timezone=True), index=True)
+
+
+class PinnedCacheEntry(Base):
+    """不过期、不参与LRU淘汰的缓存条目（推荐缓存的失效代数等）"""
+    __tablename__ = 'cache_pinned_entries'
+    cache_key = Column(String(255), primary_key=True)
+    value = Column(Text, nullable=False)
+
+
+class DeviceInventorySnapshot(Base):
+    """每台设备的库存快照，随fridge_items写入在同一事务中刷新，读取时按主键一次查询"""
+    __tablename__ = 'device_inventory_snapshots'
+    device_id = Column(String(100), primary_key=True)
+    item_count = Column(Integer, nullable=False, default=0)
+    category_counts = Column(JSON)
+    freshness_counts = Column(JSON)
+    inventory_fingerprint = Column(String(64))  # recommendation_cache.compute_inventory_fingerprint
+    updated_at = Column(TIMESTAMP(timezone=True))
+
+
+class DeviceImageState(Base):
+    """每台设备最近一次完成识别的图片感知哈希，用于判断冰箱内容是否变化"""
+    __tablename__ = 'device_image_states'
+    device_id = Column(String(100), primary_key=True)
+    image_hash = Column(String(64), nullable=False)
+    image_url = Column(Text)
+    updated_at = Column(TIMESTAMP(timezone=True))
+    # 上次识别之后连续跳过识别的开关门事件数
+    skipped_events = Column(Integer, default=0)
 
 # 数据库连接配置
 DATABASE_URL = os.getenv('DATABASE_URL')
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is required")
 
-engine = create_engine(DATABASE_URL, echo=True)
+# 连接池和日志配置
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+# 只在调试时打开SQL日志：true输出语句，debug额外输出结果行
+DB_ECHO = os.getenv('DB_ECHO', 'false').lower()
+# 批量INSERT时每条语句包含的行数
+DB_INSERTMANYVALUES_PAGE_SIZE = int(os.getenv('DB_INSERTMANYVALUES_PAGE_SIZE', '1000'))
+
+
+def build_engine_options(database_url: str) -> Dict[str, Any]:
+    """
+    根据环境变量和数据库类型生成create_engine参数
+    
+    Args:
+        database_url: 数据库连接URL
+        
+    Returns:
+        Dict: create_engine的关键字参数
+    """
+    url = make_url(database_url)
+    options: Dict[str, Any] = {
+        'echo': 'debug' if DB_ECHO == 'debug' else DB_ECHO in ('1', 'true', 'yes'),
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'insertmanyvalues_page_size': DB_INSERTMANYVALUES_PAGE_SIZE,
+    }
+    if url.get_backend_name() == 'sqlite':
+        # SQLite使用SQLAlchemy默认的连接池，不设置连接数
+        return options
+    options.update({
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+    })
+    if url.get_backend_name() == 'postgresql' and url.get_driver_name() == 'psycopg2':
+        # UPDATE/DELETE的executemany也合并为批量执行
+        options['executemany_mode'] = 'values_plus_batch'
+    return options
+
+
+engine = create_engine(DATABASE_URL, **build_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine)
 
 def create_tables():
+    from migrations import run_migrations
     Base.metadata.create_all(engine)
+    run_migrations(engine)
 
 def add_fridge_item(session, item_data: dict):
     item = FridgeItem(**item_data)
     session.add(item)
+    session.flush()
+    refresh_device_snapshots(session, [item.device_id])
     session.commit()
     session.refresh(item)
     return item
@@ -49,7 +186,12 @@ def get_all_items(session):
     return session.query(FridgeItem).all()
 
 def get_items_by_device(session, device_id: str):
-    return session.query(FridgeItem).filter(FridgeItem.device_id == device_id).all()
+    return (
+        session.query(FridgeItem)
+        .filter(FridgeItem.device_id == device_id)
+        .order_by(FridgeItem.put_in_time)
+        .all()
+    )
 
 def get_item_by_id(session, item_id: int):
     return session.query(FridgeItem).filter(FridgeItem.id == item_id).first()
@@ -57,89 +199,343 @@ def get_item_by_id(session, item_id: int):
 def delete_item(session, item_id: int):
     item = get_item_by_id(session, item_id)
     if item:
+        device_id = item.device_id
         session.delete(item)
+        session.flush()
+        refresh_device_snapshots(session, [device_id])
         session.commit()
         return True
     return False
 
 
-def get_items_for_recommendation(session, device_id: Optional[str] = None):
+def parse_time_fields(item_info: Dict[str, Any]):
+    """将ISO格式的时间字符串转换为datetime，兼容不会自动解析字符串的数据库驱动"""
+    for key in ['detected_at', 'put_in_time']:
+        value = item_info.get(key)
+        if isinstance(value, str):
+            try:
+                item_info[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            except ValueError:
+                item_info[key] = None
+
+
+# FridgeItem中可以写入的字段（id由数据库生成）
+FRIDGE_ITEM_FIELDS = (
+    'name', 'category', 'subcategory', 'brand', 'confidence', 'image_url', 'position',
+    'item_amount_desc', 'freshness', 'expiry_estimate', 'additional_info', 'detected_at',
+    'device_id', 'put_in_time'
+)
+
+
+def normalize_fridge_changes(
+    adds: List[Dict[str, Any]],
+    updates: List[Tuple[int, Dict[str, Any]]],
+    deletes: List[int]
+):
+    """
+    整理为批量INSERT/UPDATE所需的参数格式：新增行补齐字段，更新行带上主键
+    批量语句不会触发mapper事件，这里同样把新增和新鲜度字段变化的行标记为待重新计算
+    """
+    now = datetime.now(timezone.utc)
+    rows_to_add = [
+        {**{field: item.get(field) for field in FRIDGE_ITEM_FIELDS}, "next_transition_at": now}
+        for item in adds
+    ]
+    rows_to_update = []
+    for item_id, changes in updates:
+        if not changes:
+            continue
+        row = {"id": item_id, **changes}
+        if any(field in changes for field in FRESHNESS_FIELDS):
+            row["next_transition_at"] = now
+        rows_to_update.append(row)
+    return rows_to_add, rows_to_update, list(deletes)
+
+
+def apply_fridge_changes(
+    session,
+    adds: List[Dict[str, Any]],
+    updates: List[Tuple[int, Dict[str, Any]]],
+    deletes: List[int]
+) -> Dict[str, Any]:
+    """
+    在一个事务中批量写入一次开关门事件的全部变更，任何一步失败都整体回滚
+    
+    Args:
+        session: 数据库会话
+        adds: 新增物品，只包含FRIDGE_ITEM_FIELDS中的字段
+        updates: [(物品id, 变化的字段)]
+        deletes: 要删除的物品id
+        
+    Returns:
+        Dict: added_ids（与adds顺序一致）、实际更新/删除的行数updated和deleted，以及受影响的device_ids
+    """
+    adds, updates, deletes = normalize_fridge_changes(adds, updates, deletes)
+    
+    try:
+        device_ids = {item["device_id"] for item in adds if item["device_id"]}
+        device_ids.update(row["device_id"] for row in updates if row.get("device_id"))
+        touched_ids = [row["id"] for row in updates] + deletes
+        if touched_ids:
+            # 锁定本次涉及的行；已被并发删除的物品不再更新，否则ORM批量更新会抛出StaleDataError
+            existing = dict(session.execute(
+                select(FridgeItem.id, FridgeItem.device_id).where(FridgeItem.id.in_(touched_ids)).with_for_update()
+            ).all())
+            device_ids.update(device_id for device_id in existing.values() if device_id)
+            updates = [row for row in updates if row["id"] in existing]
+        
+        added_ids = []
+        if adds:
+            added_ids = list(session.scalars(
+                insert(FridgeItem).returning(FridgeItem.id, sort_by_parameter_order=True),
+                adds
+            ))
+        if updates:
+            # ORM按主键批量更新，相同字段集合的行合并为一次executemany
+            session.execute(update(FridgeItem), updates)
+        deleted = 0
+        if deletes:
+            deleted = session.execute(
+                delete(FridgeItem).where(FridgeItem.id.in_(deletes)),
+                execution_options={"synchronize_session": False}
+            ).rowcount
+        refresh_device_snapshots(session, device_ids)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    
+    return {
+        "added_ids": added_ids,
+        "updated": len(updates),
+        "deleted": deleted,
+        "device_ids": sorted(device_ids)
+    }
+
+
+def touch_items_detected_at(session, device_id: str, detected_at):
+    """只刷新设备所有物品的detected_at，用于冰箱内容未变化的开关门事件"""
+    count = session.query(FridgeItem).filter(FridgeItem.device_id == device_id).update(
+        {FridgeItem.detected_at: detected_at}, synchronize_session=False
+    )
+    session.commit()
+    return count
+
+
+def get_device_image_state(session, device_id: str):
+    return session.get(DeviceImageState, device_id)
+
+
+def record_skipped_image_event(session, device_id: str):
+    """图片无变化、跳过识别时累加设备的连续跳过次数"""
+    session.query(DeviceImageState).filter(DeviceImageState.device_id == device_id).update(
+        {DeviceImageState.skipped_events: func.coalesce(DeviceImageState.skipped_events, 0) + 1},
+        synchronize_session=False
+    )
+    session.commit()
+
+
+def save_device_image_state(session, device_id: str, image_hash: str, image_url: Optional[str] = None):
+    """完成一次识别后保存图片哈希，并清零连续跳过次数"""
+    state = DeviceImageState(
+        device_id=device_id,
+        image_hash=image_hash,
+        image_url=image_url,
+        updated_at=datetime.now(timezone.utc),
+        skipped_events=0
+    )
+    state = session.merge(state)
+    session.commit()
+    return state
+
+
+# 菜谱推荐用到的列，position和additional_info两个JSON列可以按需省略
+RECOMMENDATION_COLUMNS = (
+    FridgeItem.id, FridgeItem.name, FridgeItem.category, FridgeItem.subcategory, FridgeItem.brand,
+    FridgeItem.item_amount_desc, FridgeItem.freshness, FridgeItem.expiry_estimate,
+    FridgeItem.put_in_time, FridgeItem.detected_at, FridgeItem.confidence,
+)
+RECOMMENDATION_JSON_COLUMNS = (FridgeItem.additional_info, FridgeItem.position)
+
+
+def recommendation_items_statement(device_id: Optional[str] = None, include_json: bool = True):
+    """
+    查询推荐所需食材的语句，同步和异步数据访问层共用
+    只选择推荐用到的列，结果是普通的行元组，不构造ORM对象、不进入identity map
+    """
+    columns = RECOMMENDATION_COLUMNS + (RECOMMENDATION_JSON_COLUMNS if include_json else ())
+    stmt = select(*columns)
+    if device_id:
+        stmt = stmt.where(FridgeItem.device_id == device_id).order_by(FridgeItem.put_in_time)
+    return stmt
+
+
+def item_to_recommendation_dict(item, include_json: bool = True) -> Dict[str, Any]:
+    """转换为推荐系统所需的格式，item可以是FridgeItem或recommendation_items_statement的结果行"""
+    converted_item = {
+        "id": item.id,
+        "name": item.name,
+        "category": item.category or "未分类",
+        "subcategory": item.subcategory,
+        "brand": item.brand,
+        "item_amount_desc": item.item_amount_desc or "未知数量",
+        "freshness": item.freshness or "good",
+        "expiry_estimate": item.expiry_estimate or "未知",
+        "put_in_time": item.put_in_time.isoformat() if item.put_in_time else None,
+        "detected_at": item.detected_at.isoformat() if item.detected_at else None,
+        "confidence": float(item.confidence) if item.confidence else 0.0
+    }
+    if include_json:
+        converted_item["additional_info"] = item.additional_info or {}
+        converted_item["position"] = item.position or {}
+    return converted_item
+
+
+def get_items_for_recommendation(session, device_id: Optional[str] = None, include_json: bool = True):
     """
     获取用于菜谱推荐的食材列表，包含转换为推荐所需格式
     
     Args:
         session: 数据库会话
         device_id: 可选的设备ID筛选
+        include_json: 是否读取position和additional_info，菜谱推荐不需要时传False
         
     Returns:
         List[Dict]: 转换为推荐系统所需格式的食材列表
     """
-    if device_id:
-        items = session.query(FridgeItem).filter(FridgeItem.device_id == device_id).all()
-    else:
-        items = session.query(FridgeItem).all()
+    rows = session.execute(recommendation_items_statement(device_id, include_json)).all()
+    return [item_to_recommendation_dict(row, include_json) for row in rows]
+
+
+def summary_count_statements(device_id: Optional[str] = None):
+    """
+    冰箱摘要的分类统计和新鲜度统计语句
+    与get_items_for_recommendation一致：空值和空字符串都按默认值统计
     
-    # 转换为推荐系统所需的格式
-    converted_items = []
-    for item in items:
-        converted_item = {
-            "id": item.id,
-            "name": item.name,
-            "category": item.category or "未分类",
-            "subcategory": item.subcategory,
-            "brand": item.brand,
-            "item_amount_desc": item.item_amount_desc or "未知数量",
-            "freshness": item.freshness or "good",
-            "expiry_estimate": item.expiry_estimate or "未知",
-            "put_in_time": item.put_in_time.isoformat() if item.put_in_time else None,
-            "detected_at": item.detected_at.isoformat() if item.detected_at else None,
-            "additional_info": item.additional_info or {},
-            "position": item.position or {},
-            "confidence": float(item.confidence) if item.confidence else 0.0
+    Returns:
+        Tuple: (分类统计语句, 新鲜度统计语句)
+    """
+    def grouped_count(column, default):
+        key = func.coalesce(func.nullif(column, ''), default)
+        stmt = select(key, func.count(FridgeItem.id))
+        if device_id:
+            stmt = stmt.where(FridgeItem.device_id == device_id)
+        return stmt.group_by(key)
+
+    return grouped_count(FridgeItem.category, "未分类"), grouped_count(FridgeItem.freshness, "good")
+
+
+def build_fridge_summary(category_rows, freshness_rows) -> Dict[str, Any]:
+    """用GROUP BY的结果行组装冰箱摘要"""
+    categories = dict(category_rows)
+    freshness_counts = dict(freshness_rows)
+    return {
+        "total_items": sum(categories.values()),
+        "categories": categories,
+        "freshness_stats": {
+            freshness: freshness_counts.get(freshness, 0)
+            for freshness in ("good", "fair", "poor")
         }
-        converted_items.append(converted_item)
+    }
+
+
+def _lock_device_snapshot(session, device_id: str):
+    """
+    确保设备快照行存在并对其加行锁（SELECT ... FOR UPDATE）
+    同一设备的并发写入在这里排队：先加锁的事务提交后，后一个事务才重新统计，
+    READ COMMITTED隔离级别下能看到前一个事务已提交的写入，不会用过期的统计覆盖快照
+    """
+    dialect = session.get_bind().dialect.name
+    values = {"device_id": device_id, "item_count": 0}
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        session.execute(
+            dialect_insert(DeviceInventorySnapshot).values(**values).on_conflict_do_nothing(index_elements=["device_id"])
+        )
+    elif session.get(DeviceInventorySnapshot, device_id) is None:
+        try:
+            with session.begin_nested():
+                session.add(DeviceInventorySnapshot(**values))
+        except IntegrityError:
+            # 其他事务同时插入了该设备的快照行
+            pass
+    return session.execute(
+        select(DeviceInventorySnapshot)
+        .where(DeviceInventorySnapshot.device_id == device_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalar_one()
+
+
+def refresh_device_snapshots(session, device_ids):
+    """
+    重新计算设备的库存快照，在写入fridge_items的同一事务中、提交前调用
+    先锁定快照行再统计，多个设备按device_id顺序加锁，避免并发事务互相等待；
+    统计和指纹都由该设备物品的一次索引查询得出
     
-    return converted_items
+    Args:
+        session: 已经flush了本次写入的数据库会话
+        device_ids: 受影响的设备ID
+    """
+    now = datetime.now(timezone.utc)
+    for device_id in sorted({device_id for device_id in device_ids if device_id}):
+        snapshot = _lock_device_snapshot(session, device_id)
+        items = get_items_for_recommendation(session, device_id, include_json=False)
+        # 与summary_count_statements一致：空值按"未分类"/"good"统计
+        summary = build_fridge_summary(
+            Counter(item["category"] for item in items).items(),
+            Counter(item["freshness"] for item in items).items()
+        )
+        snapshot.item_count = summary["total_items"]
+        snapshot.category_counts = summary["categories"]
+        snapshot.freshness_counts = summary["freshness_stats"]
+        snapshot.inventory_fingerprint = compute_inventory_fingerprint(items)
+        snapshot.updated_at = now
+    session.flush()
 
 
-def get_current_fridge_summary(session, device_id: Optional[str] = None):
+def get_device_snapshot(session, device_id: str):
+    return session.get(DeviceInventorySnapshot, device_id)
+
+
+def snapshot_to_summary(snapshot) -> Dict[str, Any]:
+    """库存快照转换为get_current_fridge_summary的统计格式"""
+    return {
+        "total_items": snapshot.item_count,
+        "categories": dict(snapshot.category_counts or {}),
+        "freshness_stats": dict(snapshot.freshness_counts or {"good": 0, "fair": 0, "poor": 0})
+    }
+
+
+def get_current_fridge_summary(session, device_id: Optional[str] = None, include_items: bool = True):
     """
     获取当前冰箱状态摘要
+    指定设备时直接读取库存快照（一次主键查询）；没有快照或不指定设备时，
+    分类和新鲜度统计在数据库中用GROUP BY完成
     
     Args:
         session: 数据库会话  
         device_id: 可选的设备ID筛选
+        include_items: 是否附带完整的食材列表，False时只返回统计信息
         
     Returns:
         Dict: 冰箱状态摘要
     """
-    items = get_items_for_recommendation(session, device_id)
-    
-    # 统计信息
-    total_items = len(items)
-    categories = {}
-    freshness_stats = {"good": 0, "fair": 0, "poor": 0}
-    
-    for item in items:
-        # 统计分类
-        category = item.get("category", "未分类")
-        categories[category] = categories.get(category, 0) + 1
-        
-        # 统计新鲜度
-        freshness = item.get("freshness", "good")
-        if freshness in freshness_stats:
-            freshness_stats[freshness] += 1
-    
-    return {
-        "total_items": total_items,
-        "categories": categories,
-        "freshness_stats": freshness_stats,
-        "items": items
-    }
+    snapshot = get_device_snapshot(session, device_id) if device_id else None
+    if snapshot is not None:
+        summary = snapshot_to_summary(snapshot)
+    else:
+        category_stmt, freshness_stmt = summary_count_statements(device_id)
+        summary = build_fridge_summary(
+            session.execute(category_stmt).all(),
+            session.execute(freshness_stmt).all()
+        )
+    if include_items:
+        summary["items"] = get_items_for_recommendation(session, device_id)
+    return summary
 
 
 if __name__ == "__main__":
-    import datetime
     print("1. 创建表...")
     create_tables()
     session = SessionLocal()
@@ -157,9 +553,9 @@ if __name__ == "__main__":
             'freshness': 'good',
             'expiry_estimate': '7天',
             'additional_info': {'color': '白色'},
-            'detected_at': datetime.datetime.now(datetime.timezone.utc),
+            'detected_at': datetime.now(timezone.utc),
             'device_id': 'test_device',
-            'put_in_time': datetime.datetime.now(datetime.timezone.utc)
+            'put_in_time': datetime.now(timezone.utc)
         }
         item = add_fridge_item(session, item_data)
         print(f"插入成功，id={item.id}")
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 全量过期提醒任务
+按next_transition_at索引只取出新鲜度分类可能已经变化的食材（新写入的、或到达下一个分界点的），
+用freshness_classifier批量重新分类，分类变得更紧急时写入fridge_alerts表（并可推送到外部队列）
+任务代价与变化的食材数量成正比，而不是与食材总数成正比
+
+定时执行示例: python expiry_alerts.py
+"""
+
+import os
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from sqlalchemy import select, update, insert
+from db import SessionLocal, FridgeItem, FridgeAlert
+from freshness_classifier import BUCKET_NAMES, FRESH, classify_freshness, next_transition_times, to_datetime64
+
+logger = logging.getLogger(__name__)
+
+# 每批重新计算的食材数量
+EXPIRY_ALERT_BATCH_SIZE = int(os.getenv("EXPIRY_ALERT_BATCH_SIZE", "1000"))
+
+AlertSink = Callable[[List[Dict[str, Any]]], None]
+
+
+def _to_datetime(value: np.datetime64) -> Optional[datetime]:
+    if np.isnat(value):
+        return None
+    return value.astype("datetime64[us]").item().replace(tzinfo=timezone.utc)
+
+
+def _evaluate_batch(session, rows, now: datetime) -> List[Dict[str, Any]]:
+    """重新分类一批食材，更新freshness_bucket/next_transition_at，返回需要提醒的记录"""
+    put_in_times = to_datetime64(row.put_in_time for row in rows)
+    freshness = np.array([row.freshness for row in rows], dtype=object)
+    buckets, days = classify_freshness(put_in_times, freshness, now)
+    transitions = next_transition_times(put_in_times, now)
+
+    updates = []
+    alerts = []
+    for index, row in enumerate(rows):
+        bucket = int(buckets[index])
+        bucket_name = BUCKET_NAMES[bucket]
+        updates.append({
+            "id": row.id,
+            "freshness_bucket": bucket_name,
+            "next_transition_at": _to_datetime(transitions[index]),
+        })
+        previous = BUCKET_NAMES.index(row.freshness_bucket) if row.freshness_bucket in BUCKET_NAMES else FRESH
+        # 只在分类变得更紧急时提醒，避免同一状态重复提醒
+        if bucket > previous:
+            alerts.append({
+                "device_id": row.device_id,
+                "item_id": row.id,
+                "item_name": row.name,
+                "category": row.category,
+                "bucket": bucket_name,
+                "previous_bucket": row.freshness_bucket,
+                "days_in_fridge": int(days[index]) if days[index] >= 0 else None,
+                "created_at": now,
+            })
+
+    session.execute(update(FridgeItem), updates)
+    if alerts:
+        session.execute(insert(FridgeAlert), alerts)
+    return alerts
+
+
+def run_expiry_alert_job(
+    session,
+    now: Optional[datetime] = None,
+    batch_size: Optional[int] = None,
+    sink: Optional[AlertSink] = None
+) -> Dict[str, Any]:
+    """
+    执行一次过期提醒任务
+
+    Args:
+        session: 数据库会话
+        now: 计算时间，默认为当前UTC时间
+        batch_size: 每批处理的食材数，默认读取EXPIRY_ALERT_BATCH_SIZE
+        sink: 可选的提醒推送函数，每批提交后以提醒列表调用（例如写入消息队列）
+
+    Returns:
+        Dict: 任务统计（evaluated、alerts、alerts_by_bucket、batches、elapsed_seconds）
+    """
+    now = now or datetime.now(timezone.utc)
+    batch_size = batch_size or EXPIRY_ALERT_BATCH_SIZE
+    start_time = time.time()
+    stats = {
+        "evaluated": 0,
+        "alerts": 0,
+        "alerts_by_bucket": {name: 0 for name in BUCKET_NAMES if name != "fresh"},
+        "batches": 0,
+    }
+
+    stmt = (
+        select(
+            FridgeItem.id, FridgeItem.device_id, FridgeItem.name, FridgeItem.category,
+            FridgeItem.put_in_time, FridgeItem.freshness, FridgeItem.freshness_bucket
+        )
+        .where(FridgeItem.next_transition_at <= now)
+        .order_by(FridgeItem.next_transition_at, FridgeItem.id)
+        .limit(batch_size)
+        # 锁定本批食材，避免并发删除使批量更新失败；被其他事务锁定的行留到下次任务处理
+        .with_for_update(skip_locked=True)
+    )
+    while True:
+        rows = session.execute(stmt).all()
+        if not rows:
+            break
+        try:
+            alerts = _evaluate_batch(session, rows, now)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        stats["batches"] += 1
+        stats["evaluated"] += len(rows)
+        stats["alerts"] += len(alerts)
+        for alert in alerts:
+            stats["alerts_by_bucket"][alert["bucket"]] += 1
+        if alerts and sink is not None:
+            try:
+                sink(alerts)
+            except Exception as e:
+                logger.error(f"推送过期提醒失败（已写入fridge_alerts表）: {e}")
+        # 处理过的行next_transition_at已经晚于now或为空，不会被再次取出
+        if len(rows) < batch_size:
+            break
+
+    stats["elapsed_seconds"] = round(time.time() - start_time, 3)
+    logger.info(f"过期提醒任务完成: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        print(run_expiry_alert_job(session))
+    finally:
+        session.close()
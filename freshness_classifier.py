@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 批量新鲜度分类
+在NumPy数组上一次性完成整批食材（可跨多台设备）的新鲜度分类，用于全量过期提醒等后台任务
+规则与MealRecommendationAgent.analyze_food_freshness一致（阈值见freshness_rules）：
+- expired: 放入 >= EXPIRED_DAYS 天或 freshness 为 poor
+- needs_attention: 放入 >= NEEDS_ATTENTION_DAYS 天或 freshness 为 fair
+- expiring_soon: 放入 >= EXPIRING_SOON_DAYS 天
+- fresh: 其余情况；没有放入时间(NaT)的食材同样视为fresh
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from freshness_rules import EXPIRING_SOON_DAYS, NEEDS_ATTENTION_DAYS, EXPIRED_DAYS, TRANSITION_DAYS
+
+# 分类编码，数值越大越紧急
+FRESH = 0
+EXPIRING_SOON = 1
+NEEDS_ATTENTION = 2
+EXPIRED = 3
+
+BUCKET_NAMES = ("fresh", "expiring_soon", "needs_attention", "expired")
+
+# 分类编码 -> analyze_food_freshness返回结果中的键
+CATEGORIZED_KEYS = ("fresh_items", "expiring_soon", "needs_attention", "expired_items")
+
+_ONE_DAY = np.timedelta64(1, "D")
+_TRANSITION_OFFSETS = np.array(TRANSITION_DAYS, dtype="timedelta64[D]")
+
+
+def _to_utc_naive(value: Any) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_datetime64(values: Iterable[Any]) -> np.ndarray:
+    """
+    将datetime、ISO字符串或None转换为UTC的datetime64[us]数组，None转换为NaT
+    不带时区的datetime按UTC处理
+
+    Args:
+        values: 时间值序列
+
+    Returns:
+        np.ndarray: datetime64[us]数组
+    """
+    return np.array(
+        [np.datetime64(dt, "us") if dt is not None else np.datetime64("NaT", "us") for dt in map(_to_utc_naive, values)],
+        dtype="datetime64[us]"
+    )
+
+
+def _now64(now: Optional[datetime]) -> np.datetime64:
+    return np.datetime64(_to_utc_naive(now or datetime.now(timezone.utc)), "us")
+
+
+def classify_freshness(
+    put_in_times: np.ndarray,
+    freshness: Optional[np.ndarray] = None,
+    now: Optional[datetime] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    向量化分类
+
+    Args:
+        put_in_times: datetime64数组（UTC），NaT表示没有放入时间
+        freshness: 与put_in_times等长的新鲜度字符串数组(good/fair/poor)，可选
+        now: 当前时间，默认为当前UTC时间
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (分类编码int8数组, 放入天数int64数组，NaT对应-1)
+    """
+    put_in_times = np.asarray(put_in_times, dtype="datetime64[us]")
+    missing = np.isnat(put_in_times)
+    # NaT先按0处理，避免整除产生无效值警告
+    elapsed = np.where(missing, np.timedelta64(0, "us"), _now64(now) - put_in_times)
+    # 与timedelta.days一致，向下取整
+    days = np.where(missing, -1, elapsed // _ONE_DAY).astype(np.int64)
+
+    if freshness is None:
+        poor = fair = np.zeros(put_in_times.shape, dtype=bool)
+    else:
+        freshness = np.asarray(freshness, dtype=object)
+        poor = freshness == "poor"
+        fair = freshness == "fair"
+
+    buckets = np.select(
+        [
+            missing,
+            (days >= EXPIRED_DAYS) | poor,
+            (days >= NEEDS_ATTENTION_DAYS) | fair,
+            days >= EXPIRING_SOON_DAYS,
+        ],
+        [FRESH, EXPIRED, NEEDS_ATTENTION, EXPIRING_SOON],
+        default=FRESH
+    ).astype(np.int8)
+    return buckets, days
+
+
+def next_transition_times(put_in_times: np.ndarray, now: Optional[datetime] = None) -> np.ndarray:
+    """
+    向量化计算每个食材下一次可能改变分类的时间（与freshness_rules.next_freshness_transition一致）
+
+    Args:
+        put_in_times: datetime64数组（UTC）
+        now: 当前时间
+
+    Returns:
+        np.ndarray: datetime64[us]数组，已超过最后一个分界点或没有放入时间时为NaT
+    """
+    put_in_times = np.asarray(put_in_times, dtype="datetime64[us]")
+    candidates = put_in_times[:, None] + _TRANSITION_OFFSETS[None, :]
+    pending = candidates > _now64(now)
+    has_pending = pending.any(axis=1)
+    first = candidates[np.arange(len(put_in_times)), pending.argmax(axis=1)]
+    return np.where(has_pending, first, np.datetime64("NaT", "us"))
+
+
+def classify_items(items: List[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """
+    对食材字典列表做批量分类（put_in_time可以是datetime或ISO字符串）
+
+    Args:
+        items: 食材列表，可以来自多台设备
+        now: 当前时间
+
+    Returns:
+        Dict: bucket（分类编码）、days_in_fridge、next_transition，与items一一对应
+    """
+    put_in_times = to_datetime64(item.get("put_in_time") for item in items)
+    freshness = np.array([item.get("freshness") for item in items], dtype=object)
+    buckets, days = classify_freshness(put_in_times, freshness, now)
+    return {
+        "bucket": buckets,
+        "days_in_fridge": days,
+        "next_transition": next_transition_times(put_in_times, now),
+    }
+
+
+def bucket_counts(buckets: np.ndarray) -> Dict[str, int]:
+    """各分类的数量"""
+    counts = np.bincount(np.asarray(buckets, dtype=np.int64), minlength=len(BUCKET_NAMES))
+    return {name: int(count) for name, count in zip(BUCKET_NAMES, counts)}
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 食材新鲜度规则
+按放入冰箱的天数划分新鲜度状态，菜谱推荐、缓存和过期提醒共用同一套阈值
+- fresh: 放入时间 < 3天
+- expiring_soon: 3-7天
+- needs_attention: 7-10天或新鲜度一般(fair)
+- expired: >=10天或新鲜度差(poor)
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+EXPIRING_SOON_DAYS = 3
+NEEDS_ATTENTION_DAYS = 7
+EXPIRED_DAYS = 10
+
+# 状态分界点（天），按天数递增
+TRANSITION_DAYS = (EXPIRING_SOON_DAYS, NEEDS_ATTENTION_DAYS, EXPIRED_DAYS)
+
+
+def next_freshness_transition(put_in_time: Optional[datetime], now: datetime) -> Optional[datetime]:
+    """
+    计算食材下一次新鲜度状态可能变化的时间
+
+    Args:
+        put_in_time: 放入冰箱的时间
+        now: 当前时间
+
+    Returns:
+        datetime: 下一个状态分界点，已经超过最后一个分界点或没有放入时间时返回None
+    """
+    if put_in_time is None:
+        return None
+    for days in TRANSITION_DAYS:
+        transition = put_in_time + timedelta(days=days)
+        if transition > now:
+            return transition
+    return None
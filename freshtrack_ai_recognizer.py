@@ -6,14 +6,19 @@ FreshTrackAI - 腾讯混元大模型集成模块
 
 import os
 import json
+import time
 import types
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
-from tencentcloud.common import credential
-from tencentcloud.common.profile.client_profile import ClientProfile
-from tencentcloud.common.profile.http_profile import HttpProfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Iterator, Tuple, Union
 from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentCloudSDKException
-from tencentcloud.hunyuan.v20230901 import hunyuan_client, models
+from hunyuan_pool import get_hunyuan_client, chat_completions, achat_completions, RateLimiter
+from recognition_cache import RecognitionCache, create_recognition_cache_from_env
+from image_utils import fetch_image_validator
+
+RECOGNITION_MODEL = "hunyuan-t1-vision"
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -22,13 +27,21 @@ logger = logging.getLogger(__name__)
 class FreshTrackItemRecognizer:
     """FreshTrack冰箱物品识别器 - 基于腾讯混元大模型"""
     
-    def __init__(self, secret_id: Optional[str] = None, secret_key: Optional[str] = None):
+    def __init__(
+        self,
+        secret_id: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        cache: Optional[RecognitionCache] = None,
+        enable_cache: bool = True
+    ):
         """
         初始化识别器
         
         Args:
             secret_id: 腾讯云Secret ID，如果不提供则从环境变量获取
             secret_key: 腾讯云Secret Key，如果不提供则从环境变量获取
+            cache: 识别结果缓存，不提供时按RECOGNITION_CACHE_*环境变量创建
+            enable_cache: 是否启用识别结果缓存
         """
         self.secret_id = secret_id or os.getenv("TENCENTCLOUD_SECRET_ID")
         self.secret_key = secret_key or os.getenv("TENCENTCLOUD_SECRET_KEY")
@@ -36,19 +49,15 @@ class FreshTrackItemRecognizer:
         if not self.secret_id or not self.secret_key:
             raise ValueError("请设置腾讯云API密钥环境变量或传入参数")
         
-        # 初始化腾讯云客户端
+        # 获取进程内共享的腾讯云客户端
         try:
-            cred = credential.Credential(self.secret_id, self.secret_key)
-            httpProfile = HttpProfile()
-            httpProfile.endpoint = "hunyuan.tencentcloudapi.com"
-            httpProfile.reqTimeout = 120  # 设置超时时间为120秒（原为60秒）
-            clientProfile = ClientProfile()
-            clientProfile.httpProfile = httpProfile
-            self.client = hunyuan_client.HunyuanClient(cred, "", clientProfile)
+            self.client = get_hunyuan_client(self.secret_id, self.secret_key)
             logger.info("腾讯混元客户端初始化成功")
         except Exception as e:
             logger.error(f"腾讯混元客户端初始化失败: {e}")
             raise
+        
+        self.cache = (cache or create_recognition_cache_from_env()) if enable_cache else None
     
     def get_system_prompt(self) -> str:
         """获取系统提示词"""
@@ -105,104 +114,197 @@ class FreshTrackItemRecognizer:
 - 零食：坚果、饼干、糖果等
 """
 
-    def recognize_fridge_items(self, image_url: str, device_id: str = None) -> Dict[str, Any]: # type: ignore
+    def recognize_fridge_items(self, image_url: str, device_id: str = None, image_bytes: Optional[bytes] = None) -> Dict[str, Any]: # type: ignore
         """
         识别冰箱中的物品
         
         Args: 
             image_url: 图片URL
             device_id: 设备ID（可选）
+            image_bytes: 图片原始字节（可选），用于按内容计算缓存键，不提供时按URL和ETag/Last-Modified计算
             
         Returns:
-            Dict: 识别结果
+            Dict: 识别结果，命中缓存时cache_hit为True且api_usage为0
         """
         try:
             logger.info(f"开始识别冰箱物品，图片URL: {image_url}")
             
-            # 创建请求对象
-            req = models.ChatCompletionsRequest()
+            # 相同图片直接返回缓存结果
+            cache_key = self._get_cache_key(image_url, image_bytes)
+            cached_result = self._get_cached_result(cache_key, image_url, device_id)
+            if cached_result is not None:
+                return cached_result
             
             # 构建请求参数
-            params = {
-                "Model": "hunyuan-t1-vision",
-                "Messages": [
-                    {
-                        "Role": "system",
-                        "Content": self.get_system_prompt()
-                    },
-                    {
-                        "Role": "user",
-                        "Contents": [
-                            {
-                                "Type": "text", 
-                                "Text": f"请识别这张冰箱图片中的所有物品。设备ID: {device_id or 'unknown'}"
-                            },
-                            {
-                                "Type": "image_url", 
-                                "ImageUrl": {"Url": image_url}
-                            }
-                        ]
-                    }
-                ],
-                "Stream": False,
-                "Temperature": 0.1,  # 降低随机性
-                "TopP": 0.9,
-                "ResponseFormat": "json"  # 强制API返回JSON格式
-            }
-            
-            req.from_json_string(json.dumps(params))
+            params = self._build_request_params(image_url, device_id)
             
             # 发送请求
-            resp = self.client.ChatCompletions(req)
+            resp = chat_completions(params, client=self.client)
             
-            # 处理响应
-            if hasattr(resp, 'Choices') and resp.Choices: # pyright: ignore[reportAttributeAccessIssue]
-                content = resp.Choices[0].Message.Content # type: ignore
-                logger.info(f"收到API响应，长度: {len(content)} 字符")
-                
-                # 解析JSON响应
-                parsed_result = self._parse_response(content)
+            result = self._handle_response(resp, image_url, device_id)
+            if cache_key:
+                self.cache.set(cache_key, result) # type: ignore
+            return result
                 
-                # 添加元数据
-                parsed_result.update({
-                    "device_id": device_id,
-                    "image_url": image_url,
-                    "model": "hunyuan-t1-vision",
-                    "api_usage": {
-                        "prompt_tokens": getattr(resp.Usage, 'PromptTokens', 0) if hasattr(resp, 'Usage') else 0, # pyright: ignore[reportAttributeAccessIssue]
-                        "completion_tokens": getattr(resp.Usage, 'CompletionTokens', 0) if hasattr(resp, 'Usage') else 0, # pyright: ignore[reportAttributeAccessIssue]
-                        "total_tokens": getattr(resp.Usage, 'TotalTokens', 0) if hasattr(resp, 'Usage') else 0 # pyright: ignore[reportAttributeAccessIssue]
-                    }
-                })
-                
-                return parsed_result
+        except Exception as e:
+            return self._create_error_result(e, device_id)
+
+    async def arecognize_fridge_items(self, image_url: str, device_id: str = None, image_bytes: Optional[bytes] = None) -> Dict[str, Any]: # type: ignore
+        """
+        识别冰箱中的物品（异步版本，模型请求经hunyuan_pool的异步HTTP传输发送，排队和等待响应时不占用线程）
+        
+        Args: 
+            image_url: 图片URL
+            device_id: 设备ID（可选）
+            image_bytes: 图片原始字节（可选），用于按内容计算缓存键，不提供时按URL和ETag/Last-Modified计算
             
-            else:
-                logger.error("API响应格式异常")
-                return {
-                    "success": False,
-                    "error": "API响应格式异常",
-                    "items": [],
-                    "device_id": device_id
-                }
-                
-        except TencentCloudSDKException as e:
-            logger.error(f"腾讯云API错误: {e.message}")
-            return {
-                "success": False,
-                "error": f"腾讯云API错误: {e.message}",
-                "error_code": getattr(e, 'code', 'Unknown'),
-                "items": [],
-                "device_id": device_id
-            }
+        Returns:
+            Dict: 识别结果，格式与recognize_fridge_items相同
+        """
+        try:
+            logger.info(f"开始异步识别冰箱物品，图片URL: {image_url}")
+            cache_key = await asyncio.to_thread(self._get_cache_key, image_url, image_bytes)
+            cached_result = self._get_cached_result(cache_key, image_url, device_id)
+            if cached_result is not None:
+                return cached_result
+            params = self._build_request_params(image_url, device_id)
+            resp = await achat_completions(params, client=self.client)
+            result = self._handle_response(resp, image_url, device_id)
+            if cache_key:
+                self.cache.set(cache_key, result) # type: ignore
+            return result
+        except Exception as e:
+            return self._create_error_result(e, device_id)
+
+    def _get_cache_key(self, image_url: str, image_bytes: Optional[bytes] = None) -> Optional[str]:
+        """
+        计算图片的缓存键，未启用缓存时返回None
+        有图片字节时按内容哈希；只有URL时用HEAD请求读取ETag/Last-Modified，
+        不下载图片（模型会自行下载），服务端不提供校验信息或请求失败时不使用缓存
+        """
+        if self.cache is None:
+            return None
+        if image_bytes is not None:
+            return RecognitionCache.make_key(image_bytes, RECOGNITION_MODEL, self.get_system_prompt())
+        try:
+            validator = fetch_image_validator(image_url)
         except Exception as e:
-            logger.error(f"识别过程异常: {str(e)}")
+            logger.warning(f"读取图片校验信息失败，跳过识别缓存: {e}")
+            return None
+        if validator is None:
+            return None
+        return RecognitionCache.make_url_key(image_url, validator, RECOGNITION_MODEL, self.get_system_prompt())
+
+    def _get_cached_result(self, cache_key: Optional[str], image_url: str, device_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not cache_key:
+            return None
+        cached = self.cache.get(cache_key) # type: ignore
+        if cached is None:
+            return None
+        logger.info(f"识别缓存命中，图片URL: {image_url}")
+        return RecognitionCache.build_hit_result(cached, image_url, device_id)
+
+    def recognize_many(
+        self,
+        images: List[Union[str, Tuple[str, Optional[str]], Dict[str, Any]]],
+        max_concurrency: int = 4,
+        requests_per_second: Optional[float] = None,
+        rate_limiter: Optional[RateLimiter] = None
+    ) -> "RecognitionBatch":
+        """
+        批量识别多张冰箱图片
+        
+        Args:
+            images: 图片列表，元素可以是图片URL、(image_url, device_id)元组或包含image_url/device_id的字典
+            max_concurrency: 线程池大小，即同时进行中的识别请求数
+            requests_per_second: 本批次共享的每秒请求数上限，None表示不限流
+            rate_limiter: 外部传入的限流器，多个批次可共享同一份预算，优先于requests_per_second
+            
+        Returns:
+            RecognitionBatch: 可迭代对象，按完成顺序返回每张图片的识别结果，summary()返回批次统计
+        """
+        if rate_limiter is None and requests_per_second:
+            rate_limiter = RateLimiter(requests_per_second)
+        return RecognitionBatch(self, images, max_concurrency, rate_limiter)
+
+    def _build_request_params(self, image_url: str, device_id: Optional[str]) -> Dict[str, Any]:
+        """构建识别请求参数"""
+        return {
+            "Model": RECOGNITION_MODEL,
+            "Messages": [
+                {
+                    "Role": "system",
+                    "Content": self.get_system_prompt()
+                },
+                {
+                    "Role": "user",
+                    "Contents": [
+                        {
+                            "Type": "text", 
+                            "Text": f"请识别这张冰箱图片中的所有物品。设备ID: {device_id or 'unknown'}"
+                        },
+                        {
+                            "Type": "image_url", 
+                            "ImageUrl": {"Url": image_url}
+                        }
+                    ]
+                }
+            ],
+            "Stream": False,
+            "Temperature": 0.1,  # 降低随机性
+            "TopP": 0.9,
+            "ResponseFormat": "json"  # 强制API返回JSON格式
+        }
+
+    def _handle_response(self, resp: Any, image_url: str, device_id: Optional[str]) -> Dict[str, Any]:
+        """处理ChatCompletions响应，解析识别结果并添加元数据"""
+        if hasattr(resp, 'Choices') and resp.Choices:
+            content = resp.Choices[0].Message.Content
+            logger.info(f"收到API响应，长度: {len(content)} 字符")
+            
+            # 解析JSON响应
+            parsed_result = self._parse_response(content)
+            
+            # 添加元数据
+            parsed_result.update({
+                "device_id": device_id,
+                "image_url": image_url,
+                "model": RECOGNITION_MODEL,
+                "api_usage": {
+                    "prompt_tokens": getattr(resp.Usage, 'PromptTokens', 0) if hasattr(resp, 'Usage') else 0,
+                    "completion_tokens": getattr(resp.Usage, 'CompletionTokens', 0) if hasattr(resp, 'Usage') else 0,
+                    "total_tokens": getattr(resp.Usage, 'TotalTokens', 0) if hasattr(resp, 'Usage') else 0
+                }
+            })
+            
+            return parsed_result
+        
+        logger.error("API响应格式异常")
+        return {
+            "success": False,
+            "error": "API响应格式异常",
+            "items": [],
+            "device_id": device_id
+        }
+
+    def _create_error_result(self, error: Exception, device_id: Optional[str]) -> Dict[str, Any]:
+        """将调用异常转换为识别失败结果"""
+        if isinstance(error, TencentCloudSDKException):
+            logger.error(f"腾讯云API错误: {error.message}")
             return {
                 "success": False,
-                "error": f"识别过程异常: {str(e)}",
+                "error": f"腾讯云API错误: {error.message}",
+                "error_code": getattr(error, 'code', 'Unknown'),
                 "items": [],
                 "device_id": device_id
             }
+        logger.error(f"识别过程异常: {str(error)}")
+        return {
+            "success": False,
+            "error": f"识别过程异常: {str(error)}",
+            "items": [],
+            "device_id": device_id
+        }
     
     def _parse_response(self, content: str) -> Dict[str, Any]:
         """
@@ -256,6 +358,96 @@ class FreshTrackItemRecognizer:
                 "items": []
             }
 
+class RecognitionBatch:
+    """批量识别任务，迭代时以流式方式按完成顺序返回结果"""
+    
+    def __init__(
+        self,
+        recognizer: FreshTrackItemRecognizer,
+        images: List[Union[str, Tuple[str, Optional[str]], Dict[str, Any]]],
+        max_concurrency: int = 4,
+        rate_limiter: Optional[RateLimiter] = None
+    ):
+        self.recognizer = recognizer
+        self.images = [self._normalize_image(image) for image in images]
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = rate_limiter
+        self._lock = threading.Lock()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._completed = 0
+        self._succeeded = 0
+        self._usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    
+    @staticmethod
+    def _normalize_image(image: Union[str, Tuple[str, Optional[str]], Dict[str, Any]]) -> Tuple[str, Optional[str]]:
+        if isinstance(image, str):
+            return image, None
+        if isinstance(image, dict):
+            return image["image_url"], image.get("device_id")
+        return image[0], image[1] if len(image) > 1 else None
+    
+    def _recognize_one(self, image_url: str, device_id: Optional[str]) -> Dict[str, Any]:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return self.recognizer.recognize_fridge_items(image_url, device_id) # type: ignore
+    
+    def _record(self, result: Dict[str, Any]):
+        with self._lock:
+            self._completed += 1
+            if result.get("success"):
+                self._succeeded += 1
+            for key, value in (result.get("api_usage") or {}).items():
+                if key in self._usage:
+                    self._usage[key] += value or 0
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        self._started_at = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="recognize")
+        try:
+            futures = {
+                executor.submit(self._recognize_one, image_url, device_id): index
+                for index, (image_url, device_id) in enumerate(self.images)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                image_url, device_id = self.images[index]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = self.recognizer._create_error_result(e, device_id)
+                result.setdefault("image_url", image_url)
+                result["batch_index"] = index
+                self._record(result)
+                yield result
+        finally:
+            # 调用方提前停止迭代时取消尚未开始的请求
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._finished_at = time.monotonic()
+    
+    def summary(self) -> Dict[str, Any]:
+        """
+        批次统计：完成数量、耗时、吞吐量以及汇总的api_usage
+        
+        Returns:
+            Dict: 批次统计信息
+        """
+        with self._lock:
+            if self._started_at is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self._finished_at or time.monotonic()) - self._started_at
+            return {
+                "total_images": len(self.images),
+                "completed": self._completed,
+                "succeeded": self._succeeded,
+                "failed": self._completed - self._succeeded,
+                "elapsed_seconds": round(elapsed, 3),
+                "images_per_second": round(self._completed / elapsed, 3) if elapsed > 0 else 0.0,
+                "api_usage": dict(self._usage)
+            }
+
+
 # 使用示例
 if __name__ == "__main__":
     # 初始化识别器
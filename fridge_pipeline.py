@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 开关门事件处理流程
+图片识别 → 数据库对比更新 的完整管道
+- 与该设备上一次识别的图片比较感知哈希，内容无变化时跳过识别和agent，只刷新detected_at
+- 整图哈希可能漏掉小范围的物品变化，连续跳过一定次数或距上次识别超过一定时间后强制识别
+- 有变化时调用识别器，再交给agent_process_and_update更新数据库
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+from db import SessionLocal, get_device_image_state, record_skipped_image_event, save_device_image_state, touch_items_detected_at
+from data_processor import agent_process_and_update
+from agent_controller import AgentLoopController
+from freshtrack_ai_recognizer import FreshTrackItemRecognizer
+from image_utils import fetch_image_bytes, compute_dhash, hamming_distance
+
+logger = logging.getLogger(__name__)
+
+# 感知哈希的汉明距离不超过该值时视为冰箱内容未变化（64位哈希）
+IMAGE_CHANGE_THRESHOLD = int(os.getenv("IMAGE_CHANGE_THRESHOLD", "2"))
+# 连续跳过识别的事件数达到该值后，下一次事件强制识别，0表示不限制
+IMAGE_MAX_SKIPPED_EVENTS = int(os.getenv("IMAGE_MAX_SKIPPED_EVENTS", "3"))
+# 距上次识别超过该时间（秒）后强制识别，0表示不限制
+IMAGE_MAX_SKIP_SECONDS = float(os.getenv("IMAGE_MAX_SKIP_SECONDS", "21600"))
+
+
+def build_processor_items(recognition_result: Dict[str, Any], detected_at: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """将识别结果转换为data_processor所需的格式"""
+    detected_at = detected_at or datetime.now(timezone.utc)
+    processed_items = []
+    for item in recognition_result.get('items', []):
+        processed_items.append({
+            "name": item.get('name', '未知物品'),
+            "category": item.get('category', '其他'),
+            "subcategory": item.get('subcategory', ''),
+            "brand": item.get('brand', ''),
+            "confidence": item.get('confidence', 0.0),
+            "position": item.get('position', {}),
+            "quantity": item.get('quantity', 1),
+            "estimated_size": item.get('estimated_size', 'medium'),
+            "freshness": item.get('freshness', 'unknown'),
+            "additional_info": item.get('additional_info', {}),
+            "image_url": recognition_result.get('image_url', ''),
+            "put_in_time": detected_at.isoformat(),
+            "detected_at": detected_at.isoformat(),
+            "device_id": recognition_result.get('device_id', 'unknown')
+        })
+    return processed_items
+
+
+def _compute_image_hash(image_bytes: Optional[bytes]) -> Optional[str]:
+    if image_bytes is None:
+        return None
+    try:
+        return compute_dhash(image_bytes)
+    except Exception as e:
+        logger.warning(f"计算图片感知哈希失败，不做变化检测: {e}")
+        return None
+
+
+def _forced_recognition_reason(state, now: datetime) -> Optional[str]:
+    """图片无变化时是否仍需强制识别，返回原因"""
+    if IMAGE_MAX_SKIPPED_EVENTS and (state.skipped_events or 0) >= IMAGE_MAX_SKIPPED_EVENTS:
+        return "max_skipped_events"
+    updated_at = state.updated_at
+    if IMAGE_MAX_SKIP_SECONDS and updated_at is not None:
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        if now - updated_at >= timedelta(seconds=IMAGE_MAX_SKIP_SECONDS):
+            return "max_skip_age"
+    return None
+
+
+def process_door_close(
+    image_url: str,
+    device_id: str,
+    recognizer: FreshTrackItemRecognizer,
+    detected_at: Optional[datetime] = None,
+    image_bytes: Optional[bytes] = None,
+    change_threshold: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    处理一次开关门事件
+
+    Args:
+        image_url: 本次拍摄的冰箱图片URL
+        device_id: 设备ID
+        recognizer: 识别器
+        detected_at: 关门时间，默认为当前时间
+        image_bytes: 图片原始字节，不提供时从image_url下载
+        change_threshold: 感知哈希变化阈值，默认读取IMAGE_CHANGE_THRESHOLD
+
+    Returns:
+        Dict: 处理摘要，skipped为True表示图片无变化、未调用模型；
+            forced_reason不为空表示图片无变化但达到跳过次数或时间上限，仍然做了识别
+    """
+    detected_at = detected_at or datetime.now(timezone.utc)
+    threshold = IMAGE_CHANGE_THRESHOLD if change_threshold is None else change_threshold
+
+    if image_bytes is None:
+        try:
+            image_bytes = fetch_image_bytes(image_url)
+        except Exception as e:
+            logger.warning(f"下载图片失败，不做变化检测: {e}")
+    image_hash = _compute_image_hash(image_bytes)
+
+    forced_reason = None
+    session = SessionLocal()
+    try:
+        if image_hash:
+            last_state = get_device_image_state(session, device_id)
+            if last_state is not None:
+                distance = hamming_distance(image_hash, last_state.image_hash)
+                if distance <= threshold:
+                    forced_reason = _forced_recognition_reason(last_state, datetime.now(timezone.utc))
+                    if forced_reason is None:
+                        touched = touch_items_detected_at(session, device_id, detected_at)
+                        record_skipped_image_event(session, device_id)
+                        logger.info(f"设备 {device_id} 图片无明显变化(距离 {distance})，跳过识别，刷新 {touched} 个物品")
+                        return {
+                            "success": True,
+                            "skipped": True,
+                            "device_id": device_id,
+                            "image_distance": distance,
+                            "touched_items": touched
+                        }
+                    logger.info(f"设备 {device_id} 图片无明显变化(距离 {distance})，但已达到上限({forced_reason})，强制识别")
+    finally:
+        session.close()
+
+    result = recognizer.recognize_fridge_items(image_url, device_id, image_bytes=image_bytes)
+    if not result.get('success'):
+        return {
+            "success": False,
+            "skipped": False,
+            "device_id": device_id,
+            "error": result.get('error', '识别失败')
+        }
+
+    items = build_processor_items(result, detected_at)
+    controller = AgentLoopController()
+    messages = agent_process_and_update(items, device_id=device_id, controller=controller)
+
+    if image_hash:
+        session = SessionLocal()
+        try:
+            save_device_image_state(session, device_id, image_hash, image_url)
+        finally:
+            session.close()
+
+    return {
+        "success": True,
+        "skipped": False,
+        "forced_reason": forced_reason,
+        "device_id": device_id,
+        "recognized_items": len(items),
+        "agent_messages": len(messages),
+        "cache_hit": bool(result.get('cache_hit')),
+        "api_usage": result.get('api_usage'),
+        "agent_metrics": controller.metrics()
+    }
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 腾讯混元客户端共享模块
+进程内共享的HunyuanClient工厂
+- 同一组密钥只创建一次客户端，复用keep-alive连接池
+- 按模型限制并发请求数
+- 超时、连接池大小等配置统一从环境变量读取
+- 提供基于httpx的异步传输（TC3-HMAC-SHA256签名），等待名额和响应时不占用线程，单进程可同时保持大量进行中的模型请求
+"""
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import threading
+import weakref
+from datetime import datetime, timezone
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Iterator, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from tencentcloud.common import credential
+from tencentcloud.common.profile.client_profile import ClientProfile
+from tencentcloud.common.profile.http_profile import HttpProfile
+from tencentcloud.common.sign import Sign
+from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentCloudSDKException
+from tencentcloud.hunyuan.v20230901 import hunyuan_client, models
+
+logger = logging.getLogger(__name__)
+
+HUNYUAN_ENDPOINT = os.getenv("HUNYUAN_ENDPOINT", "hunyuan.tencentcloudapi.com")
+# 单次请求超时时间（秒）
+HUNYUAN_REQ_TIMEOUT = int(os.getenv("HUNYUAN_REQ_TIMEOUT", "120"))
+# 每个客户端保持的最大keep-alive连接数
+HUNYUAN_POOL_MAXSIZE = int(os.getenv("HUNYUAN_POOL_MAXSIZE", "20"))
+# 未单独配置的模型的并发上限（混元默认账号并发为5路）
+HUNYUAN_DEFAULT_CONCURRENCY = int(os.getenv("HUNYUAN_DEFAULT_CONCURRENCY", "5"))
+# 异步传输的最大连接数（包括进行中的请求）
+HUNYUAN_ASYNC_MAX_CONNECTIONS = int(os.getenv("HUNYUAN_ASYNC_MAX_CONNECTIONS", "200"))
+HUNYUAN_SERVICE = "hunyuan"
+HUNYUAN_API_VERSION = "2023-09-01"
+
+
+def _parse_model_concurrency(value: str) -> Dict[str, int]:
+    """解析形如 "hunyuan-lite=10,hunyuan-t1-vision=5" 的并发配置"""
+    limits = {}
+    for part in value.split(","):
+        if "=" not in part:
+            continue
+        model, limit = part.split("=", 1)
+        try:
+            limits[model.strip()] = int(limit)
+        except ValueError:
+            logger.warning(f"忽略无效的模型并发配置: {part}")
+    return limits
+
+
+HUNYUAN_MODEL_CONCURRENCY = _parse_model_concurrency(os.getenv("HUNYUAN_MODEL_CONCURRENCY", ""))
+
+_clients: Dict[Tuple[str, str], hunyuan_client.HunyuanClient] = {}
+_model_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+
+# 异步客户端和信号量绑定到事件循环，每个事件循环各自一份
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+_async_model_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def get_hunyuan_client(secret_id: Optional[str] = None, secret_key: Optional[str] = None) -> hunyuan_client.HunyuanClient:
+    """
+    获取进程内共享的混元客户端
+
+    Args:
+        secret_id: 腾讯云Secret ID，如果不提供则从环境变量获取
+        secret_key: 腾讯云Secret Key，如果不提供则从环境变量获取
+
+    Returns:
+        HunyuanClient: 共享的客户端实例
+    """
+    secret_id = secret_id or os.getenv("TENCENTCLOUD_SECRET_ID")
+    secret_key = secret_key or os.getenv("TENCENTCLOUD_SECRET_KEY")
+    if not secret_id or not secret_key:
+        raise ValueError("请设置腾讯云API密钥环境变量或传入参数")
+
+    key = (secret_id, secret_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            cred = credential.Credential(secret_id, secret_key)
+            httpProfile = HttpProfile()
+            httpProfile.endpoint = HUNYUAN_ENDPOINT
+            httpProfile.reqTimeout = HUNYUAN_REQ_TIMEOUT
+            httpProfile.keepAlive = True
+            clientProfile = ClientProfile()
+            clientProfile.httpProfile = httpProfile
+            client = hunyuan_client.HunyuanClient(cred, "", clientProfile)
+            _mount_connection_pool(client)
+            _clients[key] = client
+            logger.info("腾讯混元共享客户端初始化成功")
+    return client
+
+
+def _mount_connection_pool(client: hunyuan_client.HunyuanClient):
+    """为SDK内部的requests.Session挂载更大的连接池，以便多线程复用连接"""
+    session = getattr(getattr(client.request, "conn", None), "_session", None)
+    if session is None:
+        logger.warning("无法访问SDK连接会话，使用默认连接池")
+        return
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HUNYUAN_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def get_model_semaphore(model: str) -> threading.BoundedSemaphore:
+    """获取某个模型的并发信号量"""
+    semaphore = _model_semaphores.get(model)
+    if semaphore is None:
+        with _lock:
+            semaphore = _model_semaphores.get(model)
+            if semaphore is None:
+                limit = HUNYUAN_MODEL_CONCURRENCY.get(model, HUNYUAN_DEFAULT_CONCURRENCY)
+                semaphore = threading.BoundedSemaphore(limit)
+                _model_semaphores[model] = semaphore
+    return semaphore
+
+
+@contextmanager
+def model_slot(model: str):
+    """占用一个模型并发名额，超出上限时阻塞等待"""
+    semaphore = get_model_semaphore(model)
+    semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def chat_completions(params: Dict[str, Any], client: Optional[hunyuan_client.HunyuanClient] = None):
+    """
+    通过共享客户端调用ChatCompletions
+
+    Args:
+        params: ChatCompletions请求参数，必须包含Model
+        client: 指定客户端，默认使用环境变量密钥对应的共享客户端
+
+    Returns:
+        ChatCompletionsResponse: SDK响应对象
+    """
+    client = client or get_hunyuan_client()
+    req = models.ChatCompletionsRequest()
+    req.from_json_string(json.dumps(params, ensure_ascii=False))
+    with model_slot(params.get("Model", "")):
+        return client.ChatCompletions(req)
+
+
+def stream_chat_completions(params: Dict[str, Any], client: Optional[hunyuan_client.HunyuanClient] = None) -> Iterator[Dict[str, Any]]:
+    """
+    以流式方式调用ChatCompletions（SSE），逐个返回增量数据块
+
+    Args:
+        params: ChatCompletions请求参数，Stream会被强制设为True
+        client: 指定客户端，默认使用共享客户端
+
+    Yields:
+        Dict: 每个SSE事件data字段解析后的JSON，包含Choices[0].Delta.Content等
+    """
+    client = client or get_hunyuan_client()
+    params = dict(params, Stream=True)
+    req = models.ChatCompletionsRequest()
+    req.from_json_string(json.dumps(params, ensure_ascii=False))
+    # 并发名额一直占用到流结束
+    with model_slot(params.get("Model", "")):
+        for event in client.ChatCompletions(req):
+            data = event.get("data") if isinstance(event, dict) else None
+            if data:
+                yield json.loads(data)
+
+
+class RateLimiter:
+    """令牌桶限流器，多个线程共享同一份请求预算"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        Args:
+            rate: 每秒允许的请求数
+            burst: 桶容量，允许的瞬时突发请求数，默认等于max(1, rate)
+        """
+        if rate <= 0:
+            raise ValueError("rate必须大于0")
+        self.rate = rate
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预留一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """获取一个令牌，预算不足时阻塞等待"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """异步获取一个令牌"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def get_async_http_client():
+    """获取当前事件循环共享的httpx.AsyncClient（keep-alive连接池）"""
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    http_client = _async_http_clients.get(loop)
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            timeout=HUNYUAN_REQ_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HUNYUAN_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=HUNYUAN_POOL_MAXSIZE,
+            ),
+        )
+        _async_http_clients[loop] = http_client
+    return http_client
+
+
+async def close_async_http_client():
+    """关闭当前事件循环的异步连接池，在事件循环退出前调用"""
+    http_client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+    if http_client is not None:
+        await http_client.aclose()
+
+
+@asynccontextmanager
+async def amodel_slot(model: str):
+    """
+    异步版本的model_slot，等待名额时不阻塞事件循环，也不占用线程
+
+    先在本事件循环的asyncio.Semaphore上排队，再非阻塞地占用进程级的BoundedSemaphore，
+    因此同步调用、多个事件循环的异步调用共用同一个模型并发上限；
+    请求被取消（如asyncio.wait_for超时）时名额随之释放
+    """
+    semaphores = _async_model_semaphores.setdefault(asyncio.get_running_loop(), {})
+    loop_semaphore = semaphores.get(model)
+    if loop_semaphore is None:
+        limit = HUNYUAN_MODEL_CONCURRENCY.get(model, HUNYUAN_DEFAULT_CONCURRENCY)
+        loop_semaphore = semaphores[model] = asyncio.Semaphore(limit)
+    async with loop_semaphore:
+        process_semaphore = get_model_semaphore(model)
+        delay = 0.005
+        # 名额被同步调用或其他事件循环占用时退避重试
+        while not process_semaphore.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            process_semaphore.release()
+
+
+def build_signed_request(
+    action: str,
+    payload: str,
+    client: hunyuan_client.HunyuanClient,
+    timestamp: Optional[int] = None
+) -> Tuple[str, Dict[str, str]]:
+    """
+    按TC3-HMAC-SHA256签名方法构造API 3.0请求，只使用客户端的公开属性（credential、region）
+
+    Args:
+        action: 接口名，如ChatCompletions
+        payload: JSON请求体
+        client: 提供密钥和地域的SDK客户端
+        timestamp: 请求时间戳，默认为当前时间
+
+    Returns:
+        Tuple[str, Dict[str, str]]: (请求URL, 请求头)
+    """
+    secret_id, secret_key, token = client.credential.get_credential_info()
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    date = datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+    content_type = "application/json; charset=utf-8"
+    signed_headers = "content-type;host;x-tc-action"
+    canonical_request = "\n".join([
+        "POST", "/", "",
+        f"content-type:{content_type}\nhost:{HUNYUAN_ENDPOINT}\nx-tc-action:{action.lower()}\n",
+        signed_headers,
+        hashlib.sha256(payload.encode("utf-8")).hexdigest(),
+    ])
+    scope = f"{date}/{HUNYUAN_SERVICE}/tc3_request"
+    string_to_sign = "\n".join([
+        "TC3-HMAC-SHA256", str(timestamp), scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    signature = Sign.sign_tc3(secret_key, date, HUNYUAN_SERVICE, string_to_sign)
+    headers = {
+        "Authorization": f"TC3-HMAC-SHA256 Credential={secret_id}/{scope}, SignedHeaders={signed_headers}, Signature={signature}",
+        "Content-Type": content_type,
+        "Host": HUNYUAN_ENDPOINT,
+        "X-TC-Action": action,
+        "X-TC-Timestamp": str(timestamp),
+        "X-TC-Version": HUNYUAN_API_VERSION,
+    }
+    if client.region:
+        headers["X-TC-Region"] = client.region
+    if token:
+        headers["X-TC-Token"] = token
+    return f"https://{HUNYUAN_ENDPOINT}/", headers
+
+
+async def achat_completions(params: Dict[str, Any], client: Optional[hunyuan_client.HunyuanClient] = None):
+    """
+    异步调用ChatCompletions
+
+    请求由build_signed_request签名后通过httpx异步发送，等待名额和响应时不占用线程；
+    与共享客户端的默认配置一致，不做自动重试和地域熔断。响应转换为SDK模型对象，
+    因此调用方可以像同步版本一样处理返回值。
+
+    Args:
+        params: ChatCompletions请求参数，必须包含Model
+        client: 提供密钥的SDK客户端，默认使用共享客户端
+
+    Returns:
+        ChatCompletionsResponse: SDK响应对象
+
+    Raises:
+        TencentCloudSDKException: 网络错误或接口返回错误
+    """
+    client = client or get_hunyuan_client()
+    payload = json.dumps(params, ensure_ascii=False)
+
+    async with amodel_slot(params.get("Model", "")):
+        # 签名时间戳在拿到名额后生成，排队时间不影响签名有效期
+        url, headers = build_signed_request("ChatCompletions", payload, client)
+        try:
+            http_resp = await get_async_http_client().post(url, content=payload.encode("utf-8"), headers=headers)
+        except Exception as e:
+            raise TencentCloudSDKException("ClientNetworkError", str(e))
+
+    if http_resp.status_code != 200:
+        raise TencentCloudSDKException("ServerNetworkError", http_resp.text)
+    data = http_resp.json()["Response"]
+    if "Error" in data:
+        raise TencentCloudSDKException(data["Error"]["Code"], data["Error"]["Message"], data.get("RequestId"))
+    resp = models.ChatCompletionsResponse()
+    resp.from_json_string(json.dumps(data, ensure_ascii=False))
+    return resp
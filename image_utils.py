@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 图片工具模块
+下载冰箱图片（或只读取其校验信息）并计算内容哈希和感知哈希
+"""
+
+import io
+import os
+import hashlib
+import logging
+import requests
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 下载图片的超时时间（秒）
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+# 允许下载的最大图片大小（字节）
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+
+
+def fetch_image_bytes(image_url: str, timeout: float = IMAGE_FETCH_TIMEOUT) -> bytes:
+    """
+    下载图片内容
+
+    Args:
+        image_url: 图片URL
+        timeout: 超时时间（秒）
+
+    Returns:
+        bytes: 图片原始字节
+    """
+    resp = requests.get(image_url, timeout=timeout, stream=True)
+    resp.raise_for_status()
+    chunks = []
+    size = 0
+    for chunk in resp.iter_content(chunk_size=64 * 1024):
+        size += len(chunk)
+        if size > IMAGE_MAX_BYTES:
+            raise ValueError(f"图片超过大小限制: {IMAGE_MAX_BYTES} 字节")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def fetch_image_validator(image_url: str, timeout: float = IMAGE_FETCH_TIMEOUT) -> Optional[str]:
+    """
+    用HEAD请求读取图片的缓存校验信息（ETag/Last-Modified/Content-Length），不下载图片内容
+
+    Args:
+        image_url: 图片URL
+        timeout: 超时时间（秒）
+
+    Returns:
+        Optional[str]: 校验信息，服务端没有返回ETag和Last-Modified时返回None
+    """
+    resp = requests.head(image_url, timeout=timeout, allow_redirects=True)
+    resp.raise_for_status()
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    # 弱ETag(W/)不保证内容逐字节相同
+    if etag and etag.startswith("W/"):
+        etag = None
+    if not etag and not last_modified:
+        return None
+    return "|".join([etag or "", last_modified or "", resp.headers.get("Content-Length") or ""])
+
+
+def sha256_hex(data: bytes) -> str:
+    """计算字节内容的SHA-256哈希"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def compute_dhash(image_bytes: bytes, hash_size: int = 8) -> str:
+    """
+    计算图片的差异哈希(dHash)
+    图片缩小为灰度图后比较相邻像素的明暗关系，对整体亮度变化和轻微噪声不敏感
+
+    Args:
+        image_bytes: 图片原始字节
+        hash_size: 哈希边长，结果为hash_size*hash_size位
+
+    Returns:
+        str: 十六进制哈希字符串
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = small.tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    """两个十六进制哈希之间不同的位数"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 开关门事件接入队列
+HTTP接口把开关门图片事件写入本地SQLite持久化队列，由工作线程池按以下规则处理：
+- 同一台设备的事件按入队顺序串行处理（前一个事件完成或最终失败后才处理下一个），不同设备并行
+- 处理失败按指数退避重试，超过最大次数后标记为failed
+- 领取事件时设置可见性超时，工作进程崩溃后事件会在超时后重新被领取
+- 队列深度达到上限时拒绝入队（接口返回429），并可按INGESTION_EVENT_RATE限制每秒开始处理的事件数，
+  突发流量不会直接压到模型API上
+队列文件可被同一台机器上的多个进程共享
+
+单独运行工作进程: python ingestion_queue.py
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from hunyuan_pool import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+INGESTION_QUEUE_PATH = os.getenv("INGESTION_QUEUE_PATH", "freshtrack_ingestion.sqlite3")
+# 工作线程数
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "4"))
+# 待处理+处理中事件数上限，达到后拒绝入队
+INGESTION_MAX_QUEUE_DEPTH = int(os.getenv("INGESTION_MAX_QUEUE_DEPTH", "1000"))
+# 单个事件最多处理次数
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "5"))
+# 重试退避：第n次失败后等待 base * 2^(n-1) 秒（带随机抖动），不超过max
+INGESTION_RETRY_BASE_SECONDS = float(os.getenv("INGESTION_RETRY_BASE_SECONDS", "2"))
+INGESTION_RETRY_MAX_SECONDS = float(os.getenv("INGESTION_RETRY_MAX_SECONDS", "300"))
+# 领取后未确认的事件在该时间后可被重新领取，需大于单个事件的最长处理时间
+INGESTION_VISIBILITY_TIMEOUT = float(os.getenv("INGESTION_VISIBILITY_TIMEOUT", "300"))
+# 每秒最多开始处理的事件数，0表示不限制
+INGESTION_EVENT_RATE = float(os.getenv("INGESTION_EVENT_RATE", "0"))
+# 队列为空时的轮询间隔（秒）
+INGESTION_POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", "0.5"))
+# 已完成/失败事件的保留时间（秒）
+INGESTION_RETENTION_SECONDS = float(os.getenv("INGESTION_RETENTION_SECONDS", "86400"))
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+EventHandler = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+class QueueFullError(Exception):
+    """队列深度达到上限"""
+
+    def __init__(self, depth: int, max_depth: int):
+        super().__init__(f"接入队列已满: {depth}/{max_depth}")
+        self.depth = depth
+        self.max_depth = max_depth
+
+
+class IngestionQueue:
+    """SQLite持久化的开关门事件队列"""
+
+    def __init__(
+        self,
+        path: str = INGESTION_QUEUE_PATH,
+        max_depth: int = INGESTION_MAX_QUEUE_DEPTH,
+        max_attempts: int = INGESTION_MAX_ATTEMPTS,
+        visibility_timeout: float = INGESTION_VISIBILITY_TIMEOUT
+    ):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.visibility_timeout = visibility_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {"enqueued": 0, "rejected": 0}
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS door_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, device_id TEXT NOT NULL, image_url TEXT NOT NULL, "
+            "detected_at TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "available_at REAL NOT NULL, leased_until REAL, enqueued_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL, last_error TEXT, result TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_door_events_status_available ON door_events (status, available_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_door_events_device_status ON door_events (device_id, status, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_door_events_finished_at ON door_events (finished_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3连接不能跨线程使用，每个线程各自持有一个；事务由代码显式控制
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def depth(self) -> int:
+        """待处理+处理中的事件数"""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM door_events WHERE status IN (?, ?)", (STATUS_PENDING, STATUS_PROCESSING)
+        ).fetchone()[0]
+
+    def enqueue(self, device_id: str, image_url: str, detected_at: Optional[str] = None) -> int:
+        """
+        写入一个开关门事件
+
+        Args:
+            device_id: 设备ID
+            image_url: 冰箱图片URL
+            detected_at: 关门时间（ISO格式），默认为入队时间
+
+        Returns:
+            int: 事件ID
+
+        Raises:
+            QueueFullError: 队列深度达到上限
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            depth = conn.execute(
+                "SELECT COUNT(*) FROM door_events WHERE status IN (?, ?)", (STATUS_PENDING, STATUS_PROCESSING)
+            ).fetchone()[0]
+            if self.max_depth and depth >= self.max_depth:
+                conn.execute("ROLLBACK")
+                self._count("rejected")
+                raise QueueFullError(depth, self.max_depth)
+            cursor = conn.execute(
+                "INSERT INTO door_events (device_id, image_url, detected_at, status, available_at, enqueued_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (device_id, image_url, detected_at or datetime.now(timezone.utc).isoformat(), STATUS_PENDING, now, now)
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("enqueued")
+        return cursor.lastrowid # type: ignore
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        领取一个可处理的事件：每台设备只领取其最早的未完成事件，且不能有同设备事件正在处理；
+        处理中但可见性超时已过的事件会被重新领取
+
+        Returns:
+            Dict: 事件记录（包含attempts，确认时需要原样传回），没有可处理事件时返回None
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM door_events e "
+                "WHERE ((e.status = ? AND e.available_at <= ?) OR (e.status = ? AND e.leased_until <= ?)) "
+                "AND NOT EXISTS (SELECT 1 FROM door_events p WHERE p.device_id = e.device_id "
+                "AND p.status IN (?, ?) AND p.id < e.id) "
+                "ORDER BY e.available_at, e.id LIMIT 1",
+                (STATUS_PENDING, now, STATUS_PROCESSING, now, STATUS_PENDING, STATUS_PROCESSING)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE door_events SET status = ?, attempts = attempts + 1, leased_until = ?, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (STATUS_PROCESSING, now + self.visibility_timeout, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        event = dict(row)
+        if event["status"] == STATUS_PROCESSING:
+            logger.warning(f"事件 {event['id']} 可见性超时，重新领取")
+        event.update({"status": STATUS_PROCESSING, "attempts": event["attempts"] + 1, "started_at": event["started_at"] or now})
+        return event
+
+    def complete(self, event: Dict[str, Any], result: Optional[Dict[str, Any]] = None) -> bool:
+        """确认事件处理成功，事件已被其他工作线程重新领取时返回False"""
+        conn = self._conn()
+        cursor = conn.execute(
+            "UPDATE door_events SET status = ?, finished_at = ?, leased_until = NULL, result = ?, last_error = NULL "
+            "WHERE id = ? AND status = ? AND attempts = ?",
+            (STATUS_DONE, time.time(), json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+             event["id"], STATUS_PROCESSING, event["attempts"])
+        )
+        return cursor.rowcount == 1
+
+    def retry_delay(self, attempts: int) -> float:
+        """第attempts次失败后的退避时间（秒），带50%~100%的随机抖动"""
+        delay = min(INGESTION_RETRY_MAX_SECONDS, INGESTION_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+        return delay * (0.5 + random.random() / 2)
+
+    def fail(self, event: Dict[str, Any], error: str) -> str:
+        """
+        记录事件处理失败，未超过最大次数时按退避时间重新排队，否则标记为failed
+
+        Returns:
+            str: 事件的新状态（pending或failed），事件已被重新领取时返回processing
+        """
+        conn = self._conn()
+        now = time.time()
+        if event["attempts"] >= self.max_attempts:
+            status, available_at, finished_at = STATUS_FAILED, now, now
+        else:
+            status, available_at, finished_at = STATUS_PENDING, now + self.retry_delay(event["attempts"]), None
+        cursor = conn.execute(
+            "UPDATE door_events SET status = ?, available_at = ?, finished_at = ?, leased_until = NULL, last_error = ? "
+            "WHERE id = ? AND status = ? AND attempts = ?",
+            (status, available_at, finished_at, error[:2000], event["id"], STATUS_PROCESSING, event["attempts"])
+        )
+        return status if cursor.rowcount == 1 else STATUS_PROCESSING
+
+    def get_event(self, event_id: int) -> Optional[Dict[str, Any]]:
+        """查询事件状态"""
+        row = self._conn().execute("SELECT * FROM door_events WHERE id = ?", (event_id,)).fetchone()
+        if row is None:
+            return None
+        event = dict(row)
+        event["result"] = json.loads(event["result"]) if event["result"] else None
+        return event
+
+    def purge_finished(self, older_than: float = INGESTION_RETENTION_SECONDS) -> int:
+        """删除完成/失败超过保留时间的事件"""
+        cursor = self._conn().execute(
+            "DELETE FROM door_events WHERE status IN (?, ?) AND finished_at < ?",
+            (STATUS_DONE, STATUS_FAILED, time.time() - older_than)
+        )
+        return cursor.rowcount
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        队列指标
+
+        Returns:
+            Dict: 各状态事件数、depth、max_depth、utilization、等待中的设备数、最早待处理事件的等待秒数，
+                以及本进程的入队/拒绝计数
+        """
+        conn = self._conn()
+        now = time.time()
+        counts = {status: 0 for status in (STATUS_PENDING, STATUS_PROCESSING, STATUS_DONE, STATUS_FAILED)}
+        for status, count in conn.execute("SELECT status, COUNT(*) FROM door_events GROUP BY status"):
+            counts[status] = count
+        oldest, devices = conn.execute(
+            "SELECT MIN(enqueued_at), COUNT(DISTINCT device_id) FROM door_events WHERE status = ?", (STATUS_PENDING,)
+        ).fetchone()
+        depth = counts[STATUS_PENDING] + counts[STATUS_PROCESSING]
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "counts": counts,
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "utilization": round(depth / self.max_depth, 3) if self.max_depth else None,
+            "devices_waiting": devices,
+            "oldest_pending_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            **counters,
+        }
+
+
+def parse_detected_at(value: Any) -> Optional[datetime]:
+    """
+    解析事件的关门时间，不带时区时按UTC处理
+
+    Args:
+        value: ISO格式时间字符串，None或空字符串表示未提供
+
+    Returns:
+        Optional[datetime]: 带时区的时间，未提供时返回None
+
+    Raises:
+        ValueError: 不是ISO格式的时间字符串
+    """
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"detected_at必须是字符串: {value!r}")
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def process_door_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """默认事件处理函数：调用fridge_pipeline.process_door_close完成识别和数据库更新"""
+    from fridge_pipeline import process_door_close
+    detected_at = parse_detected_at(event.get("detected_at"))
+    return process_door_close(event["image_url"], event["device_id"], _get_recognizer(), detected_at=detected_at)
+
+
+_recognizer = None
+_recognizer_lock = threading.Lock()
+
+
+def _get_recognizer():
+    global _recognizer
+    if _recognizer is None:
+        with _recognizer_lock:
+            if _recognizer is None:
+                from freshtrack_ai_recognizer import FreshTrackItemRecognizer
+                _recognizer = FreshTrackItemRecognizer()
+    return _recognizer
+
+
+class IngestionWorkerPool:
+    """从IngestionQueue领取并处理事件的工作线程池"""
+
+    def __init__(
+        self,
+        queue: IngestionQueue,
+        handler: Optional[EventHandler] = None,
+        workers: Optional[int] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        poll_interval: float = INGESTION_POLL_INTERVAL
+    ):
+        """
+        初始化工作线程池
+
+        Args:
+            queue: 事件队列
+            handler: 事件处理函数，返回的dict中success为False或抛出异常时按失败重试，默认为process_door_event
+            workers: 工作线程数，默认读取INGESTION_WORKERS
+            rate_limiter: 开始处理事件前获取令牌的限流器，默认按INGESTION_EVENT_RATE创建（为0时不限流）
+            poll_interval: 队列为空时的轮询间隔（秒）
+        """
+        self.queue = queue
+        self.handler = handler or process_door_event
+        self.workers = INGESTION_WORKERS if workers is None else workers
+        if rate_limiter is None and INGESTION_EVENT_RATE > 0:
+            rate_limiter = RateLimiter(INGESTION_EVENT_RATE)
+        self.rate_limiter = rate_limiter
+        self.poll_interval = poll_interval
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._last_purge = 0.0
+        self._stats = {
+            "processed": 0,
+            "succeeded": 0,
+            "skipped": 0,
+            "retried": 0,
+            "failed": 0,
+            "lost_lease": 0,
+            "processing_seconds_total": 0.0,
+            "queue_wait_seconds_total": 0.0,
+        }
+
+    def start(self):
+        """启动工作线程，已启动时不重复启动"""
+        if self._threads:
+            return
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingestion-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"开关门事件工作线程池已启动: {self.workers} 个线程")
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止领取新事件，并等待正在处理的事件完成"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._maybe_purge()
+                if not self.run_once():
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                logger.error(f"工作线程异常: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def _maybe_purge(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < 60:
+                return
+            self._last_purge = now
+        purged = self.queue.purge_finished()
+        if purged:
+            logger.info(f"清理过期的开关门事件: {purged} 个")
+
+    def run_once(self) -> bool:
+        """
+        领取并处理一个事件
+
+        Returns:
+            bool: 是否处理了事件（队列中没有可处理事件时返回False）
+        """
+        event = self.queue.claim()
+        if event is None:
+            return False
+        # 领取后再限流，空轮询不消耗令牌；等待期间事件仍处于租约内
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        with self._lock:
+            self._busy += 1
+        start_time = time.time()
+        try:
+            result = self.handler(event)
+            error = None if result.get("success", True) else str(result.get("error") or "处理失败")
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        elapsed = time.time() - start_time
+
+        if error is None:
+            if self.queue.complete(event, result):
+                outcome = "succeeded"
+            else:
+                # 处理时间超过了可见性超时，事件已被其他工作线程重新领取，本次结果不再记录
+                outcome = "lost_lease"
+                logger.warning(f"事件 {event['id']}(设备 {event['device_id']}) 处理完成时租约已失效，结果被丢弃")
+        else:
+            status = self.queue.fail(event, error)
+            outcome = "failed" if status == STATUS_FAILED else "retried"
+            logger.warning(f"事件 {event['id']}(设备 {event['device_id']}) 第 {event['attempts']} 次处理失败: {error}，状态: {status}")
+
+        with self._lock:
+            self._busy -= 1
+            self._stats["processed"] += 1
+            self._stats[outcome] += 1
+            if result and result.get("skipped"):
+                self._stats["skipped"] += 1
+            self._stats["processing_seconds_total"] += elapsed
+            self._stats["queue_wait_seconds_total"] += max(0.0, event["started_at"] - event["enqueued_at"])
+        return True
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        工作线程池指标
+
+        Returns:
+            Dict: workers、busy_workers、running，以及本进程的处理计数（lost_lease为完成时租约已失效的事件数）、
+                平均处理耗时和平均排队时间
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            busy = self._busy
+        processed = stats["processed"]
+        return {
+            "workers": self.workers,
+            "busy_workers": busy,
+            "running": bool(self._threads) and not self._stop.is_set(),
+            "processed": processed,
+            "succeeded": stats["succeeded"],
+            "skipped": stats["skipped"],
+            "retried": stats["retried"],
+            "failed": stats["failed"],
+            "lost_lease": stats["lost_lease"],
+            "avg_processing_seconds": round(stats["processing_seconds_total"] / processed, 3) if processed else 0.0,
+            "avg_queue_wait_seconds": round(stats["queue_wait_seconds_total"] / processed, 3) if processed else 0.0,
+            "event_rate_limit": self.rate_limiter.rate if self.rate_limiter is not None else None,
+        }
+
+
+_default_queue: Optional[IngestionQueue] = None
+_default_queue_lock = threading.Lock()
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    """获取进程内共享的接入队列（按INGESTION_*环境变量创建）"""
+    global _default_queue
+    if _default_queue is None:
+        with _default_queue_lock:
+            if _default_queue is None:
+                _default_queue = IngestionQueue()
+    return _default_queue
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    pool = IngestionWorkerPool(get_ingestion_queue())
+    pool.start()
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"接入队列指标: {pool.queue.metrics()} {pool.metrics()}")
+    except KeyboardInterrupt:
+        pool.stop()
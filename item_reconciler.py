@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 本地物品对比模块
+在调用agent之前，用确定性规则对比【数据库中上次冰箱物品】和【本次识别结果】
+- 按名称/分类/子类别/品牌/位置重叠度计算匹配置信度
+- 高置信度匹配直接生成新增/更新/删除集合
+- 只有模棱两可的物品才交给LLM agent处理
+"""
+
+import os
+import logging
+from difflib import SequenceMatcher
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 匹配置信度阈值：高于该值直接认定为同一物品
+DEFAULT_CONFIDENCE_THRESHOLD = float(os.getenv("RECONCILE_CONFIDENCE_THRESHOLD", "0.75"))
+# 低于该值认为不可能是同一物品
+DEFAULT_MIN_SCORE = float(os.getenv("RECONCILE_MIN_SCORE", "0.35"))
+# 最佳候选与次佳候选得分差小于该值时视为有歧义
+DEFAULT_AMBIGUITY_MARGIN = float(os.getenv("RECONCILE_AMBIGUITY_MARGIN", "0.05"))
+
+# 各特征的权重，总和为1
+MATCH_WEIGHTS = {
+    "name": 0.45,
+    "category": 0.1,
+    "subcategory": 0.15,
+    "brand": 0.1,
+    "position": 0.2,
+}
+
+# 位置重叠度低于该值时认为物品被移动过
+POSITION_CHANGED_IOU = 0.9
+
+# 匹配成功后需要比较并同步的字段
+UPDATABLE_FIELDS = (
+    "subcategory", "brand", "position", "item_amount_desc",
+    "freshness", "expiry_estimate", "additional_info",
+)
+
+SIZE_DESC = {"large": "大", "medium": "中等", "small": "小"}
+
+
+class ReconcileResult:
+    """本地对比结果"""
+
+    def __init__(self):
+        self.to_add: List[Dict[str, Any]] = []
+        self.to_update: List[Tuple[int, Dict[str, Any]]] = []
+        self.to_delete: List[int] = []
+        self.unchanged: List[int] = []
+        # 需要交给agent处理的歧义物品
+        self.ambiguous_new: List[Dict[str, Any]] = []
+        self.ambiguous_existing: List[Dict[str, Any]] = []
+
+    @property
+    def has_ambiguity(self) -> bool:
+        return bool(self.ambiguous_new or self.ambiguous_existing)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "add": len(self.to_add),
+            "update": len(self.to_update),
+            "delete": len(self.to_delete),
+            "unchanged": len(self.unchanged),
+            "ambiguous_new": len(self.ambiguous_new),
+            "ambiguous_existing": len(self.ambiguous_existing),
+        }
+
+
+def normalize_new_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将识别结果转换为数据库字段格式（补全item_amount_desc和expiry_estimate）
+
+    Args:
+        item: 识别结果中的单个物品
+
+    Returns:
+        Dict: 规范化后的物品信息
+    """
+    normalized = dict(item)
+    additional_info = normalized.get("additional_info")
+    if isinstance(additional_info, dict) and not normalized.get("expiry_estimate"):
+        if additional_info.get("expiry_estimate"):
+            normalized["expiry_estimate"] = additional_info["expiry_estimate"]
+    if not normalized.get("item_amount_desc") and normalized.get("quantity") is not None:
+        desc = f"{normalized['quantity']}个"
+        size = SIZE_DESC.get(normalized.get("estimated_size") or "")
+        if size:
+            desc += f"，{size}大小"
+        normalized["item_amount_desc"] = desc
+    if not normalized.get("detected_at") and normalized.get("fridge_closed_time"):
+        normalized["detected_at"] = normalized["fridge_closed_time"]
+    return normalized
+
+
+def _text(value: Any) -> str:
+    return str(value).strip().lower() if value else ""
+
+
+def _name_similarity(a: Any, b: Any) -> float:
+    a, b = _text(a), _text(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if a in b or b in a:
+        return 0.85
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _field_similarity(a: Any, b: Any) -> float:
+    a, b = _text(a), _text(b)
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.5
+    return 1.0 if a == b else 0.0
+
+
+def _to_box(position: Any) -> Optional[Tuple[float, float, float, float]]:
+    if not isinstance(position, dict):
+        return None
+    try:
+        x = float(position.get("x"))  # type: ignore[arg-type]
+        y = float(position.get("y"))  # type: ignore[arg-type]
+        w = float(position.get("width"))  # type: ignore[arg-type]
+        h = float(position.get("height"))  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return None
+    if w <= 0 or h <= 0:
+        return None
+    return x, y, w, h
+
+
+def position_iou(a: Any, b: Any) -> Optional[float]:
+    """计算两个position的交并比，无法计算时返回None"""
+    box_a, box_b = _to_box(a), _to_box(b)
+    if box_a is None or box_b is None:
+        return None
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_score(existing: Dict[str, Any], new: Dict[str, Any]) -> float:
+    """
+    计算数据库物品与识别物品为同一物品的置信度
+
+    Args:
+        existing: 数据库中的物品
+        new: 本次识别的物品
+
+    Returns:
+        float: 0-1之间的匹配置信度
+    """
+    name_sim = _name_similarity(existing.get("name"), new.get("name"))
+    # 名称与分类都不相近时不可能是同一物品
+    if name_sim < 0.3 and _text(existing.get("category")) != _text(new.get("category")):
+        return 0.0
+
+    iou = position_iou(existing.get("position"), new.get("position"))
+    # 没有位置信息时给中性分，不奖励也不惩罚
+    position_sim = 0.5 if iou is None else iou
+
+    score = (
+        MATCH_WEIGHTS["name"] * name_sim
+        + MATCH_WEIGHTS["category"] * _field_similarity(existing.get("category"), new.get("category"))
+        + MATCH_WEIGHTS["subcategory"] * _field_similarity(existing.get("subcategory"), new.get("subcategory"))
+        + MATCH_WEIGHTS["brand"] * _field_similarity(existing.get("brand"), new.get("brand"))
+        + MATCH_WEIGHTS["position"] * position_sim
+    )
+    return round(score, 4)
+
+
+def diff_item_fields(existing: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """返回匹配物品中发生变化的字段"""
+    changes = {}
+    for field in UPDATABLE_FIELDS:
+        if field not in new or new[field] in (None, "", {}):
+            continue
+        if field == "position":
+            iou = position_iou(existing.get("position"), new["position"])
+            if iou is not None and iou >= POSITION_CHANGED_IOU:
+                continue
+        elif existing.get(field) == new[field]:
+            continue
+        changes[field] = new[field]
+    return changes
+
+
+def reconcile_items(
+    last_items: List[Dict[str, Any]],
+    new_items: List[Dict[str, Any]],
+    confidence_threshold: Optional[float] = None,
+    min_score: Optional[float] = None,
+    ambiguity_margin: Optional[float] = None,
+    device_id: Optional[str] = None,
+) -> ReconcileResult:
+    """
+    对比数据库物品和识别结果，生成新增/更新/删除集合
+
+    Args:
+        last_items: 数据库中上次冰箱物品（需包含id）
+        new_items: 本次识别结果
+        confidence_threshold: 直接认定为同一物品的置信度阈值
+        min_score: 低于该得分视为不同物品
+        ambiguity_margin: 最佳与次佳候选得分差小于该值时交给agent
+        device_id: 本次对比的设备ID，不提供时使用识别结果中的device_id；
+            两者都没有时无法确定对比范围，不生成删除集合
+
+    Returns:
+        ReconcileResult: 对比结果
+    """
+    threshold = DEFAULT_CONFIDENCE_THRESHOLD if confidence_threshold is None else confidence_threshold
+    low = DEFAULT_MIN_SCORE if min_score is None else min_score
+    margin = DEFAULT_AMBIGUITY_MARGIN if ambiguity_margin is None else ambiguity_margin
+
+    result = ReconcileResult()
+    normalized_new = [normalize_new_item(item) for item in new_items]
+    if device_id:
+        for item in normalized_new:
+            if not item.get("device_id"):
+                item["device_id"] = device_id
+
+    # 只在同一设备内匹配，避免误删其他冰箱的物品
+    device_ids = {device_id} if device_id else {item.get("device_id") for item in normalized_new if item.get("device_id")}
+    if device_ids:
+        last_items = [item for item in last_items if item.get("device_id") in device_ids]
+    else:
+        logger.warning("[reconcile_items] 无法确定设备范围，数据库中未匹配的物品不会被删除")
+
+    # 计算所有候选对的得分
+    scores: Dict[Tuple[int, int], float] = {}
+    for ni, new in enumerate(normalized_new):
+        for ei, existing in enumerate(last_items):
+            if new.get("device_id") and existing.get("device_id") not in (None, new.get("device_id")):
+                continue
+            score = match_score(existing, new)
+            if score >= low:
+                scores[(ni, ei)] = score
+
+    # 贪心分配：按得分从高到低确认一一对应关系
+    matched_new: Dict[int, int] = {}
+    matched_existing = set()
+    ambiguous_new = set()
+    for (ni, ei), score in sorted(scores.items(), key=lambda kv: kv[1], reverse=True):
+        if ni in matched_new or ni in ambiguous_new or ei in matched_existing:
+            continue
+        if score < threshold:
+            ambiguous_new.add(ni)
+            continue
+        rivals = [
+            s for (n2, e2), s in scores.items()
+            if (n2 == ni and e2 != ei and e2 not in matched_existing)
+            or (e2 == ei and n2 != ni and n2 not in matched_new)
+        ]
+        if rivals and score - max(rivals) < margin:
+            ambiguous_new.add(ni)
+            continue
+        matched_new[ni] = ei
+        matched_existing.add(ei)
+
+    for ni, new in enumerate(normalized_new):
+        if ni in matched_new:
+            existing = last_items[matched_new[ni]]
+            changes = diff_item_fields(existing, new)
+            if changes:
+                result.to_update.append((existing["id"], changes))
+            else:
+                result.unchanged.append(existing["id"])
+        elif ni in ambiguous_new:
+            result.ambiguous_new.append(new)
+        else:
+            result.to_add.append(new)
+
+    # 歧义物品的候选不能直接删除，交给agent判断
+    ambiguous_candidates = {ei for (ni, ei) in scores if ni in ambiguous_new}
+    for ei, existing in enumerate(last_items):
+        if ei in matched_existing:
+            continue
+        if ei in ambiguous_candidates:
+            result.ambiguous_existing.append(existing)
+        elif device_ids:
+            result.to_delete.append(existing["id"])
+
+    logger.info("[reconcile_items] 本地对比结果: %s", result.summary())
+    return result
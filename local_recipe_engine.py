@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 本地规则菜谱推荐
+基于离线菜谱库(recipe_corpus.json)和按食材建立的倒排索引，在本地毫秒级给出菜谱推荐：
+- 大模型超时或不可用时作为备用推荐
+- 请求指定fast_mode时直接使用，不调用大模型
+评分规则与系统提示词中的推荐优先级一致：需要注意/即将过期的食材优先、能消耗的食材越多越好、
+制作难度与餐次匹配、偏好菜系加分；素食和过敏原按dietary_preferences过滤（菜谱标记和每个必需/可选食材都检查），
+已过期食材不参与推荐
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECIPE_CORPUS_PATH = os.getenv(
+    "RECIPE_CORPUS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipe_corpus.json")
+)
+# 每次返回的菜谱数量
+LOCAL_RECIPE_LIMIT = int(os.getenv("LOCAL_RECIPE_LIMIT", "5"))
+# 必需食材的最低覆盖率，低于该值的菜谱不推荐
+LOCAL_RECIPE_MIN_COVERAGE = float(os.getenv("LOCAL_RECIPE_MIN_COVERAGE", "0.5"))
+
+# 菜谱库中的标准食材名 -> 冰箱物品名中可能出现的其他叫法（物品名包含标准名或任一别名即视为该食材）
+INGREDIENT_ALIASES = {
+    "番茄": ("西红柿", "圣女果", "tomato"),
+    "鸡蛋": ("土鸡蛋", "柴鸡蛋", "egg"),
+    "牛奶": ("纯牛奶", "鲜奶", "milk"),
+    "酸奶": ("yogurt",),
+    "奶酪": ("芝士", "cheese"),
+    "土豆": ("马铃薯", "洋芋", "potato"),
+    "包菜": ("卷心菜", "圆白菜", "甘蓝", "cabbage"),
+    "青菜": ("小白菜", "上海青", "油菜", "菠菜"),
+    "生菜": ("lettuce",),
+    "青椒": ("辣椒", "彩椒", "甜椒"),
+    "虾": ("虾仁", "大虾", "基围虾", "shrimp"),
+    "鱼": ("鲈鱼", "鲫鱼", "鳕鱼", "fish"),
+    "鸡肉": ("鸡胸肉", "鸡腿", "鸡丁", "鸡块", "chicken"),
+    "鸡翅": ("翅中", "鸡翅中"),
+    "猪肉": ("瘦肉", "肉丝", "肉末", "五花肉", "pork"),
+    "牛肉": ("牛腩", "牛排", "beef"),
+    "排骨": ("猪排骨", "肋排"),
+    "火腿": ("火腿肠", "ham"),
+    "面包": ("吐司", "bread"),
+    "面条": ("挂面", "拉面", "noodle"),
+    "米饭": ("剩饭",),
+    "苹果": ("apple",),
+    "香蕉": ("banana",),
+}
+
+# 过敏原标签 -> 用户可能填写的叫法
+ALLERGEN_ALIASES = {
+    "peanuts": ("peanut", "花生"),
+    "eggs": ("egg", "鸡蛋", "蛋"),
+    "milk": ("dairy", "lactose", "牛奶", "乳制品", "乳糖", "奶"),
+    "soy": ("soybean", "大豆", "黄豆", "豆制品"),
+    "wheat": ("gluten", "小麦", "面筋", "麸质"),
+    "shellfish": ("shrimp", "crab", "seafood", "虾", "蟹", "贝类", "海鲜"),
+    "fish": ("鱼",),
+}
+
+# 非素食食材，素食偏好下即使菜谱标记为素食，含这些食材的必需食材也不推荐、可选食材不使用
+NON_VEGETARIAN_INGREDIENTS = frozenset({
+    "猪肉", "五花肉", "排骨", "牛肉", "鸡肉", "鸡胸肉", "鸡翅", "火腿", "培根", "鱼", "虾", "虾皮",
+})
+
+# 标准食材名 -> 过敏原标签，与菜谱的allergens一起检查，必需食材和可选食材都适用
+INGREDIENT_ALLERGENS = {
+    "鸡蛋": ("eggs",),
+    "皮蛋": ("eggs",),
+    "牛奶": ("milk",),
+    "酸奶": ("milk",),
+    "奶酪": ("milk",),
+    "黄油": ("milk",),
+    "面包": ("wheat",),
+    "面条": ("wheat",),
+    "面粉": ("wheat",),
+    "饼皮": ("wheat",),
+    "燕麦": ("wheat",),
+    "豆腐": ("soy",),
+    "花生": ("peanuts",),
+    "虾": ("shellfish",),
+    "虾皮": ("shellfish",),
+    "鱼": ("fish",),
+}
+
+# 新鲜度分类 -> 食材紧急程度权重，expired_items不参与推荐
+URGENCY_WEIGHTS = {
+    "needs_attention": 3,
+    "expiring_soon": 2,
+    "fresh_items": 1,
+}
+
+# 餐次 -> 制作难度的加减分
+DIFFICULTY_FIT = {
+    "breakfast": {"简单": 1.0, "中等": -1.0, "复杂": -3.0},
+    "lunch": {"简单": 0.5, "中等": 0.0, "复杂": -1.0},
+    "dinner": {"简单": 0.0, "中等": 0.5, "复杂": 0.0},
+}
+
+
+class LocalRecipeEngine:
+    """离线菜谱库 + 食材倒排索引"""
+
+    def __init__(self, recipes: List[Dict[str, Any]]):
+        """
+        初始化本地推荐引擎
+
+        Args:
+            recipes: 菜谱列表，格式与recipe_corpus.json中的元素相同
+        """
+        self.recipes = recipes
+        # 标准食材名 -> 用到该食材的菜谱下标
+        self.index: Dict[str, Set[int]] = {}
+        for position, recipe in enumerate(recipes):
+            for ingredient in list(recipe.get("ingredients", [])) + list(recipe.get("optional_ingredients", [])):
+                self.index.setdefault(ingredient, set()).add(position)
+        # 标准食材名及其别名，匹配物品名时按长度从长到短检查
+        self._terms: List[Tuple[str, str]] = sorted(
+            [(ingredient, ingredient) for ingredient in self.index]
+            + [(alias.lower(), ingredient) for ingredient, aliases in INGREDIENT_ALIASES.items()
+               if ingredient in self.index for alias in aliases],
+            key=lambda term: len(term[0]),
+            reverse=True
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocalRecipeEngine":
+        """从JSON文件加载菜谱库"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match_ingredients(self, item_name: Optional[str]) -> Set[str]:
+        """
+        返回冰箱物品名对应的标准食材名
+
+        Args:
+            item_name: 物品名称，例如"纯牛奶"、"西红柿"
+
+        Returns:
+            Set[str]: 命中的标准食材名，可能为空
+        """
+        if not item_name:
+            return set()
+        name = item_name.lower()
+        return {ingredient for term, ingredient in self._terms if term in name}
+
+    def _available_ingredients(self, categorized_foods: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Tuple[int, List[str]]]:
+        """标准食材名 -> (最高紧急程度权重, 对应的冰箱物品名)"""
+        available: Dict[str, Tuple[int, List[str]]] = {}
+        for key, weight in URGENCY_WEIGHTS.items():
+            for item in categorized_foods.get(key, []):
+                name = item.get("name")
+                for ingredient in self.match_ingredients(name):
+                    best_weight, names = available.get(ingredient, (0, []))
+                    if name not in names:
+                        names = names + [name]
+                    available[ingredient] = (max(best_weight, weight), names)
+        return available
+
+    def recommend(
+        self,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        根据新鲜度分类后的食材推荐菜谱
+
+        Args:
+            categorized_foods: MealRecommendationAgent.analyze_food_freshness的结果
+            meal_type: 餐次类型 (breakfast/lunch/dinner)
+            dietary_preferences: 饮食偏好（vegetarian、allergies、preferred_cuisine）
+            limit: 返回数量，默认读取LOCAL_RECIPE_LIMIT
+
+        Returns:
+            List[Dict]: 按priority_score从高到低排列的菜谱，格式与meal_recommendations中的元素相同，
+                另外包含missing_ingredients（冰箱中缺少的必需食材）和source
+        """
+        start_time = time.perf_counter()
+        limit = LOCAL_RECIPE_LIMIT if limit is None else limit
+        preferences = dietary_preferences or {}
+        blocked_allergens = normalize_allergies(preferences.get("allergies"))
+        allergy_terms = [str(term).lower() for term in preferences.get("allergies") or [] if term]
+        preferred_cuisine = {str(cuisine).lower() for cuisine in preferences.get("preferred_cuisine") or []}
+
+        available = self._available_ingredients(categorized_foods)
+        candidates: Set[int] = set()
+        for ingredient in available:
+            candidates |= self.index.get(ingredient, set())
+
+        vegetarian = bool(preferences.get("vegetarian"))
+
+        def excluded(ingredient: str) -> bool:
+            # 除标准食材名外也检查对应的冰箱物品名，例如过敏填写"虾"时排除"虾皮"
+            if vegetarian and ingredient in NON_VEGETARIAN_INGREDIENTS:
+                return True
+            if blocked_allergens & set(INGREDIENT_ALLERGENS.get(ingredient, ())):
+                return True
+            names = [ingredient] + available.get(ingredient, (0, []))[1]
+            return any(term in str(name).lower() for term in allergy_terms for name in names)
+
+        scored = []
+        for position in candidates:
+            recipe = self.recipes[position]
+            if vegetarian and not recipe.get("vegetarian"):
+                continue
+            if blocked_allergens & set(recipe.get("allergens", [])):
+                continue
+            ingredients = list(recipe.get("ingredients", []))
+            if any(excluded(ingredient) for ingredient in ingredients):
+                continue
+            required_hits = [ingredient for ingredient in ingredients if ingredient in available]
+            coverage = len(required_hits) / len(ingredients) if ingredients else 0.0
+            if coverage < LOCAL_RECIPE_MIN_COVERAGE:
+                continue
+            # 不符合饮食偏好的可选食材不使用，菜谱仍按必需食材推荐
+            optional_hits = [
+                ingredient for ingredient in recipe.get("optional_ingredients", [])
+                if ingredient in available and not excluded(ingredient)
+            ]
+            used = required_hits + optional_hits
+
+            score = coverage * 4 + len(optional_hits) * 0.5
+            # 每个需要注意的食材 +2、即将过期的食材 +1，新鲜食材不额外加分
+            score += sum(available[ingredient][0] - 1 for ingredient in used)
+            meal_types = recipe.get("meal_types") or []
+            if meal_type:
+                score += 1.0 if meal_type in meal_types else -2.0
+                score += DIFFICULTY_FIT.get(meal_type, {}).get(recipe.get("difficulty"), 0.0)
+            if preferred_cuisine and recipe.get("cuisine") in preferred_cuisine:
+                score += 1.0
+            scored.append((score, coverage, position, used, required_hits))
+
+        scored.sort(key=lambda entry: (-entry[0], -entry[1], entry[2]))
+        results = [
+            self._to_recommendation(self.recipes[position], score, used, required_hits, available)
+            for score, _, position, used, required_hits in scored[:limit]
+        ]
+        logger.info(f"本地菜谱推荐完成: {len(candidates)} 个候选, 返回 {len(results)} 个, 耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms")
+        return results
+
+    def _to_recommendation(
+        self,
+        recipe: Dict[str, Any],
+        score: float,
+        used: List[str],
+        required_hits: List[str],
+        available: Dict[str, Tuple[int, List[str]]]
+    ) -> Dict[str, Any]:
+        main_ingredients = []
+        uses_expiring_items = []
+        for ingredient in used:
+            weight, names = available[ingredient]
+            main_ingredients.extend(name for name in names if name not in main_ingredients)
+            if weight > URGENCY_WEIGHTS["fresh_items"]:
+                uses_expiring_items.extend(name for name in names if name not in uses_expiring_items)
+        return {
+            "recipe_name": recipe.get("recipe_name"),
+            "main_ingredients": main_ingredients,
+            "difficulty": recipe.get("difficulty"),
+            "cooking_time": recipe.get("cooking_time"),
+            "nutrition_benefits": recipe.get("nutrition_benefits"),
+            "priority_score": max(1, min(10, round(score))),
+            "uses_expiring_items": uses_expiring_items,
+            "recipe_steps": list(recipe.get("recipe_steps", [])),
+            "missing_ingredients": [ingredient for ingredient in recipe.get("ingredients", []) if ingredient not in required_hits],
+            "source": "local",
+        }
+
+
+def normalize_allergies(allergies: Optional[Iterable[Any]]) -> Set[str]:
+    """
+    将用户填写的过敏信息转换为菜谱库中的过敏原标签
+
+    Args:
+        allergies: 例如 ["peanuts", "鸡蛋"]
+
+    Returns:
+        Set[str]: 过敏原标签，例如 {"peanuts", "eggs"}
+    """
+    tags = set()
+    for allergy in allergies or []:
+        value = str(allergy).strip().lower()
+        if not value:
+            continue
+        for tag, aliases in ALLERGEN_ALIASES.items():
+            if value == tag or value in aliases:
+                tags.add(tag)
+    return tags
+
+
+_default_engine: Optional[LocalRecipeEngine] = None
+_default_engine_lock = threading.Lock()
+
+
+def get_local_recipe_engine() -> LocalRecipeEngine:
+    """获取进程内共享的本地推荐引擎，首次调用时加载RECIPE_CORPUS_PATH；加载失败时使用空菜谱库"""
+    global _default_engine
+    if _default_engine is None:
+        with _default_engine_lock:
+            if _default_engine is None:
+                try:
+                    _default_engine = LocalRecipeEngine.from_file(RECIPE_CORPUS_PATH)
+                    logger.info(f"本地菜谱库加载完成: {len(_default_engine.recipes)} 个菜谱")
+                except Exception as e:
+                    logger.error(f"本地菜谱库加载失败: {e}")
+                    _default_engine = LocalRecipeEngine([])
+    return _default_engine
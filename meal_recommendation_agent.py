@@ -7,28 +7,41 @@ FreshTrackAI - 菜谱推荐代理模块
 import os
 import json
 import logging
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Union, Iterator, Tuple
 from datetime import datetime, timezone, timedelta
-from tencentcloud.common import credential
-from tencentcloud.common.profile.client_profile import ClientProfile
-from tencentcloud.common.profile.http_profile import HttpProfile
 from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentCloudSDKException
-from tencentcloud.hunyuan.v20230901 import hunyuan_client, models
+from freshness_rules import EXPIRING_SOON_DAYS, NEEDS_ATTENTION_DAYS, EXPIRED_DAYS
+from hunyuan_pool import get_hunyuan_client, chat_completions, achat_completions, stream_chat_completions
+from recommendation_cache import RecommendationCache, compute_inventory_fingerprint, get_recommendation_cache
+from local_recipe_engine import LocalRecipeEngine, LOCAL_RECIPE_LIMIT, get_local_recipe_engine
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# shortlist模式下交给模型排序的本地候选菜谱数量
+RECOMMENDATION_SHORTLIST_SIZE = int(os.getenv("RECOMMENDATION_SHORTLIST_SIZE", "8"))
+
 class MealRecommendationAgent:
     """FreshTrack菜谱推荐代理 - 基于腾讯混元大模型"""
     
-    def __init__(self, secret_id: Optional[str] = None, secret_key: Optional[str] = None):
+    def __init__(
+        self,
+        secret_id: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        recommendation_cache: Optional[RecommendationCache] = None,
+        enable_cache: bool = True,
+        local_engine: Optional[LocalRecipeEngine] = None
+    ):
         """
         初始化推荐代理
         
         Args:
             secret_id: 腾讯云Secret ID，如果不提供则从环境变量获取
             secret_key: 腾讯云Secret Key，如果不提供则从环境变量获取
+            recommendation_cache: 推荐结果缓存，不提供时使用按RECOMMENDATION_CACHE_*环境变量创建的共享缓存
+            enable_cache: 是否启用推荐结果缓存
+            local_engine: 本地规则推荐引擎，用于fast_mode和模型失败时的备用推荐，不提供时使用共享的recipe_corpus.json引擎
         """
         self.secret_id = secret_id or os.getenv("TENCENTCLOUD_SECRET_ID")
         self.secret_key = secret_key or os.getenv("TENCENTCLOUD_SECRET_KEY")
@@ -36,19 +49,16 @@ class MealRecommendationAgent:
         if not self.secret_id or not self.secret_key:
             raise ValueError("请设置腾讯云API密钥环境变量或传入参数")
         
-        # 初始化腾讯云客户端
+        # 获取进程内共享的腾讯云客户端
         try:
-            cred = credential.Credential(self.secret_id, self.secret_key)
-            httpProfile = HttpProfile()
-            httpProfile.endpoint = "hunyuan.tencentcloudapi.com"
-            httpProfile.reqTimeout = 120
-            clientProfile = ClientProfile()
-            clientProfile.httpProfile = httpProfile
-            self.client = hunyuan_client.HunyuanClient(cred, "", clientProfile)
+            self.client = get_hunyuan_client(self.secret_id, self.secret_key)
             logger.info("腾讯混元客户端初始化成功")
         except Exception as e:
             logger.error(f"腾讯混元客户端初始化失败: {e}")
             raise
+        
+        self.cache = (recommendation_cache or get_recommendation_cache()) if enable_cache else None
+        self.local_engine = local_engine or get_local_recipe_engine()
     
     def get_system_prompt(self) -> str:
         """获取系统提示词"""
@@ -154,6 +164,16 @@ class MealRecommendationAgent:
 4. 能同时消耗多种食材的菜谱优先
 
 用中文回答，语气专业且温馨。
+"""
+
+    def get_shortlist_system_prompt(self) -> str:
+        """获取shortlist模式的系统提示词（只对本地候选菜谱排序和调整）"""
+        return f"""
+你是FreshTrackAI的营养师。用户消息中给出了冰箱食材和本地筛选出的候选菜谱（编号r1、r2...）。
+请结合用户请求从候选菜谱中选出最多{LOCAL_RECIPE_LIMIT}个并按推荐程度排序：优先消耗需要注意和即将过期的食材，兼顾营养搭配和制作难度。
+只能从候选中选择，不要编造新菜谱；缺少食材时可以在adaptation中建议用冰箱里的其他食材替换。
+只返回JSON:
+{{"message": "一句友好的回复", "picks": [{{"id": "r1", "priority_score": 1到10的数字, "adaptation": "简短的调整建议，可为空"}}], "tips": ["食材管理建议"]}}
 """
 
     def analyze_food_freshness(self, food_items: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
@@ -184,30 +204,30 @@ class MealRecommendationAgent:
                 freshness = item.get('freshness', 'good')
                 
                 # 分类逻辑
-                if days_in_fridge >= 10 or freshness == 'poor':
+                if days_in_fridge >= EXPIRED_DAYS or freshness == 'poor':
                     categorized_foods["expired_items"].append({
                         "id": item.get('id'),
                         "name": item.get('name'),
                         "category": item.get('category'),
-                        "days_expired": max(0, days_in_fridge - 7),
+                        "days_expired": max(0, days_in_fridge - NEEDS_ATTENTION_DAYS),
                         "action_needed": "清理"
                     })
-                elif days_in_fridge >= 7 or freshness == 'fair':
+                elif days_in_fridge >= NEEDS_ATTENTION_DAYS or freshness == 'fair':
                     categorized_foods["needs_attention"].append({
                         "id": item.get('id'),
                         "name": item.get('name'),
                         "category": item.get('category'),
                         "freshness": freshness,
-                        "days_remaining": max(0, 10 - days_in_fridge),
+                        "days_remaining": max(0, EXPIRED_DAYS - days_in_fridge),
                         "urgency": "high",
                         "put_in_time": item.get('put_in_time')
                     })
-                elif days_in_fridge >= 3:
+                elif days_in_fridge >= EXPIRING_SOON_DAYS:
                     categorized_foods["expiring_soon"].append({
                         "id": item.get('id'),
                         "name": item.get('name'),
                         "category": item.get('category'),
-                        "days_remaining": max(0, 7 - days_in_fridge),
+                        "days_remaining": max(0, NEEDS_ATTENTION_DAYS - days_in_fridge),
                         "urgency": "medium" if days_in_fridge < 6 else "high",
                         "put_in_time": item.get('put_in_time')
                     })
@@ -237,7 +257,11 @@ class MealRecommendationAgent:
         user_message: str,
         device_id: Optional[str] = None,
         meal_type: Optional[str] = None,
-        dietary_preferences: Optional[Dict[str, Any]] = None
+        dietary_preferences: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        inventory_fingerprint: Optional[str] = None,
+        fast_mode: bool = False,
+        shortlist_mode: bool = False
     ) -> Dict[str, Any]:
         """
         推荐菜谱
@@ -248,27 +272,224 @@ class MealRecommendationAgent:
             device_id: 设备ID
             meal_type: 餐次类型 (breakfast/lunch/dinner)
             dietary_preferences: 饮食偏好
+            use_cache: 是否使用推荐结果缓存，食材和请求参数都未变化时不调用模型
+            inventory_fingerprint: 已知的库存指纹（如设备库存快照中的指纹），不提供时根据food_items计算
+            fast_mode: 只使用本地规则推荐，不调用模型
+            shortlist_mode: 先用本地菜谱库筛选候选菜谱，模型只负责排序和调整，提示词和输出都更短；
+                没有候选菜谱时按普通模式请求
             
         Returns:
-            Dict: 推荐结果
+            Dict: 推荐结果，命中缓存时cache_hit为True；recommendation_source为local（本地推荐）或shortlist
         """
+        categorized_foods = {}
         try:
             logger.info(f"开始生成菜谱推荐，设备ID: {device_id}")
             
+            if fast_mode:
+                return self._create_local_response(self.analyze_food_freshness(food_items), device_id, meal_type, dietary_preferences)
+            
+            mode = "shortlist" if shortlist_mode else None
+            cache_key = self._get_cache_key(food_items, user_message, device_id, meal_type, dietary_preferences, inventory_fingerprint, mode) if use_cache else None
+            cached_result = self._get_cached_result(cache_key)
+            if cached_result is not None:
+                return cached_result
+            
             # 分析食材新鲜度
             categorized_foods = self.analyze_food_freshness(food_items)
             
-            # 构建食材上下文
-            food_context = self._build_food_context(food_items, categorized_foods)
+            # 构建请求参数
+            candidates = self._shortlist_candidates(categorized_foods, meal_type, dietary_preferences) if shortlist_mode else []
+            if candidates:
+                params = self._build_shortlist_params(categorized_foods, candidates, user_message, meal_type, dietary_preferences)
+            else:
+                params = self._build_request_params(food_items, categorized_foods, user_message, meal_type, dietary_preferences)
             
-            # 构建用户偏好上下文
-            preference_context = self._build_preference_context(meal_type, dietary_preferences)
+            # 发送请求
+            resp = chat_completions(params, client=self.client)
             
-            # 创建请求对象
-            req = models.ChatCompletionsRequest()
+            if candidates:
+                result = self._handle_shortlist_response(resp, categorized_foods, candidates, device_id, meal_type, dietary_preferences)
+            else:
+                result = self._handle_response(resp, categorized_foods, device_id, meal_type, dietary_preferences)
+            if cache_key:
+                self.cache.set(cache_key, result, food_items) # type: ignore
+            return result
+                
+        except Exception as e:
+            return self._create_error_response(e, categorized_foods, device_id, meal_type, dietary_preferences)
+
+    async def arecommend_meals(
+        self,
+        food_items: List[Dict[str, Any]],
+        user_message: str,
+        device_id: Optional[str] = None,
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        inventory_fingerprint: Optional[str] = None,
+        fast_mode: bool = False,
+        shortlist_mode: bool = False
+    ) -> Dict[str, Any]:
+        """
+        推荐菜谱（异步版本，模型请求经hunyuan_pool的异步HTTP传输发送，排队和等待响应时不占用线程）
+        
+        参数和返回值与recommend_meals相同
+        """
+        categorized_foods = {}
+        try:
+            logger.info(f"开始异步生成菜谱推荐，设备ID: {device_id}")
+            if fast_mode:
+                return self._create_local_response(self.analyze_food_freshness(food_items), device_id, meal_type, dietary_preferences)
+            mode = "shortlist" if shortlist_mode else None
+            cache_key = self._get_cache_key(food_items, user_message, device_id, meal_type, dietary_preferences, inventory_fingerprint, mode) if use_cache else None
+            cached_result = self._get_cached_result(cache_key)
+            if cached_result is not None:
+                return cached_result
+            categorized_foods = self.analyze_food_freshness(food_items)
+            candidates = self._shortlist_candidates(categorized_foods, meal_type, dietary_preferences) if shortlist_mode else []
+            if candidates:
+                params = self._build_shortlist_params(categorized_foods, candidates, user_message, meal_type, dietary_preferences)
+                resp = await achat_completions(params, client=self.client)
+                result = self._handle_shortlist_response(resp, categorized_foods, candidates, device_id, meal_type, dietary_preferences)
+            else:
+                params = self._build_request_params(food_items, categorized_foods, user_message, meal_type, dietary_preferences)
+                resp = await achat_completions(params, client=self.client)
+                result = self._handle_response(resp, categorized_foods, device_id, meal_type, dietary_preferences)
+            if cache_key:
+                self.cache.set(cache_key, result, food_items) # type: ignore
+            return result
+        except Exception as e:
+            return self._create_error_response(e, categorized_foods, device_id, meal_type, dietary_preferences)
+
+    def recommend_meals_stream(
+        self,
+        food_items: List[Dict[str, Any]],
+        user_message: str,
+        device_id: Optional[str] = None,
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式推荐菜谱
+        
+        先立即返回本地计算的食材分类和提醒，再在模型生成过程中逐个返回完整的菜谱
+        
+        Args:
+            参数与recommend_meals相同
             
-            # 构建完整的用户提示
-            user_prompt = f"""
+        Yields:
+            Tuple[str, Dict]: (事件名, 数据)
+                - inventory: food_inventory和food_alerts（本地计算）
+                - recipe: 单个菜谱，与meal_recommendations中的元素格式相同
+                - done: 完整推荐结果，格式与recommend_meals相同
+                - error: 失败时的备用响应
+        """
+        categorized_foods = self.analyze_food_freshness(food_items)
+        total_items = sum(len(items) for items in categorized_foods.values())
+        yield "inventory", {
+            "device_id": device_id,
+            "food_inventory": {"total_items": total_items, **categorized_foods},
+            "food_alerts": self._build_food_alerts(categorized_foods, [])
+        }
+        
+        try:
+            logger.info(f"开始流式生成菜谱推荐，设备ID: {device_id}")
+            params = self._build_request_params(food_items, categorized_foods, user_message, meal_type, dietary_preferences)
+            recipe_parser = RecipeStreamParser()
+            content_parts = []
+            usage = {}
+            for chunk in stream_chat_completions(params, client=self.client):
+                choices = chunk.get("Choices") or []
+                delta = (choices[0].get("Delta") or {}).get("Content", "") if choices else ""
+                if delta:
+                    content_parts.append(delta)
+                    for recipe in recipe_parser.feed(delta):
+                        yield "recipe", recipe
+                if chunk.get("Usage"):
+                    usage = chunk["Usage"]
+            
+            content = "".join(content_parts)
+            logger.info(f"流式响应结束，长度: {len(content)} 字符")
+            result = self._parse_response(content, categorized_foods)
+            result.update({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "device_id": device_id,
+                "model": "hunyuan-lite",
+                "api_usage": {
+                    "prompt_tokens": usage.get("PromptTokens", 0),
+                    "completion_tokens": usage.get("CompletionTokens", 0),
+                    "total_tokens": usage.get("TotalTokens", 0)
+                }
+            })
+            yield "done", result
+        except Exception as e:
+            yield "error", self._create_error_response(e, categorized_foods, device_id, meal_type, dietary_preferences)
+
+    def _get_cache_key(
+        self,
+        food_items: List[Dict[str, Any]],
+        user_message: str,
+        device_id: Optional[str],
+        meal_type: Optional[str],
+        dietary_preferences: Optional[Dict[str, Any]],
+        inventory_fingerprint: Optional[str] = None,
+        mode: Optional[str] = None
+    ) -> Optional[str]:
+        """根据库存指纹和请求参数生成缓存键，未启用缓存时返回None"""
+        if self.cache is None:
+            return None
+        fingerprint = inventory_fingerprint or compute_inventory_fingerprint(food_items)
+        return self.cache.make_key(device_id, fingerprint, user_message, meal_type, dietary_preferences, mode)
+
+    def get_cached_recommendation(
+        self,
+        device_id: Optional[str],
+        inventory_fingerprint: str,
+        user_message: str,
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None,
+        shortlist_mode: bool = False,
+        fast_mode: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        只根据库存指纹查询推荐缓存，不需要先读取食材列表
+        fast_mode与recommend_meals一致，不读取模型推荐的缓存
+
+        Returns:
+            Dict: 命中时返回推荐结果，否则返回None
+        """
+        if fast_mode:
+            return None
+        mode = "shortlist" if shortlist_mode else None
+        cache_key = self._get_cache_key([], user_message, device_id, meal_type, dietary_preferences, inventory_fingerprint, mode)
+        return self._get_cached_result(cache_key)
+
+    def _get_cached_result(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not cache_key:
+            return None
+        cached = self.cache.get(cache_key) # type: ignore
+        if cached is not None:
+            logger.info("命中菜谱推荐缓存，跳过模型调用")
+            cached["api_usage"] = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        return cached
+
+    def _build_request_params(
+        self,
+        food_items: List[Dict[str, Any]],
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        user_message: str,
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """构建菜谱推荐请求参数"""
+        # 构建食材上下文
+        food_context = self._build_food_context(food_items, categorized_foods)
+        
+        # 构建用户偏好上下文
+        preference_context = self._build_preference_context(meal_type, dietary_preferences)
+        
+        # 构建完整的用户提示
+        user_prompt = f"""
 当前用户请求: {user_message}
 
 冰箱食材情况:
@@ -279,62 +500,209 @@ class MealRecommendationAgent:
 
 请根据以上信息，提供专业的菜谱推荐和食材管理建议。
 """
+        
+        return {
+            "Model": "hunyuan-lite",  # 使用hunyuan-lite模型
+            "Messages": [
+                {
+                    "Role": "system",
+                    "Content": self.get_system_prompt()
+                },
+                {
+                    "Role": "user",
+                    "Content": user_prompt
+                }
+            ],
+            "Stream": False,
+            "Temperature": 0.3,  # 稍微降低随机性，保持创意
+            "TopP": 0.9
+        }
+
+    def _handle_response(
+        self,
+        resp: Any,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        device_id: Optional[str],
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """处理ChatCompletions响应，解析推荐结果并添加元数据"""
+        if hasattr(resp, 'Choices') and resp.Choices:
+            content = resp.Choices[0].Message.Content
+            logger.info(f"收到API响应，长度: {len(content)} 字符")
             
-            # 构建请求参数
-            params = {
-                "Model": "hunyuan-lite",  # 使用hunyuan-lite模型
-                "Messages": [
-                    {
-                        "Role": "system",
-                        "Content": self.get_system_prompt()
-                    },
-                    {
-                        "Role": "user",
-                        "Content": user_prompt
-                    }
-                ],
-                "Stream": False,
-                "Temperature": 0.3,  # 稍微降低随机性，保持创意
-                "TopP": 0.9
-            }
-            
-            req.from_json_string(json.dumps(params))
-            
-            # 发送请求
-            resp = self.client.ChatCompletions(req)
+            # 解析JSON响应
+            parsed_result = self._parse_response(content, categorized_foods)
             
-            # 处理响应
-            if hasattr(resp, 'Choices') and resp.Choices: # pyright: ignore[reportAttributeAccessIssue]
-                content = resp.Choices[0].Message.Content # type: ignore
-                logger.info(f"收到API响应，长度: {len(content)} 字符")
-                
-                # 解析JSON响应
-                parsed_result = self._parse_response(content, categorized_foods)
-                
-                # 添加元数据
-                parsed_result.update({
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "device_id": device_id,
-                    "model": "hunyuan-lite",
-                    "api_usage": {
-                        "prompt_tokens": getattr(resp.Usage, 'PromptTokens', 0) if hasattr(resp, 'Usage') else 0, # pyright: ignore[reportAttributeAccessIssue]
-                        "completion_tokens": getattr(resp.Usage, 'CompletionTokens', 0) if hasattr(resp, 'Usage') else 0, # pyright: ignore[reportAttributeAccessIssue]
-                        "total_tokens": getattr(resp.Usage, 'TotalTokens', 0) if hasattr(resp, 'Usage') else 0 # pyright: ignore[reportAttributeAccessIssue]
-                    }
-                })
-                
-                return parsed_result
+            # 添加元数据
+            parsed_result.update({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "device_id": device_id,
+                "model": "hunyuan-lite",
+                "api_usage": self._get_api_usage(resp)
+            })
             
-            else:
-                logger.error("API响应格式异常")
-                return self._create_fallback_response(categorized_foods, device_id, "API响应格式异常")
-                
-        except TencentCloudSDKException as e:
-            logger.error(f"腾讯云API错误: {e.message}")
-            return self._create_fallback_response(categorized_foods if 'categorized_foods' in locals() else {}, device_id, f"腾讯云API错误: {e.message}")
+            return parsed_result
+        
+        logger.error("API响应格式异常")
+        return self._create_fallback_response(categorized_foods, device_id, "API响应格式异常", meal_type, dietary_preferences)
+
+    def _get_api_usage(self, resp: Any) -> Dict[str, int]:
+        """从ChatCompletions响应中读取token用量"""
+        return {
+            "prompt_tokens": getattr(resp.Usage, 'PromptTokens', 0) if hasattr(resp, 'Usage') else 0,
+            "completion_tokens": getattr(resp.Usage, 'CompletionTokens', 0) if hasattr(resp, 'Usage') else 0,
+            "total_tokens": getattr(resp.Usage, 'TotalTokens', 0) if hasattr(resp, 'Usage') else 0
+        }
+
+    def _shortlist_candidates(
+        self,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        meal_type: Optional[str],
+        dietary_preferences: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """用本地菜谱库筛选候选菜谱，出错时返回空列表（按普通模式请求）"""
+        try:
+            return self.local_engine.recommend(categorized_foods, meal_type, dietary_preferences, limit=RECOMMENDATION_SHORTLIST_SIZE)
         except Exception as e:
-            logger.error(f"推荐过程异常: {str(e)}")
-            return self._create_fallback_response(categorized_foods if 'categorized_foods' in locals() else {}, device_id, f"推荐过程异常: {str(e)}")
+            logger.error(f"本地候选菜谱筛选异常: {e}")
+            return []
+
+    def _build_shortlist_params(
+        self,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        candidates: List[Dict[str, Any]],
+        user_message: str,
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """构建shortlist模式的请求参数：只包含食材名称、新鲜度分类和候选菜谱摘要"""
+        food_lines = []
+        for key, label in (("needs_attention", "需要注意"), ("expiring_soon", "即将过期"), ("fresh_items", "新鲜")):
+            names = [str(item.get('name')) for item in categorized_foods.get(key, [])]
+            if names:
+                food_lines.append(f"{label}: {'、'.join(names)}")
+        candidate_lines = ["编号|菜名|难度|时间|使用食材|缺少食材"]
+        for index, recipe in enumerate(candidates):
+            candidate_lines.append("|".join([
+                f"r{index + 1}",
+                str(recipe.get('recipe_name')),
+                str(recipe.get('difficulty')),
+                str(recipe.get('cooking_time')),
+                "、".join(recipe.get('main_ingredients', [])) or "无",
+                "、".join(recipe.get('missing_ingredients', [])) or "无",
+            ]))
+        preference_context = self._build_preference_context(meal_type, dietary_preferences).strip().replace("\n", "；")
+        food_context = "\n".join(food_lines) or "无"
+        candidate_context = "\n".join(candidate_lines)
+        
+        user_prompt = f"""用户请求: {user_message}
+用户偏好: {preference_context}
+
+冰箱食材:
+{food_context}
+
+候选菜谱:
+{candidate_context}
+"""
+        
+        return {
+            "Model": "hunyuan-lite",
+            "Messages": [
+                {
+                    "Role": "system",
+                    "Content": self.get_shortlist_system_prompt()
+                },
+                {
+                    "Role": "user",
+                    "Content": user_prompt
+                }
+            ],
+            "Stream": False,
+            "Temperature": 0.2,
+            "TopP": 0.9
+        }
+
+    def _handle_shortlist_response(
+        self,
+        resp: Any,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        candidates: List[Dict[str, Any]],
+        device_id: Optional[str],
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """处理shortlist模式的响应：按模型选出的编号和顺序组装完整菜谱"""
+        if not (hasattr(resp, 'Choices') and resp.Choices):
+            logger.error("API响应格式异常")
+            return self._create_fallback_response(categorized_foods, device_id, "API响应格式异常", meal_type, dietary_preferences)
+        
+        content = resp.Choices[0].Message.Content
+        logger.info(f"收到shortlist响应，长度: {len(content)} 字符")
+        parsed = {}
+        parsing_error = None
+        try:
+            json_start = content.find('{')
+            json_end = content.rfind('}') + 1
+            if json_start != -1 and json_end > json_start:
+                parsed = json.loads(content[json_start:json_end])
+        except json.JSONDecodeError as e:
+            parsing_error = f"JSON解析错误: {str(e)}"
+            logger.error(parsing_error)
+        if not isinstance(parsed, dict):
+            parsed = {}
+        
+        by_id = {f"r{index + 1}": recipe for index, recipe in enumerate(candidates)}
+        recommendations = []
+        for pick in parsed.get('picks') or []:
+            if not isinstance(pick, dict) or pick.get('id') not in by_id:
+                continue
+            recipe = dict(by_id.pop(pick['id']))
+            score = pick.get('priority_score')
+            if isinstance(score, (int, float)):
+                recipe['priority_score'] = max(1, min(10, score))
+            if pick.get('adaptation'):
+                recipe['adaptation'] = pick['adaptation']
+            recipe['source'] = "shortlist"
+            recommendations.append(recipe)
+            if len(recommendations) >= LOCAL_RECIPE_LIMIT:
+                break
+        if not recommendations:
+            # 模型没有返回有效编号时按本地评分顺序返回
+            parsing_error = parsing_error or "模型未返回有效的候选菜谱编号"
+            logger.warning(f"{parsing_error}，使用本地候选菜谱排序")
+            recommendations = candidates[:LOCAL_RECIPE_LIMIT]
+        
+        tips = [tip for tip in parsed.get('tips') or [] if isinstance(tip, str)]
+        total_items = sum(len(items) for items in categorized_foods.values())
+        return {
+            "success": True,
+            "message": parsed.get('message') or "已根据冰箱食材为您挑选以下菜谱，优先使用即将过期的食材。",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "device_id": device_id,
+            "food_inventory": {"total_items": total_items, **categorized_foods},
+            "meal_recommendations": recommendations,
+            "food_alerts": self._build_food_alerts(categorized_foods, tips or ["请检查即将过期和需要注意的食材"]),
+            "recommendation_source": "shortlist",
+            "parsing_error": parsing_error,
+            "model": "hunyuan-lite",
+            "api_usage": self._get_api_usage(resp)
+        }
+
+    def _create_error_response(
+        self,
+        error: Exception,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        device_id: Optional[str],
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """将调用异常转换为备用响应"""
+        if isinstance(error, TencentCloudSDKException):
+            logger.error(f"腾讯云API错误: {error.message}")
+            return self._create_fallback_response(categorized_foods, device_id, f"腾讯云API错误: {error.message}", meal_type, dietary_preferences)
+        logger.error(f"推荐过程异常: {str(error)}")
+        return self._create_fallback_response(categorized_foods, device_id, f"推荐过程异常: {str(error)}", meal_type, dietary_preferences)
 
     def _build_food_context(self, food_items: List[Dict[str, Any]], categorized_foods: Dict[str, List[Dict[str, Any]]]) -> str:
         """构建食材上下文描述"""
@@ -399,12 +767,7 @@ class MealRecommendationAgent:
                     parsed_data.setdefault('success', True)
                     parsed_data.setdefault('food_inventory', categorized_foods)
                     parsed_data.setdefault('meal_recommendations', [])
-                    parsed_data.setdefault('food_alerts', {
-                        "urgent_count": len(categorized_foods.get("needs_attention", [])),
-                        "expiring_today": len([item for item in categorized_foods.get("expiring_soon", []) if item.get("days_remaining", 0) <= 1]),
-                        "expired_count": len(categorized_foods.get("expired_items", [])),
-                        "recommendations": []
-                    })
+                    parsed_data.setdefault('food_alerts', self._build_food_alerts(categorized_foods, []))
                     
                     # 添加总数
                     if 'food_inventory' in parsed_data:
@@ -424,21 +787,76 @@ class MealRecommendationAgent:
             logger.error(f"响应解析异常: {e}")
             return self._create_default_response(categorized_foods, content, f"响应解析异常: {str(e)}")
 
-    def _create_fallback_response(self, categorized_foods: Dict[str, List[Dict[str, Any]]], device_id: Optional[str], error_msg: str) -> Dict[str, Any]:
-        """创建失败时的备用响应"""
+    def _build_food_alerts(self, categorized_foods: Dict[str, List[Dict[str, Any]]], recommendations: List[str]) -> Dict[str, Any]:
+        """根据本地新鲜度分类构建食材提醒"""
+        return {
+            "urgent_count": len(categorized_foods.get("needs_attention", [])),
+            "expiring_today": len([item for item in categorized_foods.get("expiring_soon", []) if item.get("days_remaining", 0) <= 1]),
+            "expired_count": len(categorized_foods.get("expired_items", [])),
+            "recommendations": recommendations
+        }
+
+    def _local_recommendations(
+        self,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        meal_type: Optional[str],
+        dietary_preferences: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """本地规则推荐，出错时返回空列表"""
+        if not categorized_foods:
+            return []
+        try:
+            return self.local_engine.recommend(categorized_foods, meal_type, dietary_preferences)
+        except Exception as e:
+            logger.error(f"本地菜谱推荐异常: {e}")
+            return []
+
+    def _create_local_response(
+        self,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        device_id: Optional[str],
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """fast_mode下只使用本地规则推荐的响应"""
+        recommendations = self._local_recommendations(categorized_foods, meal_type, dietary_preferences)
+        total_items = sum(len(items) for items in categorized_foods.values())
+        return {
+            "success": True,
+            "message": "已根据冰箱食材快速生成推荐，优先使用即将过期的食材。" if recommendations else "冰箱中的食材暂时没有匹配的菜谱。",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "device_id": device_id,
+            "food_inventory": {"total_items": total_items, **categorized_foods},
+            "meal_recommendations": recommendations,
+            "food_alerts": self._build_food_alerts(categorized_foods, ["请检查即将过期和需要注意的食材"]),
+            "recommendation_source": "local",
+            "model": None,
+            "api_usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    def _create_fallback_response(
+        self,
+        categorized_foods: Dict[str, List[Dict[str, Any]]],
+        device_id: Optional[str],
+        error_msg: str,
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """创建失败时的备用响应，meal_recommendations使用本地规则推荐的结果"""
+        recommendations = self._local_recommendations(categorized_foods, meal_type, dietary_preferences)
         return {
             "success": False,
             "error": error_msg,
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "device_id": device_id,
             "food_inventory": categorized_foods,
-            "meal_recommendations": [],
-            "food_alerts": {
-                "urgent_count": len(categorized_foods.get("needs_attention", [])),
-                "expiring_today": len([item for item in categorized_foods.get("expiring_soon", []) if item.get("days_remaining", 0) <= 1]),
-                "expired_count": len(categorized_foods.get("expired_items", [])),
-                "recommendations": ["系统暂时无法提供推荐，请稍后重试"]
-            },
+            "meal_recommendations": recommendations,
+            "food_alerts": self._build_food_alerts(
+                categorized_foods,
+                ["智能推荐暂时不可用，以下为本地推荐的菜谱"] if recommendations else ["系统暂时无法提供推荐，请稍后重试"]
+            ),
+            "fallback": True,
+            "recommendation_source": "local",
             "api_usage": None
         }
 
@@ -454,17 +872,81 @@ class MealRecommendationAgent:
                 **categorized_foods
             },
             "meal_recommendations": [],
-            "food_alerts": {
-                "urgent_count": len(categorized_foods.get("needs_attention", [])),
-                "expiring_today": len([item for item in categorized_foods.get("expiring_soon", []) if item.get("days_remaining", 0) <= 1]),
-                "expired_count": len(categorized_foods.get("expired_items", [])),
-                "recommendations": ["请检查即将过期和需要注意的食材"]
-            },
+            "food_alerts": self._build_food_alerts(categorized_foods, ["请检查即将过期和需要注意的食材"]),
             "raw_content": raw_content,
             "parsing_error": error_msg
         }
 
 
+class RecipeStreamParser:
+    """从流式输出的JSON文本中增量提取meal_recommendations数组里已经生成完整的菜谱对象"""
+    
+    def __init__(self):
+        self.buffer = ""
+        self._array_start = -1
+        self._pos = 0
+        self._depth = 0
+        self._object_start = -1
+        self._in_string = False
+        self._escape = False
+        self._finished = False
+    
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        追加一段模型输出
+        
+        Args:
+            text: 新增的文本片段
+            
+        Returns:
+            List[Dict]: 本次新完成的菜谱
+        """
+        self.buffer += text
+        if self._finished:
+            return []
+        if self._array_start < 0:
+            key_pos = self.buffer.find('"meal_recommendations"')
+            if key_pos < 0:
+                return []
+            bracket = self.buffer.find('[', key_pos)
+            if bracket < 0:
+                return []
+            self._array_start = bracket
+            self._pos = bracket + 1
+        
+        recipes = []
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0 and char == ']':
+                    self._finished = True
+                    self._pos += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and char == '}' and self._object_start >= 0:
+                    try:
+                        recipes.append(json.loads(buffer[self._object_start:self._pos + 1]))
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"流式菜谱解析失败: {e}")
+                    self._object_start = -1
+            self._pos += 1
+        return recipes
+
+
 # 使用示例
 if __name__ == "__main__":
     # 初始化推荐代理
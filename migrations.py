@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 轻量数据库迁移
+create_all只会创建缺失的表，不会给已有的表补索引或字段，
+这里按版本号顺序执行迁移，并把已执行的版本记录在schema_migrations表中
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+from sqlalchemy import Table, Column, Integer, String, TIMESTAMP, MetaData, select, insert, update, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', TIMESTAMP(timezone=True)),
+)
+
+
+def _create_indexes(conn: Connection, table, names: Tuple[str, ...]):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+
+def _add_missing_columns(conn: Connection, table, names: Tuple[str, ...]):
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name in existing:
+            continue
+        column_type = table.c[name].type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+
+
+def _create_fridge_item_indexes(conn: Connection):
+    """fridge_items按设备读取的复合索引"""
+    from db import FridgeItem
+    _create_indexes(conn, FridgeItem.__table__, (
+        "ix_fridge_items_device_put_in_time",
+        "ix_fridge_items_device_category",
+    ))
+
+
+def _add_freshness_tracking(conn: Connection):
+    """过期提醒任务使用的freshness_bucket/next_transition_at字段，已有物品全部标记为待计算"""
+    from db import FridgeItem
+    table = FridgeItem.__table__
+    _add_missing_columns(conn, table, ("freshness_bucket", "next_transition_at"))
+    _create_indexes(conn, table, ("ix_fridge_items_next_transition_at",))
+    conn.execute(
+        update(table)
+        .where(table.c.next_transition_at.is_(None), table.c.freshness_bucket.is_(None))
+        .values(next_transition_at=datetime.now(timezone.utc))
+    )
+
+
+def _backfill_inventory_snapshots(conn: Connection):
+    """为已有设备生成库存快照"""
+    from sqlalchemy.orm import Session
+    from db import FridgeItem, refresh_device_snapshots
+    device_ids = conn.execute(select(FridgeItem.device_id).distinct()).scalars().all()
+    session = Session(bind=conn)
+    try:
+        refresh_device_snapshots(session, device_ids)
+        session.flush()
+    finally:
+        session.close()
+
+
+def _add_image_skip_counter(conn: Connection):
+    """开关门图片变化检测的连续跳过次数"""
+    from db import DeviceImageState
+    _add_missing_columns(conn, DeviceImageState.__table__, ("skipped_events",))
+
+
+# (版本号, 描述, 迁移函数)，只能在末尾追加，不要修改已发布的版本
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "fridge_items composite indexes on device_id", _create_fridge_item_indexes),
+    (2, "fridge_items freshness tracking for expiry alerts", _add_freshness_tracking),
+    (3, "backfill device inventory snapshots", _backfill_inventory_snapshots),
+    (4, "device image state skipped event counter", _add_image_skip_counter),
+]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """
+    执行尚未执行的迁移，每个迁移在独立事务中执行
+
+    Args:
+        engine: 数据库引擎
+
+    Returns:
+        List[int]: 本次执行的迁移版本号
+    """
+    with engine.connect() as conn:
+        return run_migrations_on_connection(conn)
+
+
+def run_migrations_on_connection(conn: Connection) -> List[int]:
+    """
+    在已有连接上执行尚未执行的迁移，每个迁移单独提交；
+    异步引擎通过AsyncConnection.run_sync调用
+
+    Args:
+        conn: 没有未提交事务的数据库连接
+
+    Returns:
+        List[int]: 本次执行的迁移版本号
+    """
+    _metadata.create_all(conn)
+    applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    conn.commit()
+
+    executed = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"执行数据库迁移 {version}: {description}")
+        try:
+            migrate(conn)
+            conn.execute(insert(schema_migrations).values(
+                version=version,
+                description=description,
+                applied_at=datetime.now(timezone.utc)
+            ))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        executed.append(version)
+    return executed
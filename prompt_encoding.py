@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - agent提示词紧凑编码
+把数据库物品和识别结果编码为短字段名的表格，只保留物品匹配需要的字段，
+超出token预算时按优先级继续删减列，并报告编码前后的token估算值
+- 识别结果用引用编号(n1, n2...)代替完整字段，agent调用工具时传new_item_ref即可，
+  execute_tool_call会合并该识别结果的原始字段
+- 多轮交互时压缩发送给模型的历史消息：旧的get_current_fridge_items结果只保留最新一次，
+  更早轮次的其他工具结果截断，每轮请求的大小不再随轮数增长
+"""
+
+import os
+import json
+import math
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from item_reconciler import normalize_new_item
+
+logger = logging.getLogger(__name__)
+
+# agent对比提示词中物品数据的token预算
+AGENT_PROMPT_TOKEN_BUDGET = int(os.getenv("AGENT_PROMPT_TOKEN_BUDGET", "3000"))
+
+# 短字段名 -> 说明，按表格列顺序排列
+FIELD_LABELS = {
+    "id": "数据库物品id",
+    "ref": "识别结果引用编号",
+    "n": "名称",
+    "c": "分类",
+    "s": "子类别",
+    "b": "品牌",
+    "a": "数量描述",
+    "f": "新鲜度",
+    "t": "放入日期",
+    "p": "位置x,y,宽,高",
+    "cf": "识别置信度",
+}
+
+# 超出预算时依次删除的列，id/ref/名称/分类始终保留
+DROP_ORDER = ("cf", "t", "p", "b", "s", "a", "f")
+
+# 是否压缩agent多轮交互中发送给模型的历史消息
+AGENT_COMPACT_HISTORY = os.getenv("AGENT_COMPACT_HISTORY", "true").lower() in ("1", "true", "yes")
+# 最近几轮的工具结果保持完整
+AGENT_HISTORY_KEEP_TURNS = int(os.getenv("AGENT_HISTORY_KEEP_TURNS", "1"))
+# 更早轮次的工具结果保留的最大字符数
+AGENT_TOOL_RESULT_MAX_CHARS = int(os.getenv("AGENT_TOOL_RESULT_MAX_CHARS", "200"))
+
+# 结果代表冰箱当前完整状态的工具，只需要保留最新一次结果
+SNAPSHOT_TOOLS = ("get_current_fridge_items",)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数：中日韩字符按每字1个token，其余字符按每4个字符1个token
+    只用于预算和对比，不要求与模型分词器完全一致
+    """
+    cjk = sum(1 for ch in text if "　" <= ch <= "鿿" or "가" <= ch <= "힯" or "＀" <= ch <= "￯")
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def new_item_ref(index: int) -> str:
+    """识别结果的引用编号，从n1开始"""
+    return f"n{index + 1}"
+
+
+def build_new_item_refs(new_items: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """引用编号 -> 识别结果"""
+    return {new_item_ref(index): item for index, item in enumerate(new_items)}
+
+
+def _format_position(position: Any) -> str:
+    if not isinstance(position, dict):
+        return ""
+    values = [position.get(key) for key in ("x", "y", "width", "height")]
+    if any(not isinstance(value, (int, float)) for value in values):
+        return ""
+    return ",".join(str(round(value)) for value in values)
+
+
+def _format_date(value: Any) -> str:
+    # ISO时间只保留日期部分，新鲜度判断不需要精确到秒
+    return str(value)[:10] if value else ""
+
+
+def _existing_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": item.get("id"),
+        "n": item.get("name"),
+        "c": item.get("category"),
+        "s": item.get("subcategory"),
+        "b": item.get("brand"),
+        "a": item.get("item_amount_desc"),
+        "f": item.get("freshness"),
+        "t": _format_date(item.get("put_in_time")),
+        "p": _format_position(item.get("position")),
+    }
+
+
+def _new_row(ref: str, item: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = normalize_new_item(item)
+    confidence = normalized.get("confidence")
+    return {
+        "ref": ref,
+        "n": normalized.get("name"),
+        "c": normalized.get("category"),
+        "s": normalized.get("subcategory"),
+        "b": normalized.get("brand"),
+        "a": normalized.get("item_amount_desc"),
+        "f": normalized.get("freshness"),
+        "p": _format_position(normalized.get("position")),
+        "cf": round(float(confidence), 2) if isinstance(confidence, (int, float)) else "",
+    }
+
+
+def _render_table(rows: List[Dict[str, Any]], dropped: Tuple[str, ...]) -> str:
+    if not rows:
+        return "(无)"
+    columns = [key for key in rows[0] if key not in dropped]
+    lines = ["|".join(columns)]
+    for row in rows:
+        cells = []
+        for key in columns:
+            value = row.get(key)
+            cells.append("" if value is None else str(value).replace("|", "/").replace("\n", " "))
+        lines.append("|".join(cells))
+    return "\n".join(lines)
+
+
+def encode_reconcile_items(
+    last_items: List[Dict[str, Any]],
+    new_items: List[Dict[str, Any]],
+    token_budget: Optional[int] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    将数据库物品和识别结果编码为紧凑表格
+
+    Args:
+        last_items: 数据库中上次冰箱物品
+        new_items: 本次识别结果
+        token_budget: 物品数据的token预算，默认读取AGENT_PROMPT_TOKEN_BUDGET
+
+    Returns:
+        Tuple[str, Dict]: (编码后的文本, 统计信息)
+            统计信息包含 tokens_before（完整JSON）、tokens_after、dropped_columns、over_budget
+    """
+    budget = AGENT_PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    existing_rows = [_existing_row(item) for item in last_items]
+    new_rows = [_new_row(new_item_ref(index), item) for index, item in enumerate(new_items)]
+
+    def render(dropped: Tuple[str, ...]) -> str:
+        return (
+            f"【数据库中上次冰箱物品信息】\n{_render_table(existing_rows, dropped)}"
+            f"\n\n【本次冰箱照片识别结果】\n{_render_table(new_rows, dropped)}"
+        )
+
+    dropped: Tuple[str, ...] = ()
+    text = render(dropped)
+    for column in DROP_ORDER:
+        if estimate_tokens(text) <= budget:
+            break
+        dropped += (column,)
+        text = render(dropped)
+
+    full_json = (
+        f"【数据库中上次冰箱物品信息】\n{json.dumps(last_items, ensure_ascii=False)}"
+        f"\n\n【本次冰箱照片识别结果】\n{json.dumps(new_items, ensure_ascii=False)}"
+    )
+    stats = {
+        "tokens_before": estimate_tokens(full_json),
+        "tokens_after": estimate_tokens(text),
+        "dropped_columns": list(dropped),
+        "over_budget": estimate_tokens(text) > budget,
+    }
+    if stats["over_budget"]:
+        logger.warning(f"agent提示词超出token预算 {budget}: {stats}")
+    return text, stats
+
+
+def build_field_legend() -> str:
+    """表格短字段名说明"""
+    return "；".join(f"{key}={label}" for key, label in FIELD_LABELS.items())
+
+
+def merge_new_item_ref(
+    item_info: Optional[Dict[str, Any]],
+    ref: Optional[str],
+    new_item_refs: Optional[Dict[str, Dict[str, Any]]],
+    fields: Optional[Tuple[str, ...]] = None
+) -> Dict[str, Any]:
+    """
+    用引用编号对应的识别结果补全agent传入的item_info，agent显式给出的字段优先
+
+    Args:
+        item_info: agent传入的字段
+        ref: new_item_ref引用编号
+        new_item_refs: build_new_item_refs的结果
+        fields: 只合并这些字段，None表示合并全部字段
+
+    Returns:
+        Dict: 合并后的物品信息
+    """
+    merged: Dict[str, Any] = {}
+    original = (new_item_refs or {}).get(ref) if ref else None
+    if original is not None:
+        normalized = normalize_new_item(original)
+        merged = {k: v for k, v in normalized.items() if fields is None or k in fields}
+    elif ref:
+        logger.warning(f"未知的识别结果引用编号: {ref}")
+    merged.update(item_info or {})
+    return merged
+
+
+def _stub_snapshot_result(content: str) -> str:
+    stub: Dict[str, Any] = {"omitted": True, "note": "已被之后的get_current_fridge_items结果取代"}
+    try:
+        stub["item_count"] = len(json.loads(content).get("items", []))
+    except (TypeError, ValueError, AttributeError):
+        pass
+    return json.dumps(stub, ensure_ascii=False)
+
+
+def compact_agent_history(
+    messages: List[Dict[str, Any]],
+    keep_recent_turns: Optional[int] = None,
+    max_tool_result_chars: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    生成发送给模型的压缩版对话历史，不修改传入的messages
+    - get_current_fridge_items的结果只保留最新一次（不截断），之前的替换为只含物品数量的占位结果
+    - 最近keep_recent_turns轮之前的其他工具结果截断到max_tool_result_chars个字符
+    - 用户消息、assistant消息及其ToolCalls保持不变，ToolCallId与工具结果的对应关系不变
+
+    Args:
+        messages: 完整对话消息
+        keep_recent_turns: 保持完整的最近轮数，默认读取AGENT_HISTORY_KEEP_TURNS
+        max_tool_result_chars: 旧工具结果保留的最大字符数，默认读取AGENT_TOOL_RESULT_MAX_CHARS
+
+    Returns:
+        List[Dict]: 压缩后的消息列表
+    """
+    keep_turns = AGENT_HISTORY_KEEP_TURNS if keep_recent_turns is None else keep_recent_turns
+    max_chars = AGENT_TOOL_RESULT_MAX_CHARS if max_tool_result_chars is None else max_tool_result_chars
+
+    # 工具结果按顺序对应前一条assistant消息中的ToolCalls
+    tool_info: Dict[int, Tuple[int, str]] = {}
+    turn = 0
+    pending: List[str] = []
+    for index, message in enumerate(messages):
+        if message.get("Role") == "assistant":
+            tool_calls = message.get("ToolCalls") or []
+            if tool_calls:
+                turn += 1
+            pending = [tool_call.get("Function", {}).get("Name", "") for tool_call in tool_calls]
+        elif message.get("Role") == "tool":
+            tool_info[index] = (turn, pending.pop(0) if pending else "")
+
+    snapshot_indexes = [index for index, (_, name) in tool_info.items() if name in SNAPSHOT_TOOLS]
+    latest_snapshot = snapshot_indexes[-1] if snapshot_indexes else None
+
+    compacted = []
+    for index, message in enumerate(messages):
+        if index not in tool_info:
+            compacted.append(message)
+            continue
+        message_turn, name = tool_info[index]
+        content = message.get("Content") or ""
+        if name in SNAPSHOT_TOOLS:
+            # 最新的物品列表是模型对比的依据，始终完整保留
+            if index != latest_snapshot:
+                content = _stub_snapshot_result(content)
+        elif message_turn <= turn - keep_turns and len(content) > max_chars:
+            content = content[:max_chars] + "...(已截断)"
+        compacted.append(message if content == message.get("Content") else {**message, "Content": content})
+
+    logger.info(
+        f"agent历史消息压缩: {estimate_tokens(json.dumps(messages, ensure_ascii=False))} -> "
+        f"{estimate_tokens(json.dumps(compacted, ensure_ascii=False))} tokens"
+    )
+    return compacted
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 识别结果缓存模块
+按图片内容哈希+模型+提示词版本缓存识别结果，
+同一张图片重复上传时直接返回缓存，无需再次调用视觉模型；
+调用方只有图片URL时按URL+服务端ETag/Last-Modified生成缓存键，不为了计算键下载图片
+"""
+
+import os
+import json
+import copy
+import logging
+from typing import Dict, Any, Optional
+from cache_backends import CacheBackend, create_cache_backend
+from image_utils import sha256_hex
+
+logger = logging.getLogger(__name__)
+
+RECOGNITION_CACHE_BACKEND = os.getenv("RECOGNITION_CACHE_BACKEND", "memory")
+RECOGNITION_CACHE_TTL = float(os.getenv("RECOGNITION_CACHE_TTL", "86400"))
+RECOGNITION_CACHE_MAX_ENTRIES = int(os.getenv("RECOGNITION_CACHE_MAX_ENTRIES", "1024"))
+
+# 每次请求都不同的字段，不写入缓存
+_PER_REQUEST_FIELDS = ("device_id", "image_url", "api_usage", "cache_hit")
+
+
+class RecognitionCache:
+    """识别结果缓存"""
+
+    def __init__(self, backend: CacheBackend, ttl: Optional[float] = RECOGNITION_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model: str, prompt: str) -> str:
+        """
+        生成缓存键，提示词或模型变化后旧缓存自动失效
+
+        Args:
+            image_bytes: 图片原始字节
+            model: 模型名称
+            prompt: 系统提示词
+
+        Returns:
+            str: 缓存键
+        """
+        prompt_version = sha256_hex(prompt.encode("utf-8"))[:16]
+        return f"{model}:{prompt_version}:{sha256_hex(image_bytes)}"
+
+    @staticmethod
+    def make_url_key(image_url: str, validator: str, model: str, prompt: str) -> str:
+        """
+        调用方没有图片字节时的缓存键：URL + 服务端校验信息（见image_utils.fetch_image_validator）
+        同一URL的内容被覆盖后ETag/Last-Modified随之变化，旧缓存不会命中
+
+        Args:
+            image_url: 图片URL
+            validator: fetch_image_validator的结果
+            model: 模型名称
+            prompt: 系统提示词
+
+        Returns:
+            str: 缓存键
+        """
+        prompt_version = sha256_hex(prompt.encode("utf-8"))[:16]
+        source = sha256_hex(f"{image_url}\n{validator}".encode("utf-8"))
+        return f"{model}:{prompt_version}:url:{source}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"读取识别缓存失败: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, result: Dict[str, Any]):
+        """只缓存识别成功的结果"""
+        if not result.get("success"):
+            return
+        cached = {k: v for k, v in result.items() if k not in _PER_REQUEST_FIELDS}
+        try:
+            self.backend.set(key, json.dumps(cached, ensure_ascii=False), self.ttl)
+        except Exception as e:
+            logger.warning(f"写入识别缓存失败: {e}")
+
+    @staticmethod
+    def build_hit_result(cached: Dict[str, Any], image_url: str, device_id: Optional[str]) -> Dict[str, Any]:
+        """用缓存内容构造本次请求的识别结果"""
+        result = copy.deepcopy(cached)
+        result.update({
+            "device_id": device_id,
+            "image_url": image_url,
+            "cache_hit": True,
+            "api_usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+        return result
+
+
+def create_recognition_cache_from_env() -> Optional[RecognitionCache]:
+    """根据RECOGNITION_CACHE_*环境变量创建缓存，RECOGNITION_CACHE_BACKEND=none时返回None"""
+    backend = create_cache_backend(
+        RECOGNITION_CACHE_BACKEND,
+        RECOGNITION_CACHE_MAX_ENTRIES,
+        os.getenv("RECOGNITION_CACHE_PATH"),
+        namespace="recognition",
+    )
+    if backend is None:
+        return None
+    return RecognitionCache(backend, RECOGNITION_CACHE_TTL)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - 菜谱推荐结果缓存模块
+按 库存指纹 + 规范化后的请求参数 缓存推荐结果
+- 冰箱内容未变化、请求参数相同时直接返回缓存，不调用大模型
+- fridge_items写入时按设备失效
+- 缓存有效期不超过任意食材放入天数的下一次变化，也不超过本地时间的下一个零点
+"""
+
+import os
+import re
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, Any, List, Optional
+from cache_backends import CacheBackend, create_cache_backend
+from image_utils import sha256_hex
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_CACHE_BACKEND = os.getenv("RECOMMENDATION_CACHE_BACKEND", "memory")
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "600"))
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "2048"))
+
+# 每次请求都不同的字段，不写入缓存
+_PER_REQUEST_FIELDS = ("timestamp", "request_info", "cache_hit")
+
+# 影响菜谱推荐结果的字段，用于计算库存指纹
+FINGERPRINT_FIELDS = (
+    "id", "name", "category", "subcategory", "brand",
+    "item_amount_desc", "freshness", "expiry_estimate", "put_in_time",
+)
+
+
+def compute_inventory_fingerprint(food_items: List[Dict[str, Any]]) -> str:
+    """
+    计算库存指纹，食材集合或其推荐相关字段变化时指纹随之变化
+
+    Args:
+        food_items: get_items_for_recommendation返回的食材列表
+
+    Returns:
+        str: SHA-256十六进制指纹
+    """
+    rows = sorted(
+        [[item.get(field) for field in FINGERPRINT_FIELDS] for item in food_items],
+        key=lambda row: json.dumps(row, ensure_ascii=False, default=str)
+    )
+    payload = json.dumps(rows, ensure_ascii=False, default=str, separators=(",", ":"))
+    return sha256_hex(payload.encode("utf-8"))
+
+
+def normalize_request_params(
+    user_message: Optional[str],
+    meal_type: Optional[str] = None,
+    dietary_preferences: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """规范化推荐请求参数：去除多余空白、统一大小写、列表排序"""
+    preferences = {}
+    for key, value in (dietary_preferences or {}).items():
+        if isinstance(value, (list, tuple)):
+            value = sorted(str(v).strip().lower() for v in value if v)
+        if value:
+            preferences[key] = value
+    return {
+        "user_message": re.sub(r"\s+", " ", (user_message or "").strip()).lower(),
+        "meal_type": (meal_type or "").strip().lower(),
+        "dietary_preferences": preferences,
+    }
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def next_local_midnight(now: datetime) -> datetime:
+    """本地时区的下一个零点"""
+    local_now = now.astimezone()
+    return datetime.combine(local_now.date() + timedelta(days=1), time.min, tzinfo=local_now.tzinfo)
+
+
+def seconds_until_recommendation_change(food_items: List[Dict[str, Any]], now: Optional[datetime] = None) -> float:
+    """
+    距离推荐内容可能变化的最近时间点的秒数
+
+    推荐按整天计算放入天数（新鲜度分类、剩余天数、第6天起的紧急程度），
+    因此取任意食材放入天数加一的时间，以及本地时间的下一个零点（日期变化），两者中较早的一个
+    """
+    now = now or datetime.now(timezone.utc)
+    changes = [next_local_midnight(now)]
+    for item in food_items:
+        put_in_time = _parse_time(item.get("put_in_time"))
+        if put_in_time is None or put_in_time > now:
+            continue
+        days_in_fridge = (now - put_in_time).days
+        changes.append(put_in_time + timedelta(days=days_in_fridge + 1))
+    return (min(changes) - now).total_seconds()
+
+
+class RecommendationCache:
+    """菜谱推荐结果缓存"""
+
+    def __init__(self, backend: CacheBackend, ttl: float = RECOMMENDATION_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _generation_key(device_id: Optional[str]) -> str:
+        return f"generation:{device_id or '_all'}"
+
+    def _get_generation(self, device_id: Optional[str]) -> str:
+        # 代数保存为后端的固定条目，sqlite/database后端下多个进程共享失效状态，且不会被LRU淘汰
+        return self.backend.get_pinned(self._generation_key(device_id)) or "0"
+
+    def make_key(
+        self,
+        device_id: Optional[str],
+        fingerprint: str,
+        user_message: Optional[str],
+        meal_type: Optional[str] = None,
+        dietary_preferences: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None
+    ) -> str:
+        """
+        生成缓存键
+
+        Args:
+            device_id: 设备ID
+            fingerprint: 库存指纹（compute_inventory_fingerprint）
+            user_message: 用户消息
+            meal_type: 餐次类型
+            dietary_preferences: 饮食偏好
+            mode: 推荐模式（如shortlist），不同模式的结果分开缓存，默认模式为None
+
+        Returns:
+            str: 缓存键
+        """
+        params = normalize_request_params(user_message, meal_type, dietary_preferences)
+        if mode:
+            params["mode"] = mode
+        params_hash = sha256_hex(json.dumps(params, ensure_ascii=False, sort_keys=True).encode("utf-8"))[:16]
+        generation = self._get_generation(device_id)
+        return f"{device_id or '_all'}:{generation}:{fingerprint}:{params_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"读取推荐缓存失败: {e}")
+            return None
+        if value is None:
+            return None
+        result = json.loads(value)
+        result.update({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "cache_hit": True
+        })
+        return result
+
+    def set(self, key: str, result: Dict[str, Any], food_items: List[Dict[str, Any]]):
+        """只缓存模型成功生成且包含菜谱的推荐结果（不缓存本地备用推荐），有效期不超过推荐内容的下一次变化"""
+        if not result.get("success") or not result.get("meal_recommendations") or result.get("fallback"):
+            return
+        ttl = min(self.ttl, seconds_until_recommendation_change(food_items))
+        if ttl <= 0:
+            return
+        cached = {k: v for k, v in result.items() if k not in _PER_REQUEST_FIELDS}
+        try:
+            self.backend.set(key, json.dumps(cached, ensure_ascii=False), ttl)
+        except Exception as e:
+            logger.warning(f"写入推荐缓存失败: {e}")
+
+    def invalidate_device(self, device_id: Optional[str]):
+        """使某台设备的所有推荐缓存失效（同时失效不区分设备的缓存）"""
+        try:
+            for key in {self._generation_key(device_id), self._generation_key(None)}:
+                self.backend.set_pinned(key, uuid.uuid4().hex[:12])
+        except Exception as e:
+            logger.warning(f"推荐缓存失效失败: {e}")
+
+
+_default_cache: Optional[RecommendationCache] = None
+_default_cache_created = False
+_default_cache_lock = threading.Lock()
+
+
+def get_recommendation_cache() -> Optional[RecommendationCache]:
+    """获取按RECOMMENDATION_CACHE_*环境变量创建的进程内共享缓存，backend为none时返回None"""
+    global _default_cache, _default_cache_created
+    if not _default_cache_created:
+        with _default_cache_lock:
+            if not _default_cache_created:
+                backend = create_cache_backend(
+                    RECOMMENDATION_CACHE_BACKEND,
+                    RECOMMENDATION_CACHE_MAX_ENTRIES,
+                    os.getenv("RECOMMENDATION_CACHE_PATH"),
+                    namespace="recommendation",
+                )
+                _default_cache = RecommendationCache(backend) if backend else None
+                _default_cache_created = True
+    return _default_cache
+
+
+def invalidate_device_recommendations(device_id: Optional[str]):
+    """fridge_items写入后调用，使该设备的推荐缓存失效"""
+    cache = get_recommendation_cache()
+    if cache is not None:
+        cache.invalidate_device(device_id)
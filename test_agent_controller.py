@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""AgentLoopController轮数、截止时间、token限制与agent循环结束原因的单元测试"""
+
+import json
+import asyncio
+
+import data_processor
+from agent_controller import (
+    STOP_COMPLETED,
+    STOP_DEADLINE,
+    STOP_MAX_TURNS,
+    STOP_NO_RESPONSE,
+    STOP_TOKEN_BUDGET,
+    AgentLoopController,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _response(tokens=10, tool_calls=None):
+    message = {"Role": "assistant", "Content": "", "ToolCalls": tool_calls or []}
+    return {"Response": {"Choices": [{"Message": message}], "Usage": {"TotalTokens": tokens}}}
+
+
+LIST_ITEMS_CALL = {"Id": "call-1", "Function": {"Name": "get_current_fridge_items", "Arguments": json.dumps({})}}
+
+
+def test_stops_at_max_turns():
+    controller = AgentLoopController(max_turns=2, deadline_seconds=0, token_budget=0)
+    turns = 0
+    while controller.should_continue():
+        controller.record_response(_response())
+        turns += 1
+
+    assert turns == 2
+    assert controller.stop_reason == STOP_MAX_TURNS
+
+
+def test_stops_at_deadline():
+    clock = FakeClock()
+    controller = AgentLoopController(max_turns=0, deadline_seconds=5, token_budget=0, clock=clock)
+    controller.start()
+
+    assert controller.should_continue()
+    clock.now = 3
+    assert controller.remaining_seconds() == 2
+    controller.record_response(_response())
+    clock.now = 5
+    assert not controller.should_continue()
+    assert controller.stop_reason == STOP_DEADLINE
+    assert controller.remaining_seconds() == 0
+
+
+def test_stops_at_token_budget():
+    controller = AgentLoopController(max_turns=0, deadline_seconds=0, token_budget=100)
+    while controller.should_continue():
+        controller.record_response(_response(tokens=40))
+
+    assert controller.stop_reason == STOP_TOKEN_BUDGET
+    assert controller.metrics()["api_usage"]["total_tokens"] == 120
+
+
+def test_finish_keeps_first_reason_and_metrics_split_model_and_tool_time():
+    clock = FakeClock()
+    controller = AgentLoopController(max_turns=5, deadline_seconds=0, token_budget=0, clock=clock)
+    controller.start()
+    controller.should_continue()
+    clock.now = 1.5
+    controller.record_response(_response(tokens=7))
+    clock.now = 2.0
+    controller.record_tool_calls([LIST_ITEMS_CALL, LIST_ITEMS_CALL])
+    controller.finish(STOP_COMPLETED)
+    controller.finish(STOP_DEADLINE)
+
+    metrics = controller.metrics()
+    assert metrics["stop_reason"] == STOP_COMPLETED
+    assert metrics["turn_details"] == [{"turn": 1, "model_seconds": 1.5, "tool_seconds": 0.5, "tool_calls": 2, "tokens": 7}]
+    assert metrics["turn_latencies"] == [2.0]
+    assert metrics["tool_calls_by_name"] == {"get_current_fridge_items": 2}
+    assert metrics["elapsed_seconds"] == 2.0
+
+
+def test_agent_loop_stops_when_model_keeps_calling_tools(fridge_db, monkeypatch):
+    calls = []
+    monkeypatch.setattr(data_processor, "call_hunyuan_agent_api", lambda messages, tools: calls.append(1) or _response(tool_calls=[LIST_ITEMS_CALL]))
+    controller = AgentLoopController(max_turns=3, deadline_seconds=0, token_budget=0)
+
+    messages = data_processor.run_agent_loop([], [], device_id="fridge_a", controller=controller)
+
+    assert len(calls) == 3
+    assert controller.stop_reason == STOP_MAX_TURNS
+    # 最后一轮的tool call也已经执行，对话以工具结果结束
+    assert messages[-1]["Role"] == "tool"
+
+
+def test_agent_loop_records_no_response(fridge_db, monkeypatch):
+    monkeypatch.setattr(data_processor, "call_hunyuan_agent_api", lambda messages, tools: {"Response": {}})
+    controller = AgentLoopController()
+
+    assert data_processor.run_agent_loop([], [], device_id="fridge_a", controller=controller) == []
+    assert controller.stop_reason == STOP_NO_RESPONSE
+
+
+def test_async_agent_loop_times_out_pending_request(monkeypatch):
+    async def slow_api(messages, tools):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(data_processor, "acall_hunyuan_agent_api", slow_api)
+    controller = AgentLoopController(max_turns=3, deadline_seconds=0.05, token_budget=0)
+
+    messages = asyncio.run(data_processor.arun_agent_loop([], [], device_id="fridge_a", controller=controller))
+
+    assert messages == []
+    assert controller.stop_reason == STOP_DEADLINE
+    assert controller.metrics()["turns"] == 0
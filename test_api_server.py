@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""api_server读取接口参数校验与推荐缓存的单元测试"""
+
+import pytest
+
+import api_server
+from cache_backends import MemoryCacheBackend
+from db import add_fridge_item, get_device_snapshot
+from meal_recommendation_agent import MealRecommendationAgent
+from recommendation_cache import RecommendationCache
+
+
+@pytest.fixture
+def client(fridge_db):
+    return api_server.app.test_client()
+
+
+def test_fridge_status_requires_device_id(client):
+    response = client.get("/api/fridge-status")
+
+    assert response.status_code == 400
+    assert "device_id" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("path", ["/api/meal-recommendation", "/api/meal-recommendation/stream"])
+def test_meal_recommendation_requires_device_id(client, path):
+    response = client.post(path, json={"user_message": "推荐晚饭"})
+
+    assert response.status_code == 400
+    assert "device_id" in response.get_json()["error"]
+
+
+def test_fridge_status_only_reads_requested_device(client, fridge_db):
+    session = fridge_db()
+    try:
+        for name, device_id in (("牛奶", "fridge_a"), ("鸡蛋", "fridge_a"), ("苹果", "fridge_b")):
+            add_fridge_item(session, {
+                "name": name, "category": "乳制品", "freshness": "good",
+                "image_url": "https://example.com/milk.jpg", "device_id": device_id,
+            })
+    finally:
+        session.close()
+
+    body = client.get("/api/fridge-status?device_id=fridge_a").get_json()
+
+    assert body["total_items"] == 2
+    assert sorted(item["name"] for item in body["items"]) == sorted(["牛奶", "鸡蛋"])
+
+
+def test_fast_mode_does_not_return_cached_model_recommendation(client, fridge_db, monkeypatch):
+    agent = MealRecommendationAgent("test-id", "test-key", recommendation_cache=RecommendationCache(MemoryCacheBackend()))
+    monkeypatch.setattr(api_server, "recommendation_agent", agent)
+    session = fridge_db()
+    try:
+        add_fridge_item(session, {
+            "name": "番茄", "category": "蔬菜", "freshness": "good",
+            "image_url": "https://example.com/tomato.jpg", "device_id": "fridge_a",
+        })
+        fingerprint = get_device_snapshot(session, "fridge_a").inventory_fingerprint
+    finally:
+        session.close()
+    cached = {"success": True, "meal_recommendations": [{"recipe_name": "模型菜谱"}], "recommendation_source": "model"}
+    agent.cache.set(agent.cache.make_key("fridge_a", fingerprint, "推荐晚饭"), cached, [])
+    request = {"device_id": "fridge_a", "user_message": "推荐晚饭"}
+
+    assert client.post("/api/meal-recommendation", json=request).get_json()["recommendation_source"] == "model"
+    fast = client.post("/api/meal-recommendation", json={**request, "fast_mode": True}).get_json()
+
+    assert fast["recommendation_source"] == "local"
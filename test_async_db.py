@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""async_db建表迁移、单条写入的回滚与时间字段解析的单元测试"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import async_db
+from migrations import MIGRATIONS, schema_migrations
+
+
+def _item(name, device_id="fridge_a", **fields):
+    return {"name": name, "category": "蔬菜", "freshness": "good", "image_url": "u", "device_id": device_id, **fields}
+
+
+def _run(coro_fn):
+    try:
+        return asyncio.run(coro_fn())
+    finally:
+        asyncio.run(async_db.async_engine.dispose())
+
+
+def test_create_tables_runs_migrations(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'fresh.sqlite3'}")
+    monkeypatch.setattr(async_db, "async_engine", engine)
+
+    async def run():
+        await async_db.create_tables()
+        # 再次调用不会重复执行迁移
+        await async_db.create_tables()
+        async with engine.connect() as conn:
+            versions = (await conn.execute(select(schema_migrations.c.version))).scalars().all()
+            columns = await conn.run_sync(
+                lambda sync_conn: {column["name"] for column in inspect(sync_conn).get_columns("device_image_states")}
+            )
+        await engine.dispose()
+        return versions, columns
+
+    versions, columns = asyncio.run(run())
+
+    assert sorted(versions) == [version for version, _, _ in MIGRATIONS]
+    assert "skipped_events" in columns
+
+
+def test_failed_add_rolls_back_and_session_stays_usable(fridge_db):
+    async def run():
+        await async_db.create_tables()
+        async with async_db.AsyncSessionLocal() as session:
+            with pytest.raises(IntegrityError):
+                await async_db.add_fridge_item(session, _item(None))
+            await async_db.add_fridge_item(session, _item("青菜"))
+            items = await async_db.get_items_by_device(session, "fridge_a")
+            snapshot = await async_db.get_device_snapshot(session, "fridge_a")
+            return [item.name for item in items], snapshot.item_count
+
+    assert _run(run) == (["青菜"], 1)
+
+
+def test_failed_delete_and_update_roll_back(fridge_db, monkeypatch):
+    async def failing_refresh(session, device_ids):
+        raise RuntimeError("snapshot refresh failed")
+
+    async def run():
+        await async_db.create_tables()
+        async with async_db.AsyncSessionLocal() as session:
+            item_id = (await async_db.add_fridge_item(session, _item("青菜"))).id
+            monkeypatch.setattr(async_db, "_refresh_device_snapshots", failing_refresh)
+            with pytest.raises(RuntimeError):
+                await async_db.delete_item(session, item_id)
+            with pytest.raises(RuntimeError):
+                await async_db.update_item(session, item_id, {"freshness": "poor"})
+            monkeypatch.undo()
+            count = (await session.execute(text("SELECT COUNT(*) FROM fridge_items"))).scalar_one()
+            freshness = (await session.execute(text("SELECT freshness FROM fridge_items"))).scalar_one()
+            return count, freshness
+
+    assert _run(run) == (1, "good")
+
+
+def test_update_item_parses_iso_time_strings(fridge_db):
+    async def run():
+        await async_db.create_tables()
+        async with async_db.AsyncSessionLocal() as session:
+            item = await async_db.add_fridge_item(session, _item("青菜"))
+            updated = await async_db.update_item(session, item.id, {
+                "put_in_time": "2024-09-23T07:30:00Z",
+                "detected_at": "not a time",
+            })
+            return updated.put_in_time, updated.detected_at
+
+    put_in_time, detected_at = _run(run)
+
+    assert put_in_time.replace(tzinfo=put_in_time.tzinfo or timezone.utc) == datetime(2024, 9, 23, 7, 30, tzinfo=timezone.utc)
+    assert detected_at is None
+
+
+def test_update_and_delete_of_missing_item(fridge_db):
+    async def run():
+        await async_db.create_tables()
+        async with async_db.AsyncSessionLocal() as session:
+            return await async_db.update_item(session, 404, {"freshness": "poor"}), await async_db.delete_item(session, 404)
+
+    assert _run(run) == (None, False)
+
+
+def test_unsupported_async_backend_is_rejected():
+    assert async_db.build_async_database_url("postgresql://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    with pytest.raises(ValueError):
+        async_db.build_async_database_url("mysql://u:p@h/db")
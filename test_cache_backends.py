@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""cache_backends过期、淘汰与写入代价的单元测试"""
+
+import time
+
+from cache_backends import DatabaseCacheBackend, MemoryCacheBackend, SQLiteCacheBackend
+
+
+def _count(backend):
+    return backend._conn().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+
+def test_memory_backend_lru_and_ttl():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+    backend.set("c", "3")
+    backend.set("d", "4", ttl=0.01)
+    time.sleep(0.02)
+
+    assert backend.get("a") is None and backend.get("b") is None
+    assert backend.get("c") == "3"
+    assert backend.get("d") is None
+
+
+def test_sqlite_backend_counts_entries_only_every_interval(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=5, evict_interval=4)
+    statements = []
+    backend._conn().set_trace_callback(statements.append)
+
+    for index in range(12):
+        backend.set(f"k{index}", str(index))
+        # 两次淘汰之间最多超出上限evict_interval-1条
+        assert _count(backend) <= 5 + 3
+
+    backend._conn().set_trace_callback(None)
+    counts = [sql for sql in statements if sql.startswith("SELECT COUNT(*)") and "cache_entries" in sql]
+    # 除了测试自己的12次统计，淘汰只统计了3次
+    assert len(counts) == 12 + 3
+    # 淘汰按最近访问时间保留最新的条目
+    assert backend.get("k11") == "11"
+
+
+def test_sqlite_backend_drops_expired_entries_on_read_and_evict(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=100, evict_interval=2)
+    backend.set("old", "1", ttl=0.01)
+    time.sleep(0.02)
+
+    assert backend.get("old") is None
+    backend.set("a", "1", ttl=0.01)
+    time.sleep(0.02)
+    backend.set("b", "2")
+    backend.set("c", "3")
+
+    assert _count(backend) == 2
+
+
+def test_database_backend_evicts_every_interval(fridge_db):
+    backend = DatabaseCacheBackend(max_entries=3, evict_interval=2)
+
+    for index in range(6):
+        backend.set(f"k{index}", str(index))
+    backend.set_pinned("generation", "g1")
+
+    assert backend.get("k5") == "5"
+    assert backend.get("k0") is None
+    assert backend.get_pinned("generation") == "g1"
+
+
+def test_two_sqlite_caches_on_one_file_count_evict_and_clear_separately(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    recognition = SQLiteCacheBackend(path, max_entries=3, evict_interval=1, namespace="recognition")
+    recommendation = SQLiteCacheBackend(path, max_entries=2, evict_interval=1, namespace="recommendation")
+
+    for index in range(3):
+        recognition.set(f"k{index}", f"recognition-{index}")
+    for index in range(4):
+        recommendation.set(f"k{index}", f"recommendation-{index}")
+
+    # 同名键互不覆盖，推荐缓存的写入没有挤掉识别缓存的条目
+    assert [recognition.get(f"k{index}") for index in range(3)] == ["recognition-0", "recognition-1", "recognition-2"]
+    assert [recommendation.get(f"k{index}") for index in range(4)] == [None, None, "recommendation-2", "recommendation-3"]
+    assert _count(recognition) == 3 + 2
+
+    recommendation.set_pinned("generation:fridge_a", "g1")
+    recommendation.clear()
+
+    assert recognition.get("k0") == "recognition-0"
+    assert recommendation.get("k3") is None
+    assert recommendation.get_pinned("generation:fridge_a") == "g1"
+    assert recognition.get_pinned("generation:fridge_a") is None
+
+
+def test_two_database_caches_count_evict_and_clear_separately(fridge_db):
+    recognition = DatabaseCacheBackend(max_entries=2, evict_interval=1, namespace="recognition")
+    recommendation = DatabaseCacheBackend(max_entries=2, evict_interval=1, namespace="recommendation")
+
+    recognition.set("k0", "a")
+    recognition.set("k1", "b")
+    for index in range(3):
+        recommendation.set(f"k{index}", str(index))
+
+    assert recognition.get("k0") == "a" and recognition.get("k1") == "b"
+    assert recommendation.get("k0") is None and recommendation.get("k2") == "2"
+
+    recognition.clear()
+
+    assert recognition.get("k1") is None
+    assert recommendation.get("k2") == "2"
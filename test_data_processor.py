@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""data_processor工具调用执行与会话内物品列表缓存的单元测试"""
+
+import json
+
+import pytest
+
+from data_processor import FridgeItemsSnapshot, execute_tool_call, get_current_fridge_items
+
+
+def _call(name, **args):
+    return {"Id": "call-1", "Function": {"Name": name, "Arguments": json.dumps(args, ensure_ascii=False)}}
+
+
+NEW_ITEM_REFS = {
+    "n1": {"name": "牛奶", "category": "乳制品", "image_url": "https://example.com/milk.jpg", "quantity": 1},
+}
+
+
+def test_add_with_ref_fills_fields_from_recognition(fridge_db):
+    result = execute_tool_call(_call("add_fridge_item", new_item_ref="n1"), "fridge_a", NEW_ITEM_REFS)
+
+    items = get_current_fridge_items("fridge_a")
+    assert [item["id"] for item in items] == [result["item_id"]]
+    assert items[0]["image_url"] == "https://example.com/milk.jpg"
+
+
+def test_add_with_unknown_ref_returns_error(fridge_db):
+    result = execute_tool_call(_call("add_fridge_item", new_item_ref="n9", item_info={"name": "牛奶"}), "fridge_a", NEW_ITEM_REFS)
+
+    assert "n9" in result["error"]
+    assert get_current_fridge_items("fridge_a") == []
+
+
+def test_add_with_partial_item_info_returns_error(fridge_db):
+    result = execute_tool_call(_call("add_fridge_item", item_info={"name": "牛奶"}), "fridge_a", NEW_ITEM_REFS)
+
+    assert "image_url" in result["error"]
+    assert get_current_fridge_items("fridge_a") == []
+
+
+def test_add_with_complete_item_info(fridge_db):
+    result = execute_tool_call(
+        _call("add_fridge_item", item_info={"name": "苹果", "image_url": "https://example.com/apple.jpg"}), "fridge_a"
+    )
+
+    assert result["item_id"]
+    assert get_current_fridge_items("fridge_a")[0]["device_id"] == "fridge_a"
+
+
+def test_update_with_unknown_ref_returns_error(fridge_db):
+    added = execute_tool_call(_call("add_fridge_item", new_item_ref="n1"), "fridge_a", NEW_ITEM_REFS)
+
+    result = execute_tool_call(_call("update_fridge_item", item_id=added["item_id"], new_item_ref="n2"), "fridge_a", NEW_ITEM_REFS)
+
+    assert "n2" in result["error"]
+
+
+def test_snapshot_reuses_items_until_a_write_in_the_session(fridge_db):
+    snapshot = FridgeItemsSnapshot("fridge_a")
+    execute_tool_call(_call("add_fridge_item", new_item_ref="n1"), "fridge_a", NEW_ITEM_REFS, snapshot)
+
+    first = execute_tool_call(_call("get_current_fridge_items"), "fridge_a", snapshot=snapshot)
+    second = execute_tool_call(_call("get_current_fridge_items"), "fridge_a", snapshot=snapshot)
+    assert (snapshot.loads, snapshot.hits) == (1, 1)
+    assert first == second
+
+    execute_tool_call(_call("delete_fridge_item", item_id=first["items"][0]["id"]), "fridge_a", snapshot=snapshot)
+    assert execute_tool_call(_call("get_current_fridge_items"), "fridge_a", snapshot=snapshot) == {"items": []}
+    assert snapshot.loads == 2
+
+
+def test_snapshot_kept_after_failed_write(fridge_db):
+    snapshot = FridgeItemsSnapshot("fridge_a")
+    execute_tool_call(_call("get_current_fridge_items"), "fridge_a", snapshot=snapshot)
+
+    execute_tool_call(_call("add_fridge_item", item_info={"name": "牛奶"}), "fridge_a", NEW_ITEM_REFS, snapshot)
+    execute_tool_call(_call("delete_fridge_item", item_id=999), "fridge_a", snapshot=snapshot)
+    execute_tool_call(_call("get_current_fridge_items"), "fridge_a", snapshot=snapshot)
+
+    assert (snapshot.loads, snapshot.hits) == (1, 1)
+
+
+def test_get_current_fridge_items_requires_device_id(fridge_db):
+    with pytest.raises(ValueError):
+        get_current_fridge_items(None)
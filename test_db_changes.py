@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""apply_fridge_changes批量写入、回滚与并发删除的单元测试"""
+
+import asyncio
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import async_db
+from db import apply_fridge_changes, get_device_snapshot, get_items_by_device
+
+
+def _item(name, device_id="fridge_a", **fields):
+    return {"name": name, "category": "蔬菜", "image_url": "u", "device_id": device_id, **fields}
+
+
+def test_failed_batch_rolls_back_every_change(fridge_db):
+    session = fridge_db()
+    try:
+        applied = apply_fridge_changes(session, adds=[_item("青菜"), _item("番茄")], updates=[], deletes=[])
+        kept, removed = applied["added_ids"]
+
+        with pytest.raises(IntegrityError):
+            apply_fridge_changes(
+                session,
+                adds=[_item("鸡蛋")],
+                updates=[(kept, {"name": None})],
+                deletes=[removed],
+            )
+
+        names = sorted(item.name for item in get_items_by_device(session, "fridge_a"))
+        assert names == ["番茄", "青菜"]
+        assert get_device_snapshot(session, "fridge_a").item_count == 2
+    finally:
+        session.close()
+
+
+def test_update_of_deleted_item_is_skipped_and_counted(fridge_db):
+    session = fridge_db()
+    try:
+        applied = apply_fridge_changes(session, adds=[_item("青菜"), _item("番茄")], updates=[], deletes=[])
+        kept, removed = applied["added_ids"]
+        # 模拟另一个事务已经删除了该物品
+        apply_fridge_changes(session, adds=[], updates=[], deletes=[removed])
+
+        result = apply_fridge_changes(
+            session,
+            adds=[],
+            updates=[(kept, {"freshness": "poor"}), (removed, {"freshness": "poor"})],
+            deletes=[removed],
+        )
+
+        assert result["updated"] == 1
+        assert result["deleted"] == 0
+        assert [item.freshness for item in get_items_by_device(session, "fridge_a")] == ["poor"]
+    finally:
+        session.close()
+
+
+def test_async_update_of_deleted_item_is_skipped(fridge_db):
+    async def run():
+        await async_db.create_tables()
+        async with async_db.AsyncSessionLocal() as session:
+            applied = await async_db.apply_fridge_changes(session, adds=[_item("青菜")], updates=[], deletes=[])
+            item_id = applied["added_ids"][0]
+            await async_db.apply_fridge_changes(session, adds=[], updates=[], deletes=[item_id])
+            return await async_db.apply_fridge_changes(session, adds=[], updates=[(item_id, {"freshness": "poor"})], deletes=[])
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        asyncio.run(async_db.async_engine.dispose())
+
+    assert result["updated"] == 0
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""build_engine_options连接池、SQL日志与executemany参数的单元测试"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+import async_db
+import db
+from db import build_engine_options
+
+POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout", "pool_recycle")
+
+
+def test_sqlite_uses_default_pool():
+    options = build_engine_options("sqlite:///freshtrack.sqlite3")
+
+    assert not any(key in options for key in POOL_OPTIONS)
+    assert "executemany_mode" not in options
+    assert options["echo"] is False
+    assert options["pool_pre_ping"] == db.DB_POOL_PRE_PING
+    assert options["insertmanyvalues_page_size"] == db.DB_INSERTMANYVALUES_PAGE_SIZE
+
+
+def test_postgres_psycopg2_gets_pool_and_batched_executemany(monkeypatch):
+    url = "postgresql+psycopg2://u:p@h/db"
+    monkeypatch.setattr(db, "DB_POOL_SIZE", 7)
+    monkeypatch.setattr(db, "DB_MAX_OVERFLOW", 3)
+    monkeypatch.setattr(db, "DB_POOL_TIMEOUT", 1.5)
+    monkeypatch.setattr(db, "DB_POOL_RECYCLE", 60)
+
+    options = build_engine_options(url)
+
+    assert {key: options[key] for key in POOL_OPTIONS} == {
+        "pool_size": 7, "max_overflow": 3, "pool_timeout": 1.5, "pool_recycle": 60,
+    }
+    assert options["executemany_mode"] == "values_plus_batch"
+    # 参数能被psycopg2方言接受，创建引擎不会连接数据库
+    engine = create_engine(url, **options)
+    assert engine.pool.size() == 7
+    engine.dispose()
+
+
+@pytest.mark.parametrize("url", [
+    "postgresql+asyncpg://u:p@h/db", "postgresql+pg8000://u:p@h/db", "postgresql+psycopg://u:p@h/db",
+])
+def test_executemany_mode_is_only_set_for_psycopg2(url):
+    options = build_engine_options(url)
+
+    assert "executemany_mode" not in options
+    assert all(key in options for key in POOL_OPTIONS)
+
+
+def test_bare_postgres_url_follows_sqlalchemy_default_driver():
+    url = "postgresql://u:p@h/db"
+
+    options = build_engine_options(url)
+
+    # 不写驱动名时由SQLAlchemy选择默认驱动，只有解析为psycopg2时才设置executemany_mode
+    assert ("executemany_mode" in options) == (make_url(url).get_driver_name() == "psycopg2")
+    assert all(key in options for key in POOL_OPTIONS)
+
+
+def test_async_engine_options_drop_executemany_mode():
+    options = async_db._build_async_engine_options(async_db.build_async_database_url("postgresql://u:p@h/db"))
+
+    assert "executemany_mode" not in options
+    assert options["pool_size"] == db.DB_POOL_SIZE
+
+
+@pytest.mark.parametrize("value, expected", [("false", False), ("true", True), ("1", True), ("debug", "debug")])
+def test_echo_setting(value, expected, monkeypatch):
+    monkeypatch.setattr(db, "DB_ECHO", value)
+
+    assert build_engine_options("sqlite://")["echo"] == expected
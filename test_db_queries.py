@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""冰箱摘要GROUP BY统计、推荐食材列投影与完整ORM读取结果一致性的单元测试"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from db import (
+    DeviceInventorySnapshot,
+    FridgeItem,
+    RECOMMENDATION_COLUMNS,
+    RECOMMENDATION_JSON_COLUMNS,
+    get_current_fridge_summary,
+    get_items_for_recommendation,
+    item_to_recommendation_dict,
+    recommendation_items_statement,
+    refresh_device_snapshots,
+)
+
+# 覆盖空值、空字符串和未知新鲜度，这些值在GROUP BY中要与逐条统计按同样的默认值处理
+ROWS = [
+    ("牛奶", "乳制品", "good", "fridge_a"),
+    ("酸奶", "乳制品", "fair", "fridge_a"),
+    ("鸡蛋", None, "poor", "fridge_a"),
+    ("青菜", "", None, "fridge_a"),
+    ("豆腐", "豆制品", "", "fridge_a"),
+    ("剩饭", "主食", "spoiled", "fridge_a"),
+    ("苹果", "水果", "good", "fridge_b"),
+]
+
+
+@pytest.fixture
+def session(fridge_db):
+    session = fridge_db()
+    session.add_all(
+        FridgeItem(name=name, category=category, freshness=freshness, image_url="u", device_id=device_id)
+        for name, category, freshness, device_id in ROWS
+    )
+    session.commit()
+    yield session
+    session.close()
+
+
+def _per_row_summary(session, device_id):
+    """改为GROUP BY之前的逐条统计：读取完整ORM对象后在Python中计数"""
+    query = session.query(FridgeItem)
+    if device_id:
+        query = query.filter(FridgeItem.device_id == device_id)
+    items = [item_to_recommendation_dict(item) for item in query.all()]
+    categories = {}
+    freshness_stats = {"good": 0, "fair": 0, "poor": 0}
+    for item in items:
+        categories[item["category"]] = categories.get(item["category"], 0) + 1
+        if item["freshness"] in freshness_stats:
+            freshness_stats[item["freshness"]] += 1
+    return {"total_items": len(items), "categories": categories, "freshness_stats": freshness_stats}
+
+
+@pytest.mark.parametrize("device_id", [None, "fridge_a", "fridge_b"])
+def test_grouped_summary_matches_per_row_summary(session, device_id):
+    # 没有库存快照，走GROUP BY统计
+    assert session.query(DeviceInventorySnapshot).count() == 0
+
+    summary = get_current_fridge_summary(session, device_id, include_items=False)
+
+    assert summary == _per_row_summary(session, device_id)
+
+
+def test_snapshot_summary_matches_per_row_summary(session):
+    refresh_device_snapshots(session, ["fridge_a"])
+    session.commit()
+
+    summary = get_current_fridge_summary(session, "fridge_a", include_items=False)
+
+    assert summary == _per_row_summary(session, "fridge_a")
+
+
+@pytest.mark.parametrize("with_snapshot", [False, True])
+def test_include_items_only_adds_the_item_list(session, with_snapshot):
+    if with_snapshot:
+        refresh_device_snapshots(session, ["fridge_a"])
+        session.commit()
+
+    with_items = get_current_fridge_summary(session, "fridge_a", include_items=True)
+    without_items = get_current_fridge_summary(session, "fridge_a", include_items=False)
+
+    assert "items" not in without_items
+    assert with_items.pop("items") == get_items_for_recommendation(session, "fridge_a")
+    assert with_items == without_items
+
+
+@pytest.fixture
+def detailed_session(fridge_db):
+    now = datetime(2024, 9, 23, 7, 30, tzinfo=timezone.utc)
+    session = fridge_db()
+    session.add_all([
+        FridgeItem(
+            name="牛奶", category="乳制品", subcategory="牛奶", brand="品牌", confidence=0.875, image_url="u",
+            position={"x": 1, "y": 2, "width": 3, "height": 4}, item_amount_desc="1盒", freshness="fair",
+            expiry_estimate="3天", additional_info={"color": "白色"}, detected_at=now, device_id="fridge_a",
+            put_in_time=now - timedelta(days=2),
+        ),
+        # 可选字段全部为空，序列化时填默认值
+        FridgeItem(name="青菜", image_url="u", device_id="fridge_a", put_in_time=now - timedelta(days=5)),
+        FridgeItem(name="苹果", category="水果", image_url="u", device_id="fridge_b", put_in_time=now),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def _orm_items(session, device_id):
+    """投影之前的读取方式：完整ORM对象"""
+    query = session.query(FridgeItem)
+    if device_id:
+        query = query.filter(FridgeItem.device_id == device_id).order_by(FridgeItem.put_in_time)
+    else:
+        query = query.order_by(FridgeItem.id)
+    return [item_to_recommendation_dict(item) for item in query.all()]
+
+
+@pytest.mark.parametrize("device_id", ["fridge_a", None])
+def test_projected_rows_serialize_like_orm_objects(detailed_session, device_id):
+    projected = get_items_for_recommendation(detailed_session, device_id)
+    if device_id is None:
+        projected.sort(key=lambda item: item["id"])
+
+    assert projected == _orm_items(detailed_session, device_id)
+
+
+def test_json_columns_are_left_out_only_when_requested(detailed_session):
+    full = get_items_for_recommendation(detailed_session, "fridge_a")
+    slim = get_items_for_recommendation(detailed_session, "fridge_a", include_json=False)
+
+    # 按放入时间排序，青菜在前
+    assert full[0]["additional_info"] == {} and full[0]["position"] == {}
+    assert full[1]["position"] == {"x": 1, "y": 2, "width": 3, "height": 4}
+    assert slim == [
+        {key: value for key, value in item.items() if key not in ("position", "additional_info")}
+        for item in full
+    ]
+
+
+def test_statement_selects_only_recommendation_columns():
+    def names(columns):
+        return [column.key for column in columns]
+
+    full = recommendation_items_statement("fridge_a")
+    slim = recommendation_items_statement("fridge_a", include_json=False)
+
+    assert names(full.selected_columns) == names(RECOMMENDATION_COLUMNS + RECOMMENDATION_JSON_COLUMNS)
+    assert names(slim.selected_columns) == names(RECOMMENDATION_COLUMNS)
+    assert "image_url" not in names(full.selected_columns)
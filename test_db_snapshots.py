@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""设备库存快照与fridge_items写入一致性的单元测试"""
+
+import threading
+
+from db import (
+    add_fridge_item,
+    apply_fridge_changes,
+    delete_item,
+    get_device_snapshot,
+    get_items_for_recommendation,
+)
+from recommendation_cache import compute_inventory_fingerprint
+
+
+def _item(name, device_id="fridge_a", **fields):
+    return {"name": name, "category": "蔬菜", "image_url": "u", "device_id": device_id, **fields}
+
+
+def _assert_snapshot_matches_items(session_factory, device_id):
+    session = session_factory()
+    try:
+        snapshot = get_device_snapshot(session, device_id)
+        items = get_items_for_recommendation(session, device_id, include_json=False)
+        assert snapshot.item_count == len(items)
+        assert sum(snapshot.category_counts.values()) == len(items)
+        assert snapshot.inventory_fingerprint == compute_inventory_fingerprint(items)
+        return snapshot
+    finally:
+        session.close()
+
+
+def test_snapshot_follows_single_row_writes(fridge_db):
+    session = fridge_db()
+    try:
+        first = add_fridge_item(session, _item("青菜", freshness="fair"))
+        add_fridge_item(session, _item("牛奶", category=""))
+        delete_item(session, first.id)
+    finally:
+        session.close()
+
+    snapshot = _assert_snapshot_matches_items(fridge_db, "fridge_a")
+    assert snapshot.category_counts == {"未分类": 1}
+    assert snapshot.freshness_counts == {"good": 1, "fair": 0, "poor": 0}
+
+
+def test_snapshot_follows_bulk_changes(fridge_db):
+    session = fridge_db()
+    try:
+        applied = apply_fridge_changes(session, adds=[_item("青菜"), _item("番茄"), _item("鸡蛋", "fridge_b")], updates=[], deletes=[])
+        apply_fridge_changes(session, adds=[], updates=[(applied["added_ids"][1], {"freshness": "poor"})], deletes=[applied["added_ids"][0]])
+    finally:
+        session.close()
+
+    snapshot = _assert_snapshot_matches_items(fridge_db, "fridge_a")
+    assert snapshot.item_count == 1
+    assert snapshot.freshness_counts["poor"] == 1
+    assert _assert_snapshot_matches_items(fridge_db, "fridge_b").item_count == 1
+
+
+def test_concurrent_adds_keep_snapshot_consistent(fridge_db):
+    errors = []
+    start = threading.Barrier(8)
+
+    def add(index):
+        session = fridge_db()
+        try:
+            start.wait()
+            add_fridge_item(session, _item(f"物品{index}", freshness=("good", "fair")[index % 2]))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=add, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    snapshot = _assert_snapshot_matches_items(fridge_db, "fridge_a")
+    assert snapshot.item_count == 8
+    assert snapshot.freshness_counts == {"good": 4, "fair": 4, "poor": 0}
+
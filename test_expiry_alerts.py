@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""expiry_alerts增量过期提醒任务的单元测试"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from db import FridgeAlert, apply_fridge_changes
+from expiry_alerts import run_expiry_alert_job
+
+# 新写入的食材next_transition_at为写入时间，任务时间要晚于写入时间
+NOW = datetime.now(timezone.utc) + timedelta(minutes=1)
+
+
+def _item(name, days_ago, device_id="fridge_a", **fields):
+    return {
+        "name": name, "category": "蔬菜", "image_url": "u", "device_id": device_id,
+        "put_in_time": NOW - timedelta(days=days_ago), **fields,
+    }
+
+
+def test_alerts_only_when_bucket_gets_more_urgent(fridge_db):
+    session = fridge_db()
+    try:
+        apply_fridge_changes(session, adds=[_item("青菜", 4), _item("牛奶", 1), _item("鸡蛋", 1, freshness="poor")], updates=[], deletes=[])
+
+        first = run_expiry_alert_job(session, now=NOW)
+        assert first["evaluated"] == 3
+        assert first["alerts_by_bucket"] == {"expiring_soon": 1, "needs_attention": 0, "expired": 1}
+
+        # 没有到达分界点的食材不会被再次取出
+        assert run_expiry_alert_job(session, now=NOW + timedelta(hours=1))["evaluated"] == 0
+
+        later = run_expiry_alert_job(session, now=NOW + timedelta(days=3, hours=1))
+        assert later["evaluated"] == 3
+        # 已经expired的鸡蛋不会重复提醒
+        assert later["alerts_by_bucket"] == {"expiring_soon": 1, "needs_attention": 1, "expired": 0}
+        alerts = session.scalars(select(FridgeAlert).where(FridgeAlert.previous_bucket.isnot(None))).all()
+        assert sorted((alert.item_name, alert.previous_bucket, alert.bucket) for alert in alerts) == [
+            ("牛奶", "fresh", "expiring_soon"), ("青菜", "expiring_soon", "needs_attention"),
+        ]
+    finally:
+        session.close()
+
+
+def test_batches_cover_all_due_items_and_sink_errors_are_contained(fridge_db):
+    session = fridge_db()
+    delivered = []
+
+    def sink(alerts):
+        delivered.extend(alerts)
+        raise RuntimeError("队列不可用")
+
+    try:
+        apply_fridge_changes(session, adds=[_item(f"物品{index}", 8) for index in range(5)], updates=[], deletes=[])
+
+        stats = run_expiry_alert_job(session, now=NOW, batch_size=2, sink=sink)
+    finally:
+        session.close()
+
+    assert stats["batches"] == 3
+    assert stats["evaluated"] == 5
+    assert len(delivered) == stats["alerts"] == 5
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""批量新鲜度分类与逐条规则（analyze_food_freshness / next_freshness_transition）的一致性测试"""
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from freshness_classifier import (
+    BUCKET_NAMES,
+    CATEGORIZED_KEYS,
+    bucket_counts,
+    classify_items,
+    to_datetime64,
+)
+from freshness_rules import next_freshness_transition
+from meal_recommendation_agent import MealRecommendationAgent
+
+# 放入天数覆盖每个分界点的前后，避开整天边界以免与测试执行时间相互干扰
+DAYS_AGO = [0.1, 2.5, 3.2, 5.9, 6.5, 7.1, 9.9, 10.5, 30.0]
+FRESHNESS = ["good", "fair", "poor"]
+
+
+def _items(now):
+    items = []
+    for days in DAYS_AGO:
+        for freshness in FRESHNESS:
+            put_in_time = (now - timedelta(days=days)).isoformat().replace("+00:00", "Z")
+            items.append({"id": len(items), "name": f"物品{len(items)}", "freshness": freshness, "put_in_time": put_in_time})
+    return items
+
+
+def test_buckets_match_scalar_rules():
+    now = datetime.now(timezone.utc)
+    items = _items(now)
+    agent = MealRecommendationAgent("test-id", "test-key", enable_cache=False)
+
+    categorized = agent.analyze_food_freshness(items)
+    result = classify_items(items, now)
+
+    expected = {entry["id"]: key for key, entries in categorized.items() for entry in entries}
+    assert [CATEGORIZED_KEYS[bucket] for bucket in result["bucket"]] == [expected[item["id"]] for item in items]
+    assert result["days_in_fridge"].tolist() == [int(days) for days in DAYS_AGO for _ in FRESHNESS]
+
+
+def test_next_transition_matches_scalar_rule():
+    now = datetime(2024, 9, 23, 12, tzinfo=timezone.utc)
+    put_in_times = [now - timedelta(days=days) for days in DAYS_AGO] + [None]
+
+    result = classify_items([{"put_in_time": value} for value in put_in_times], now)
+
+    for value, vectorized in zip(put_in_times, result["next_transition"]):
+        scalar = next_freshness_transition(value, now)
+        if scalar is None:
+            assert np.isnat(vectorized)
+        else:
+            assert vectorized == np.datetime64(scalar.replace(tzinfo=None), "us")
+
+
+def test_missing_put_in_time_is_fresh_unless_flagged():
+    result = classify_items([{"put_in_time": None}, {"put_in_time": "", "freshness": "poor"}])
+
+    assert [BUCKET_NAMES[bucket] for bucket in result["bucket"]] == ["fresh", "fresh"]
+    assert result["days_in_fridge"].tolist() == [-1, -1]
+
+
+def test_naive_and_aware_times_are_both_utc():
+    aware = datetime(2024, 9, 23, 8, tzinfo=timezone(timedelta(hours=8)))
+
+    assert to_datetime64([aware])[0] == to_datetime64(["2024-09-23T00:00:00"])[0]
+
+
+def test_bucket_counts():
+    assert bucket_counts(np.array([0, 3, 3, 1], dtype=np.int8)) == {
+        "fresh": 1, "expiring_soon": 1, "needs_attention": 0, "expired": 2,
+    }
+
+
+@pytest.mark.parametrize("freshness", FRESHNESS)
+def test_single_item_batch(freshness):
+    now = datetime.now(timezone.utc)
+    item = {"put_in_time": now - timedelta(days=4), "freshness": freshness}
+
+    bucket = classify_items([item], now)["bucket"][0]
+
+    assert BUCKET_NAMES[bucket] == {"good": "expiring_soon", "fair": "needs_attention", "poor": "expired"}[freshness]
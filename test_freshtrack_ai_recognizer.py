@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""recognize_many / RecognitionBatch流式返回、并发与限流、批次统计和提前停止的单元测试"""
+
+import time
+import threading
+
+import pytest
+
+from freshtrack_ai_recognizer import FreshTrackItemRecognizer
+from hunyuan_pool import RateLimiter
+
+
+class FakeRecognition:
+    """替代recognize_fridge_items：按URL中的延迟返回结果，并记录开始时间和并发数"""
+
+    def __init__(self, delays=None, failures=()):
+        self.delays = delays or {}
+        self.failures = set(failures)
+        self.started = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, image_url, device_id=None, image_bytes=None):
+        with self._lock:
+            self.started.append((image_url, time.monotonic()))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delays.get(image_url, 0.01))
+            if image_url in self.failures:
+                raise RuntimeError(f"{image_url} failed")
+            return {
+                "success": True,
+                "items": [],
+                "device_id": device_id,
+                "api_usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            }
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def recognizer(monkeypatch):
+    recognizer = FreshTrackItemRecognizer("test-id", "test-key", enable_cache=False)
+    fake = FakeRecognition()
+    monkeypatch.setattr(recognizer, "recognize_fridge_items", fake)
+    return recognizer, fake
+
+
+def test_results_stream_in_completion_order(recognizer):
+    recognizer, fake = recognizer
+    fake.delays = {"slow": 0.2, "medium": 0.1, "fast": 0.01}
+    batch = recognizer.recognize_many(["slow", ("medium", "fridge_b"), {"image_url": "fast", "device_id": "fridge_c"}], max_concurrency=3)
+
+    started = time.monotonic()
+    received = []
+    for result in batch:
+        received.append((result["image_url"], result["batch_index"], result["device_id"], time.monotonic() - started))
+
+    assert [entry[:3] for entry in received] == [("fast", 2, "fridge_c"), ("medium", 1, "fridge_b"), ("slow", 0, None)]
+    # 最快的结果不等最慢的请求完成就已返回
+    assert received[0][3] < 0.1
+
+
+def test_concurrency_is_limited_to_pool_size(recognizer):
+    recognizer, fake = recognizer
+    fake.delays = {f"img{index}": 0.03 for index in range(6)}
+
+    list(recognizer.recognize_many([f"img{index}" for index in range(6)], max_concurrency=2))
+
+    assert fake.max_active == 2
+
+
+def test_rate_limiter_spaces_requests_below_pool_limit(recognizer):
+    recognizer, fake = recognizer
+    images = [f"img{index}" for index in range(5)]
+
+    list(recognizer.recognize_many(images, max_concurrency=5, rate_limiter=RateLimiter(20, burst=1)))
+
+    starts = sorted(started for _, started in fake.started)
+    # 线程池允许5个同时进行，但限流器每秒只放行20个请求
+    assert starts[-1] - starts[0] >= 4 / 20 * 0.9
+
+
+def test_requests_per_second_creates_shared_limiter(recognizer):
+    recognizer, _ = recognizer
+
+    batch = recognizer.recognize_many(["a"], requests_per_second=5)
+
+    assert batch.rate_limiter is not None and batch.rate_limiter.rate == 5
+
+
+def test_summary_aggregates_success_failure_and_usage(recognizer):
+    recognizer, fake = recognizer
+    fake.failures = {"bad"}
+    batch = recognizer.recognize_many(["a", "bad", "b"], max_concurrency=3)
+
+    assert batch.summary()["completed"] == 0
+    results = {result["image_url"]: result for result in batch}
+    summary = batch.summary()
+
+    assert results["bad"]["success"] is False and "bad failed" in results["bad"]["error"]
+    assert summary["total_images"] == 3
+    assert (summary["completed"], summary["succeeded"], summary["failed"]) == (3, 2, 1)
+    assert summary["api_usage"] == {"prompt_tokens": 20, "completion_tokens": 10, "total_tokens": 30}
+    assert summary["elapsed_seconds"] > 0
+    assert summary["images_per_second"] > 0
+
+
+def test_stopping_early_cancels_pending_requests(recognizer):
+    recognizer, fake = recognizer
+    images = [f"img{index}" for index in range(10)]
+    fake.delays = {image: 0.05 for image in images}
+    batch = recognizer.recognize_many(images, max_concurrency=1)
+
+    for _ in batch:
+        break
+    time.sleep(0.2)
+
+    # 第一个结果返回时第二个请求可能已经开始，其余请求都被取消
+    assert len(fake.started) <= 2
+    assert batch.summary()["completed"] == 1
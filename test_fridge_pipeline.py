@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""fridge_pipeline开关门图片变化检测与强制识别的单元测试"""
+
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from PIL import Image, ImageDraw
+
+import fridge_pipeline
+from db import DeviceImageState
+from image_utils import compute_dhash, hamming_distance
+
+
+def _fridge_image(extra_item=None):
+    """灰色背景上若干色块模拟冰箱内的物品，extra_item为额外放入的小物品位置"""
+    image = Image.new("RGB", (640, 480), (200, 200, 200))
+    draw = ImageDraw.Draw(image)
+    for index in range(6):
+        x, y = 40 + index * 95, 60 + (index % 3) * 120
+        draw.rectangle([x, y, x + 70, y + 90], fill=(40 * index, 120, 255 - 30 * index))
+    if extra_item:
+        x, y = extra_item
+        draw.rectangle([x, y, x + 20, y + 20], fill=(255, 60, 60))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class _Recognizer:
+    def __init__(self):
+        self.calls = 0
+
+    def recognize_fridge_items(self, image_url, device_id, image_bytes=None):
+        self.calls += 1
+        return {"success": True, "items": [], "image_url": image_url, "device_id": device_id}
+
+
+@pytest.fixture
+def recognizer(fridge_db, monkeypatch):
+    monkeypatch.setattr(fridge_pipeline, "agent_process_and_update", lambda items, **kwargs: [])
+    return _Recognizer()
+
+
+def _process(recognizer, image_bytes):
+    return fridge_pipeline.process_door_close("https://example.com/fridge.jpg", "fridge_a", recognizer, image_bytes=image_bytes)
+
+
+def test_small_item_change_is_recognized_after_max_skipped_events(recognizer, monkeypatch):
+    monkeypatch.setattr(fridge_pipeline, "IMAGE_MAX_SKIPPED_EVENTS", 2)
+    before = _fridge_image()
+    after = _fridge_image(extra_item=(600, 20))
+    # 整图哈希看不出这个小物品
+    assert hamming_distance(compute_dhash(before), compute_dhash(after)) <= fridge_pipeline.IMAGE_CHANGE_THRESHOLD
+
+    assert _process(recognizer, before)["skipped"] is False
+    assert _process(recognizer, after)["skipped"] is True
+    assert _process(recognizer, after)["skipped"] is True
+    forced = _process(recognizer, after)
+
+    assert forced["skipped"] is False
+    assert forced["forced_reason"] == "max_skipped_events"
+    assert recognizer.calls == 2
+    # 识别后重新计数
+    assert _process(recognizer, after)["skipped"] is True
+
+
+def test_recognition_is_forced_after_max_age(recognizer, fridge_db, monkeypatch):
+    monkeypatch.setattr(fridge_pipeline, "IMAGE_MAX_SKIPPED_EVENTS", 0)
+    image = _fridge_image()
+    _process(recognizer, image)
+
+    session = fridge_db()
+    try:
+        state = session.get(DeviceImageState, "fridge_a")
+        state.updated_at = datetime.now(timezone.utc) - timedelta(seconds=fridge_pipeline.IMAGE_MAX_SKIP_SECONDS + 1)
+        session.commit()
+    finally:
+        session.close()
+
+    assert _process(recognizer, image)["forced_reason"] == "max_skip_age"
+    assert _process(recognizer, image)["skipped"] is True
+
+
+def test_changed_image_is_recognized(recognizer):
+    _process(recognizer, _fridge_image())
+
+    # 放入一大件物品，整图哈希明显变化
+    image = Image.open(io.BytesIO(_fridge_image())).convert("RGB")
+    ImageDraw.Draw(image).rectangle([0, 200, 640, 330], fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    result = _process(recognizer, buffer.getvalue())
+
+    assert result["skipped"] is False
+    assert result["forced_reason"] is None
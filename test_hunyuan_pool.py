@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""hunyuan_pool异步传输、签名与并发名额的单元测试"""
+
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+import httpx
+import pytest
+from tencentcloud.common.exception.tencent_cloud_sdk_exception import TencentCloudSDKException
+from tencentcloud.common.sign import Sign
+
+import hunyuan_pool
+from hunyuan_pool import achat_completions, amodel_slot, get_hunyuan_client, model_slot
+
+PARAMS = {"Model": "test-model", "Messages": [{"Role": "user", "Content": "你好"}]}
+OK_RESPONSE = {"Response": {"Choices": [{"Message": {"Role": "assistant", "Content": "hi"}}], "RequestId": "r1"}}
+
+
+@pytest.fixture
+def limited_model(monkeypatch):
+    monkeypatch.setattr(hunyuan_pool, "HUNYUAN_MODEL_CONCURRENCY", {"test-model": 2})
+    monkeypatch.setattr(hunyuan_pool, "_model_semaphores", {})
+
+
+def _mock_transport(monkeypatch, handler):
+    clients = {}
+
+    def get_client():
+        loop = asyncio.get_running_loop()
+        if loop not in clients:
+            clients[loop] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return clients[loop]
+
+    monkeypatch.setattr(hunyuan_pool, "get_async_http_client", get_client)
+
+
+def _verify_signature(request, secret_key):
+    """按服务端的方式用请求头和请求体重新计算签名"""
+    auth = request.headers["Authorization"]
+    credential, signed_headers, signature = [part.split("=", 1)[1] for part in auth.split(" ", 1)[1].split(", ")]
+    _, date, service, _ = credential.split("/")
+    canonical_headers = "".join(f"{name}:{request.headers[name].lower() if name == 'x-tc-action' else request.headers[name]}\n" for name in signed_headers.split(";"))
+    canonical_request = "\n".join(["POST", "/", "", canonical_headers, signed_headers, hashlib.sha256(request.content).hexdigest()])
+    string_to_sign = "\n".join([
+        "TC3-HMAC-SHA256", request.headers["X-TC-Timestamp"], f"{date}/{service}/tc3_request",
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    return Sign.sign_tc3(secret_key, date, service, string_to_sign) == signature
+
+
+def test_async_request_is_signed_and_parsed(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(200, json=OK_RESPONSE)
+
+    _mock_transport(monkeypatch, handler)
+    client = get_hunyuan_client("test-id", "test-key")
+
+    resp = asyncio.run(achat_completions(PARAMS, client=client))
+
+    assert resp.Choices[0].Message.Content == "hi"
+    request = seen[0]
+    assert request.headers["X-TC-Action"] == "ChatCompletions"
+    assert request.headers["X-TC-Version"] == "2023-09-01"
+    assert json.loads(request.content) == PARAMS
+    assert _verify_signature(request, "test-key")
+    assert not _verify_signature(request, "wrong-key")
+
+
+def test_api_error_is_raised_as_sdk_exception(monkeypatch):
+    _mock_transport(monkeypatch, lambda request: httpx.Response(
+        200, json={"Response": {"Error": {"Code": "LimitExceeded", "Message": "too many"}, "RequestId": "r2"}}
+    ))
+
+    with pytest.raises(TencentCloudSDKException) as error:
+        asyncio.run(achat_completions(PARAMS, client=get_hunyuan_client("test-id", "test-key")))
+    assert error.value.get_code() == "LimitExceeded"
+
+
+def test_async_and_sync_calls_share_process_wide_model_limit(limited_model):
+    lock = threading.Lock()
+    state = {"active": 0, "max_active": 0}
+
+    def enter():
+        with lock:
+            state["active"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+
+    def leave():
+        with lock:
+            state["active"] -= 1
+
+    async def async_call():
+        async with amodel_slot("test-model"):
+            enter()
+            await asyncio.sleep(0.02)
+            leave()
+
+    def sync_call():
+        with model_slot("test-model"):
+            enter()
+            time.sleep(0.02)
+            leave()
+
+    async def burst():
+        await asyncio.gather(*(async_call() for _ in range(4)))
+
+    # 两个事件循环和一个同步线程同时调用，名额仍由同一个信号量控制
+    threads = [threading.Thread(target=lambda: asyncio.run(burst())) for _ in range(2)]
+    threads.append(threading.Thread(target=lambda: [sync_call() for _ in range(3)]))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert state["max_active"] == 2
+
+
+def test_cancelled_request_releases_its_slot(monkeypatch, limited_model):
+    async def slow_handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json=OK_RESPONSE)
+
+    _mock_transport(monkeypatch, slow_handler)
+    client = get_hunyuan_client("test-id", "test-key")
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                asyncio.gather(achat_completions(PARAMS, client=client), achat_completions(PARAMS, client=client)),
+                0.05
+            )
+        # 超时的请求已经释放名额，同步调用无需等待
+        return hunyuan_pool.get_model_semaphore("test-model").acquire(timeout=0.1)
+
+    assert asyncio.run(run()) is True
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""ingestion_queue租约、重试、失败与按设备顺序处理的单元测试"""
+
+import time
+import threading
+
+import pytest
+
+from ingestion_queue import (
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_PENDING,
+    STATUS_PROCESSING,
+    IngestionQueue,
+    IngestionWorkerPool,
+    QueueFullError,
+    parse_detected_at,
+)
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # 重试不等待，便于测试
+    monkeypatch.setattr("ingestion_queue.INGESTION_RETRY_BASE_SECONDS", 0)
+    return IngestionQueue(str(tmp_path / "queue.sqlite3"), max_depth=10, max_attempts=2, visibility_timeout=30)
+
+
+def test_claims_head_of_each_device_only(queue):
+    first_a = queue.enqueue("fridge_a", "a1")
+    queue.enqueue("fridge_a", "a2")
+    first_b = queue.enqueue("fridge_b", "b1")
+
+    claimed = {event["device_id"]: event for event in (queue.claim(), queue.claim())}
+
+    assert {event["id"] for event in claimed.values()} == {first_a, first_b}
+    # fridge_a的第二个事件要等第一个完成后才能领取
+    assert queue.claim() is None
+    queue.complete(claimed["fridge_a"])
+    assert queue.claim()["image_url"] == "a2"
+
+
+def test_retry_then_dead_letter(queue):
+    event_id = queue.enqueue("fridge_a", "a1")
+
+    event = queue.claim()
+    assert queue.fail(event, "timeout") == STATUS_PENDING
+    event = queue.claim()
+    assert event["id"] == event_id and event["attempts"] == 2
+    assert queue.fail(event, "timeout") == STATUS_FAILED
+
+    stored = queue.get_event(event_id)
+    assert stored["status"] == STATUS_FAILED
+    assert stored["last_error"] == "timeout"
+    # 失败的事件不再阻塞同设备的后续事件
+    queue.enqueue("fridge_a", "a2")
+    assert queue.claim()["image_url"] == "a2"
+
+
+def test_expired_lease_is_reclaimed_and_stale_ack_ignored(tmp_path):
+    queue = IngestionQueue(str(tmp_path / "queue.sqlite3"), visibility_timeout=0.05)
+    event_id = queue.enqueue("fridge_a", "a1")
+
+    stale = queue.claim()
+    time.sleep(0.1)
+    reclaimed = queue.claim()
+
+    assert reclaimed["id"] == event_id and reclaimed["attempts"] == 2
+    assert queue.complete(stale, {"success": True}) is False
+    assert queue.get_event(event_id)["status"] == STATUS_PROCESSING
+    assert queue.complete(reclaimed, {"success": True}) is True
+    assert queue.get_event(event_id)["status"] == STATUS_DONE
+
+
+def test_rejects_when_full(tmp_path):
+    queue = IngestionQueue(str(tmp_path / "queue.sqlite3"), max_depth=2)
+    queue.enqueue("fridge_a", "a1")
+    queue.enqueue("fridge_b", "b1")
+
+    with pytest.raises(QueueFullError):
+        queue.enqueue("fridge_c", "c1")
+    assert queue.metrics()["rejected"] == 1
+
+
+def test_worker_pool_processes_each_device_in_order(queue):
+    processed = []
+    active = set()
+    overlap = []
+    lock = threading.Lock()
+
+    def handler(event):
+        with lock:
+            if event["device_id"] in active:
+                overlap.append(event["id"])
+            active.add(event["device_id"])
+        time.sleep(0.01)
+        with lock:
+            active.discard(event["device_id"])
+            processed.append((event["device_id"], event["image_url"]))
+        return {"success": True}
+
+    for index in range(4):
+        queue.enqueue("fridge_a", f"a{index}")
+        queue.enqueue("fridge_b", f"b{index}")
+    pool = IngestionWorkerPool(queue, handler=handler, workers=4, poll_interval=0.01)
+    pool.start()
+    deadline = time.time() + 5
+    while queue.depth() and time.time() < deadline:
+        time.sleep(0.02)
+    pool.stop()
+
+    assert overlap == []
+    assert [url for device, url in processed if device == "fridge_a"] == ["a0", "a1", "a2", "a3"]
+    assert [url for device, url in processed if device == "fridge_b"] == ["b0", "b1", "b2", "b3"]
+    assert pool.metrics()["succeeded"] == 8
+
+
+def test_worker_counts_lost_lease(tmp_path):
+    queue = IngestionQueue(str(tmp_path / "queue.sqlite3"), visibility_timeout=0.01)
+    queue.enqueue("fridge_a", "a1")
+
+    def slow_handler(event):
+        time.sleep(0.05)
+        # 租约过期后被重新领取
+        assert queue.claim() is not None
+        return {"success": True}
+
+    pool = IngestionWorkerPool(queue, handler=slow_handler, workers=1)
+    assert pool.run_once() is True
+
+    metrics = pool.metrics()
+    assert metrics["lost_lease"] == 1
+    assert metrics["succeeded"] == 0
+
+
+def test_handler_failure_is_retried(queue):
+    queue.enqueue("fridge_a", "a1")
+    pool = IngestionWorkerPool(queue, handler=lambda event: {"success": False, "error": "识别失败"}, workers=1)
+
+    pool.run_once()
+    pool.run_once()
+
+    assert pool.metrics()["retried"] == 1
+    assert pool.metrics()["failed"] == 1
+
+
+def test_parse_detected_at():
+    assert parse_detected_at(None) is None
+    assert parse_detected_at("2024-09-23T07:30:00Z").utcoffset().total_seconds() == 0
+    assert parse_detected_at("2024-09-23T07:30:00").tzinfo is not None
+    with pytest.raises(ValueError):
+        parse_detected_at("yesterday")
+    with pytest.raises(ValueError):
+        parse_detected_at(1695454200)
+
+
+def test_door_event_endpoint_validates_detected_at(fridge_db):
+    import api_server
+
+    client = api_server.app.test_client()
+    response = client.post("/api/door-events", json={"device_id": "fridge_a", "image_url": "u", "detected_at": "not-a-time"})
+    assert response.status_code == 400
+
+    response = client.post("/api/door-events", json={"device_id": "fridge_a", "image_url": "u", "detected_at": "2024-09-23T07:30:00Z"})
+    assert response.status_code == 202
+    event = client.get(f"/api/door-events/{response.get_json()['event_id']}").get_json()["event"]
+    assert event["detected_at"] == "2024-09-23T07:30:00+00:00"
+    # 导入api_server不会启动工作线程池
+    assert api_server.ingestion_pool is None
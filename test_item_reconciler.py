@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""item_reconciler本地对比与agent_process_and_update设备范围的单元测试"""
+
+import pytest
+
+from item_reconciler import match_score, reconcile_items
+
+
+def _existing(item_id, name, device_id="fridge_a", **fields):
+    item = {
+        "id": item_id,
+        "name": name,
+        "category": fields.pop("category", "乳制品"),
+        "subcategory": fields.pop("subcategory", None),
+        "brand": fields.pop("brand", None),
+        "position": fields.pop("position", {"x": 0, "y": 0, "width": 50, "height": 50}),
+        "device_id": device_id,
+    }
+    item.update(fields)
+    return item
+
+
+def _new(name, device_id="fridge_a", **fields):
+    item = _existing(None, name, device_id, **fields)
+    item.pop("id")
+    return item
+
+
+def test_same_item_is_matched_and_changes_are_updates():
+    last = [_existing(1, "牛奶", freshness="good")]
+    new = [_new("牛奶", freshness="fair")]
+
+    result = reconcile_items(last, new)
+
+    assert result.to_update == [(1, {"freshness": "fair"})]
+    assert not result.to_add and not result.to_delete and not result.has_ambiguity
+
+
+def test_unchanged_item_and_disappeared_item():
+    last = [_existing(1, "牛奶"), _existing(2, "苹果", category="水果", position={"x": 300, "y": 0, "width": 40, "height": 40})]
+    new = [_new("牛奶")]
+
+    result = reconcile_items(last, new)
+
+    assert result.unchanged == [1]
+    assert result.to_delete == [2]
+
+
+def test_new_item_without_candidate_is_added():
+    result = reconcile_items([], [_new("鸡蛋", category="蛋类")])
+
+    assert [item["name"] for item in result.to_add] == ["鸡蛋"]
+
+
+def test_two_equally_good_candidates_are_ambiguous():
+    position = {"x": 0, "y": 0, "width": 50, "height": 50}
+    last = [_existing(1, "酸奶", position=position), _existing(2, "酸奶", position=position)]
+    new = [_new("酸奶", position=position)]
+
+    result = reconcile_items(last, new)
+
+    assert len(result.ambiguous_new) == 1
+    assert {item["id"] for item in result.ambiguous_existing} == {1, 2}
+    # 歧义候选交给agent，不能直接删除
+    assert result.to_delete == []
+
+
+def test_low_score_match_goes_to_agent():
+    last = [_existing(1, "纯牛奶", brand="伊利", position={"x": 0, "y": 0, "width": 50, "height": 50})]
+    new = [_new("牛奶饮品", brand="蒙牛", position={"x": 200, "y": 200, "width": 50, "height": 50})]
+    assert match_score(last[0], new[0]) < 0.75
+
+    result = reconcile_items(last, new)
+
+    assert result.has_ambiguity
+    assert result.to_delete == []
+
+
+def test_only_reconciles_within_device():
+    last = [_existing(1, "牛奶", "fridge_a"), _existing(2, "鸡蛋", "fridge_b", category="蛋类")]
+
+    result = reconcile_items(last, [_new("牛奶", "fridge_a")])
+
+    assert result.unchanged == [1]
+    assert 2 not in result.to_delete
+
+
+def test_explicit_device_id_scopes_items_without_device():
+    last = [_existing(1, "牛奶", "fridge_a"), _existing(2, "鸡蛋", "fridge_b", category="蛋类")]
+    new = [_new("苹果", None, category="水果", position={"x": 300, "y": 0, "width": 40, "height": 40})]
+
+    result = reconcile_items(last, new, device_id="fridge_a")
+
+    assert result.to_delete == [1]
+    assert result.to_add[0]["device_id"] == "fridge_a"
+
+
+def test_unknown_scope_never_deletes():
+    last = [_existing(1, "牛奶", "fridge_a"), _existing(2, "鸡蛋", "fridge_b", category="蛋类")]
+
+    result = reconcile_items(last, [_new("苹果", None, category="水果")])
+
+    assert result.to_delete == []
+
+
+def test_agent_process_requires_device_id(fridge_db):
+    from data_processor import agent_process_and_update
+
+    with pytest.raises(ValueError):
+        agent_process_and_update([{"name": "牛奶", "image_url": "u"}])
+
+
+def test_agent_process_does_not_touch_other_devices(fridge_db):
+    from db import add_fridge_item, get_all_items
+    from data_processor import agent_process_and_update
+
+    session = fridge_db()
+    try:
+        add_fridge_item(session, {"name": "牛奶", "category": "乳制品", "image_url": "u", "device_id": "fridge_a"})
+        add_fridge_item(session, {"name": "鸡蛋", "category": "蛋类", "image_url": "u", "device_id": "fridge_b"})
+        add_fridge_item(session, {"name": "苹果", "category": "水果", "image_url": "u", "device_id": "fridge_b"})
+    finally:
+        session.close()
+
+    messages = agent_process_and_update(
+        [{"name": "牛奶", "category": "乳制品", "image_url": "u"}], device_id="fridge_a"
+    )
+
+    session = fridge_db()
+    try:
+        remaining = sorted((item.device_id, item.name) for item in get_all_items(session))
+    finally:
+        session.close()
+    assert messages == []
+    assert remaining == [("fridge_a", "牛奶"), ("fridge_b", "苹果"), ("fridge_b", "鸡蛋")]
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""local_recipe_engine素食与过敏原过滤的单元测试"""
+
+from local_recipe_engine import LocalRecipeEngine, NON_VEGETARIAN_INGREDIENTS, RECIPE_CORPUS_PATH
+
+
+def _foods(*names, key="fresh_items"):
+    return {key: [{"name": name} for name in names]}
+
+
+def _corpus_engine():
+    return LocalRecipeEngine.from_file(RECIPE_CORPUS_PATH)
+
+
+def _engine(*recipes):
+    defaults = {
+        "difficulty": "简单", "cooking_time": "10分钟", "meal_types": ["lunch"], "cuisine": "chinese",
+        "vegetarian": True, "allergens": [], "optional_ingredients": [], "recipe_steps": [],
+    }
+    return LocalRecipeEngine([{**defaults, **recipe} for recipe in recipes])
+
+
+def test_corpus_vegetarian_recipes_have_no_meat():
+    for recipe in _corpus_engine().recipes:
+        if recipe.get("vegetarian"):
+            ingredients = set(recipe["ingredients"]) | set(recipe.get("optional_ingredients", []))
+            assert not ingredients & NON_VEGETARIAN_INGREDIENTS, recipe["recipe_name"]
+
+
+def test_vegetarian_preference_excludes_meat_from_corpus_results():
+    foods = _foods("培根", "土豆", "奶酪", "五花肉", "包菜")
+
+    results = _corpus_engine().recommend(foods, dietary_preferences={"vegetarian": True}, limit=10)
+
+    assert results
+    for recipe in results:
+        assert not {"培根", "五花肉"} & set(recipe["main_ingredients"]), recipe["recipe_name"]
+
+
+def test_vegetarian_preference_drops_meat_optionals_even_if_recipe_is_flagged():
+    engine = _engine({"recipe_name": "手撕包菜", "ingredients": ["包菜"], "optional_ingredients": ["五花肉", "蒜"]})
+
+    results = engine.recommend(_foods("包菜", "五花肉", "蒜"), dietary_preferences={"vegetarian": True})
+
+    assert [recipe["main_ingredients"] for recipe in results] == [["包菜", "蒜"]]
+
+
+def test_vegetarian_preference_skips_recipe_with_meat_as_required_ingredient():
+    engine = _engine({"recipe_name": "青椒炒肉丝", "ingredients": ["青椒", "猪肉"]})
+
+    assert engine.recommend(_foods("青椒", "猪肉"), dietary_preferences={"vegetarian": True}) == []
+
+
+def test_shrimp_allergy_excludes_dried_shrimp_in_corpus_results():
+    foods = _foods("紫菜", "鸡蛋", "虾皮")
+
+    results = _corpus_engine().recommend(foods, dietary_preferences={"allergies": ["虾"]}, limit=10)
+
+    for recipe in results:
+        assert "虾皮" not in recipe["main_ingredients"], recipe["recipe_name"]
+        assert recipe["recipe_name"] != "紫菜蛋花汤"
+
+
+def test_allergy_drops_offending_optional_ingredient():
+    engine = _engine({"recipe_name": "紫菜蛋花汤", "ingredients": ["紫菜", "鸡蛋"], "optional_ingredients": ["虾皮", "葱"]})
+
+    results = engine.recommend(_foods("紫菜", "鸡蛋", "虾皮", "葱"), dietary_preferences={"allergies": ["shellfish"]})
+
+    assert [recipe["main_ingredients"] for recipe in results] == [["紫菜", "鸡蛋", "葱"]]
+
+
+def test_allergy_term_matches_fridge_item_name():
+    engine = _engine({"recipe_name": "拌面", "ingredients": ["面条"], "optional_ingredients": ["黄瓜"]})
+
+    results = engine.recommend(_foods("面条", "芝麻黄瓜"), dietary_preferences={"allergies": ["芝麻"]})
+
+    assert [recipe["main_ingredients"] for recipe in results] == [["面条"]]
+
+
+def test_allergy_excludes_recipe_by_required_ingredient_tag():
+    engine = _engine({"recipe_name": "番茄炒蛋", "ingredients": ["番茄", "鸡蛋"]})
+
+    assert engine.recommend(_foods("番茄", "鸡蛋"), dietary_preferences={"allergies": ["eggs"]}) == []
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""RecipeStreamParser流式菜谱增量解析与shortlist模式请求构建、响应处理的单元测试"""
+
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import meal_recommendation_agent
+from local_recipe_engine import LOCAL_RECIPE_LIMIT
+from meal_recommendation_agent import MealRecommendationAgent, RecipeStreamParser
+
+RESPONSE = {
+    "analysis": {"note": "含有\"meal_recommendations\"字样的说明 {不是菜谱}"},
+    "meal_recommendations": [
+        {"recipe_name": "番茄炒蛋", "steps": ["打散鸡蛋", "炒{番茄}"], "tips": "加一点糖\\n更好吃"},
+        {"recipe_name": "清炒[青菜]", "ingredients": [{"name": "青菜", "amount": "1把"}]},
+    ],
+    "food_alerts": [{"name": "牛奶"}],
+}
+
+
+def _feed_in_chunks(text, size):
+    parser = RecipeStreamParser()
+    batches = [parser.feed(text[start:start + size]) for start in range(0, len(text), size)]
+    return parser, batches
+
+
+@pytest.mark.parametrize("size", [1, 3, 17, 10000])
+def test_recipes_are_extracted_for_any_chunking(size):
+    text = json.dumps(RESPONSE, ensure_ascii=False)
+
+    parser, batches = _feed_in_chunks(text, size)
+
+    assert [recipe for batch in batches for recipe in batch] == RESPONSE["meal_recommendations"]
+    assert parser.buffer == text
+
+
+def test_recipe_is_emitted_as_soon_as_it_is_complete():
+    text = json.dumps(RESPONSE, ensure_ascii=False)
+    first_end = text.index('更好吃"}') + len('更好吃"}')
+    parser = RecipeStreamParser()
+
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [RESPONSE["meal_recommendations"][0]]
+
+
+def test_objects_after_the_array_are_ignored():
+    parser = RecipeStreamParser()
+
+    recipes = parser.feed('{"meal_recommendations": [{"recipe_name": "a"}], "food_alerts": [{"name": "b"}]}')
+
+    assert recipes == [{"recipe_name": "a"}]
+    assert parser.feed('{"recipe_name": "c"}') == []
+
+
+def test_invalid_recipe_is_skipped():
+    parser = RecipeStreamParser()
+
+    recipes = parser.feed('{"meal_recommendations": [{"recipe_name": a}, {"recipe_name": "b"}]}')
+
+    assert recipes == [{"recipe_name": "b"}]
+
+
+def _shortlist_agent():
+    return MealRecommendationAgent("test-id", "test-key", enable_cache=False)
+
+
+def _shortlist_foods():
+    now = datetime.now(timezone.utc)
+    foods = [
+        {"id": 1, "name": "番茄", "category": "蔬菜", "freshness": "good", "put_in_time": now.isoformat(),
+         "image_url": "https://example.com/tomato.jpg", "additional_info": {"color": "红色"}},
+        {"id": 2, "name": "鸡蛋", "category": "蛋类", "freshness": "fair", "put_in_time": (now - timedelta(days=4)).isoformat()},
+        {"id": 3, "name": "牛奶", "category": "乳制品", "freshness": "poor", "put_in_time": (now - timedelta(days=8)).isoformat()},
+    ]
+    return foods, _shortlist_agent().analyze_food_freshness(foods)
+
+
+CANDIDATES = [
+    {"recipe_name": f"菜谱{index}", "difficulty": "简单", "cooking_time": "10分钟",
+     "main_ingredients": ["番茄"], "missing_ingredients": [], "priority_score": 10 - index}
+    for index in range(1, 8)
+]
+
+
+def _response(content):
+    message = SimpleNamespace(Content=content)
+    usage = SimpleNamespace(PromptTokens=10, CompletionTokens=5, TotalTokens=15)
+    return SimpleNamespace(Choices=[SimpleNamespace(Message=message)], Usage=usage)
+
+
+def _handle(content, candidates=CANDIDATES):
+    _, categorized = _shortlist_foods()
+    return _shortlist_agent()._handle_shortlist_response(_response(content), categorized, candidates, "fridge_a")
+
+
+def test_shortlist_keeps_model_order_and_skips_unknown_and_duplicate_ids():
+    content = json.dumps({"picks": [
+        {"id": "r3", "priority_score": 9, "adaptation": "少放盐"},
+        {"id": "r99", "priority_score": 8},
+        {"id": "r3", "priority_score": 7},
+        "r1",
+        {"id": "r2"},
+    ], "tips": ["尽快吃掉牛奶", 3]}, ensure_ascii=False)
+
+    result = _handle(content)
+
+    assert [recipe["recipe_name"] for recipe in result["meal_recommendations"]] == ["菜谱3", "菜谱2"]
+    assert result["meal_recommendations"][0]["adaptation"] == "少放盐"
+    assert all(recipe["source"] == "shortlist" for recipe in result["meal_recommendations"])
+    assert result["food_alerts"]["recommendations"] == ["尽快吃掉牛奶"]
+    assert result["parsing_error"] is None
+    # 候选菜谱本身没有被修改
+    assert "source" not in CANDIDATES[2]
+
+
+# 非数字的分数被忽略，保留本地评分
+@pytest.mark.parametrize("score, expected", [(42, 10), (-3, 1), (6.5, 6.5), ("3", 9)])
+def test_shortlist_clamps_priority_score(score, expected):
+    candidates = [dict(CANDIDATES[0], priority_score=9)]
+
+    result = _handle(json.dumps({"picks": [{"id": "r1", "priority_score": score}]}), candidates)
+
+    assert result["meal_recommendations"][0]["priority_score"] == expected
+
+
+def test_shortlist_picks_are_capped_at_local_recipe_limit():
+    content = json.dumps({"picks": [{"id": f"r{index}"} for index in range(1, 8)]})
+
+    assert len(_handle(content)["meal_recommendations"]) == LOCAL_RECIPE_LIMIT
+
+
+@pytest.mark.parametrize("content", [
+    "这不是JSON",
+    '{"picks": [{"id": "r1",}',
+    '{"picks": [{"id": "r1"]}',
+    '["r1"]',
+    '{"picks": [{"id": "r404"}]}',
+])
+def test_malformed_shortlist_response_falls_back_to_local_order(content):
+    result = _handle(content)
+
+    assert result["success"] is True
+    assert result["recommendation_source"] == "shortlist"
+    assert result["meal_recommendations"] == CANDIDATES[:LOCAL_RECIPE_LIMIT]
+    assert result["parsing_error"]
+
+
+def test_shortlist_prompt_lists_only_names_and_candidate_summaries():
+    foods, categorized = _shortlist_foods()
+    agent = _shortlist_agent()
+
+    shortlist = agent._build_shortlist_params(categorized, CANDIDATES, "推荐晚饭", "dinner")
+    full = agent._build_request_params(foods, categorized, "推荐晚饭", "dinner")
+    prompt = shortlist["Messages"][1]["Content"]
+    candidate_lines = prompt.split("候选菜谱:\n", 1)[1].strip().splitlines()
+
+    assert candidate_lines[0] == "编号|菜名|难度|时间|使用食材|缺少食材"
+    assert [line.split("|")[0] for line in candidate_lines[1:]] == [f"r{index}" for index in range(1, 8)]
+    assert "番茄" in prompt and "image_url" not in prompt and "红色" not in prompt
+    assert len(prompt) + len(shortlist["Messages"][0]["Content"]) < len(full["Messages"][1]["Content"]) + len(full["Messages"][0]["Content"])
+
+
+def test_shortlist_candidates_are_limited_to_shortlist_size(monkeypatch):
+    _, categorized = _shortlist_foods()
+    agent = _shortlist_agent()
+    limits = []
+    monkeypatch.setattr(meal_recommendation_agent, "RECOMMENDATION_SHORTLIST_SIZE", 2)
+    monkeypatch.setattr(agent.local_engine, "recommend", lambda *args, limit: limits.append(limit) or CANDIDATES[:limit])
+
+    assert agent._shortlist_candidates(categorized, None, None) == CANDIDATES[:2]
+    assert limits == [2]
+
+
+def test_shortlist_candidates_are_empty_when_local_engine_fails(monkeypatch):
+    _, categorized = _shortlist_foods()
+    agent = _shortlist_agent()
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("corpus missing")
+
+    monkeypatch.setattr(agent.local_engine, "recommend", broken)
+
+    assert agent._shortlist_candidates(categorized, None, None) == []
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""migrations在已有数据库上的升级测试"""
+
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+
+from db import DeviceInventorySnapshot, FridgeItem
+from migrations import MIGRATIONS, run_migrations
+
+# 加入迁移之前的fridge_items表结构（没有复合索引和新鲜度跟踪字段）
+LEGACY_FRIDGE_ITEMS = """
+CREATE TABLE fridge_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    category VARCHAR(50),
+    subcategory VARCHAR(50),
+    brand VARCHAR(100),
+    confidence NUMERIC(4, 3),
+    image_url TEXT NOT NULL,
+    position JSON,
+    item_amount_desc VARCHAR(100),
+    freshness VARCHAR(20),
+    expiry_estimate VARCHAR(50),
+    additional_info JSON,
+    detected_at TIMESTAMP,
+    device_id VARCHAR(100),
+    put_in_time TIMESTAMP
+)
+"""
+
+
+def _legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite3'}")
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_FRIDGE_ITEMS))
+        conn.execute(text(
+            "INSERT INTO fridge_items (name, category, freshness, image_url, device_id) VALUES "
+            "('牛奶', '乳制品', 'good', 'u', 'fridge_a'), ('鸡蛋', '蛋类', 'fair', 'u', 'fridge_a'), "
+            "('苹果', '水果', 'good', 'u', 'fridge_b')"
+        ))
+    # 其余新表由create_all创建，与create_tables的顺序一致
+    FridgeItem.metadata.create_all(engine)
+    return engine
+
+
+def test_migrations_upgrade_existing_schema(tmp_path):
+    engine = _legacy_engine(tmp_path)
+
+    executed = run_migrations(engine)
+
+    assert executed == [version for version, _, _ in MIGRATIONS]
+    inspector = inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns("fridge_items")}
+    assert {"freshness_bucket", "next_transition_at"} <= columns
+    indexes = {index["name"] for index in inspector.get_indexes("fridge_items")}
+    assert {"ix_fridge_items_device_put_in_time", "ix_fridge_items_device_category", "ix_fridge_items_next_transition_at"} <= indexes
+    with Session(engine) as session:
+        assert session.scalar(select(FridgeItem).where(FridgeItem.next_transition_at.is_(None))) is None
+        snapshots = {snapshot.device_id: snapshot for snapshot in session.scalars(select(DeviceInventorySnapshot))}
+    assert snapshots["fridge_a"].item_count == 2
+    assert snapshots["fridge_a"].freshness_counts == {"good": 1, "fair": 1, "poor": 0}
+    assert snapshots["fridge_b"].item_count == 1
+
+
+def test_migrations_run_once(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    run_migrations(engine)
+
+    assert run_migrations(engine) == []
+
+
+def test_image_skip_counter_added_to_existing_table(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite3'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE device_image_states (device_id VARCHAR(100) PRIMARY KEY, "
+            "image_hash VARCHAR(64) NOT NULL, image_url TEXT, updated_at TIMESTAMP)"
+        ))
+        conn.execute(text("INSERT INTO device_image_states (device_id, image_hash) VALUES ('fridge_a', '00ff00ff00ff00ff')"))
+    FridgeItem.metadata.create_all(engine)
+
+    run_migrations(engine)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("device_image_states")}
+    assert "skipped_events" in columns
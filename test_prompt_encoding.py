@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""compact_agent_history多轮历史消息压缩的单元测试"""
+
+import copy
+import json
+
+from prompt_encoding import compact_agent_history
+
+LONG = "x" * 50
+
+
+def _assistant(*names):
+    return {
+        "Role": "assistant",
+        "Content": "",
+        "ToolCalls": [
+            {"Id": f"{name}-{index}", "Function": {"Name": name, "Arguments": "{}"}}
+            for index, name in enumerate(names)
+        ],
+    }
+
+
+def _tool(call_id, content):
+    return {"Role": "tool", "ToolCallId": call_id, "Content": content}
+
+
+def _items(count):
+    return json.dumps({"items": [{"id": index, "name": f"物品{index}"} for index in range(count)]}, ensure_ascii=False)
+
+
+def _history():
+    return [
+        {"Role": "user", "Content": "对比冰箱物品"},
+        # 第1轮：一次快照和两个其他工具
+        _assistant("get_current_fridge_items", "get_item_image_by_id", "add_fridge_item"),
+        _tool("get_current_fridge_items-0", _items(3)),
+        _tool("get_item_image_by_id-1", LONG),
+        _tool("add_fridge_item-2", "short"),
+        # 第2轮：再次读取快照
+        _assistant("delete_fridge_item", "get_current_fridge_items"),
+        _tool("delete_fridge_item-0", LONG),
+        _tool("get_current_fridge_items-1", _items(2)),
+        # 第3轮
+        _assistant("get_item_image_by_id", "update_fridge_item"),
+        _tool("get_item_image_by_id-0", LONG),
+        _tool("update_fridge_item-1", LONG),
+    ]
+
+
+def test_older_snapshots_are_stubbed_and_latest_is_kept():
+    messages = _history()
+
+    compacted = compact_agent_history(messages, keep_recent_turns=10, max_tool_result_chars=10)
+
+    stub = json.loads(compacted[2]["Content"])
+    assert stub["omitted"] is True and stub["item_count"] == 3
+    assert compacted[7]["Content"] == _items(2)
+
+
+def test_unparseable_snapshot_is_stubbed_without_count():
+    messages = _history()
+    messages[2] = _tool("get_current_fridge_items-0", "not json")
+
+    stub = json.loads(compact_agent_history(messages, keep_recent_turns=10)[2]["Content"])
+
+    assert stub["omitted"] is True and "item_count" not in stub
+
+
+def test_only_results_outside_recent_turns_are_truncated():
+    compacted = compact_agent_history(_history(), keep_recent_turns=1, max_tool_result_chars=10)
+
+    # 第1、2轮的长结果被截断，短结果不变
+    assert compacted[3]["Content"] == "x" * 10 + "...(已截断)"
+    assert compacted[4]["Content"] == "short"
+    assert compacted[6]["Content"] == "x" * 10 + "...(已截断)"
+    # 最近一轮保持完整
+    assert compacted[9]["Content"] == LONG and compacted[10]["Content"] == LONG
+
+
+def test_keep_recent_turns_zero_truncates_every_turn():
+    compacted = compact_agent_history(_history(), keep_recent_turns=0, max_tool_result_chars=10)
+
+    assert all(compacted[index]["Content"].endswith("...(已截断)") for index in (3, 6, 9, 10))
+    # 最新的快照即使在截断范围内也保持完整
+    assert compacted[7]["Content"] == _items(2)
+
+
+def test_tool_results_pair_with_calls_in_order_across_multi_call_turns():
+    messages = _history()
+    # 第2轮中快照是第二个调用：如果配对错位，会把delete的结果当作快照
+    compacted = compact_agent_history(messages, keep_recent_turns=10, max_tool_result_chars=10)
+
+    assert compacted[6]["Content"] == LONG
+    assert [message.get("ToolCallId") for message in compacted] == [message.get("ToolCallId") for message in messages]
+    assert [message["Role"] for message in compacted] == [message["Role"] for message in messages]
+
+
+def test_assistant_and_user_messages_are_unchanged():
+    messages = _history()
+
+    compacted = compact_agent_history(messages, keep_recent_turns=0, max_tool_result_chars=1)
+
+    for original, result in zip(messages, compacted):
+        if original["Role"] != "tool":
+            assert result is original
+
+
+def test_input_messages_are_not_modified():
+    messages = _history()
+    original = copy.deepcopy(messages)
+
+    compacted = compact_agent_history(messages, keep_recent_turns=0, max_tool_result_chars=5)
+
+    assert messages == original
+    assert compacted[3] is not messages[3]
+    # 没有变化的工具结果直接复用原消息
+    assert compacted[4] is messages[4]
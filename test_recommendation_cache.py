@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""recommendation_cache库存指纹、缓存键、失效与有效期的单元测试"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import recognition_cache
+import recommendation_cache
+from cache_backends import MemoryCacheBackend, SQLiteCacheBackend
+from recommendation_cache import (
+    RecommendationCache,
+    compute_inventory_fingerprint,
+    next_local_midnight,
+    seconds_until_recommendation_change,
+)
+
+RESULT = {"success": True, "meal_recommendations": [{"name": "番茄炒蛋"}], "timestamp": "t"}
+
+
+def _food(item_id, name, **fields):
+    return {"id": item_id, "name": name, "category": "蔬菜", "freshness": "good", **fields}
+
+
+def test_fingerprint_ignores_order_and_tracks_relevant_fields():
+    items = [_food(1, "番茄"), _food(2, "鸡蛋")]
+
+    assert compute_inventory_fingerprint(items) == compute_inventory_fingerprint(list(reversed(items)))
+    assert compute_inventory_fingerprint(items) != compute_inventory_fingerprint([_food(1, "番茄"), _food(2, "鸡蛋", freshness="fair")])
+    # 不影响推荐的字段不改变指纹
+    assert compute_inventory_fingerprint(items) == compute_inventory_fingerprint([_food(1, "番茄", image_url="x"), _food(2, "鸡蛋")])
+
+
+def test_key_normalizes_request_params():
+    cache = RecommendationCache(MemoryCacheBackend())
+
+    key = cache.make_key("fridge_a", "fp", "  想吃 清淡的 ", "Dinner", {"allergies": ["虾", "花生"]})
+
+    assert key == cache.make_key("fridge_a", "fp", "想吃 清淡的", "dinner", {"allergies": ["花生", "虾"]})
+    assert key != cache.make_key("fridge_a", "fp", "想吃 清淡的", "dinner", {"allergies": ["花生", "虾"]}, mode="shortlist")
+    assert key != cache.make_key("fridge_b", "fp", "想吃 清淡的", "dinner", {"allergies": ["花生", "虾"]})
+
+
+def test_invalidate_device_only_affects_that_device_and_global_keys():
+    cache = RecommendationCache(MemoryCacheBackend())
+    key_a = cache.make_key("fridge_a", "fp", "晚饭")
+    key_b = cache.make_key("fridge_b", "fp", "晚饭")
+    key_all = cache.make_key(None, "fp", "晚饭")
+    for key in (key_a, key_b, key_all):
+        cache.set(key, RESULT, [])
+
+    cache.invalidate_device("fridge_a")
+
+    assert cache.make_key("fridge_a", "fp", "晚饭") != key_a
+    assert cache.make_key(None, "fp", "晚饭") != key_all
+    assert cache.make_key("fridge_b", "fp", "晚饭") == key_b
+    assert cache.get(key_b)["cache_hit"] is True
+
+
+def test_generation_survives_lru_eviction():
+    cache = RecommendationCache(MemoryCacheBackend(max_entries=2))
+    cache.invalidate_device("fridge_a")
+    key = cache.make_key("fridge_a", "fp", "晚饭")
+
+    for index in range(5):
+        cache.set(cache.make_key("fridge_b", "fp", f"请求{index}"), RESULT, [])
+
+    assert cache.make_key("fridge_a", "fp", "晚饭") == key
+
+
+def test_sqlite_generation_is_shared_and_survives_clear(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = RecommendationCache(SQLiteCacheBackend(path, max_entries=1))
+    second = RecommendationCache(SQLiteCacheBackend(path, max_entries=1))
+    key = first.make_key("fridge_a", "fp", "晚饭")
+
+    second.invalidate_device("fridge_a")
+    first.backend.clear()
+
+    assert first.make_key("fridge_a", "fp", "晚饭") != key
+    assert first.make_key("fridge_a", "fp", "晚饭") == second.make_key("fridge_a", "fp", "晚饭")
+
+
+def test_recommendation_cache_has_its_own_namespace_in_shared_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "freshtrack_cache.sqlite3")
+    monkeypatch.setenv("RECOGNITION_CACHE_PATH", path)
+    monkeypatch.setenv("RECOMMENDATION_CACHE_PATH", path)
+    monkeypatch.setattr(recognition_cache, "RECOGNITION_CACHE_BACKEND", "sqlite")
+    monkeypatch.setattr(recommendation_cache, "RECOMMENDATION_CACHE_BACKEND", "sqlite")
+    monkeypatch.setattr(recommendation_cache, "RECOMMENDATION_CACHE_MAX_ENTRIES", 1)
+    monkeypatch.setattr(recommendation_cache, "_default_cache", None)
+    monkeypatch.setattr(recommendation_cache, "_default_cache_created", False)
+    recognition = recognition_cache.create_recognition_cache_from_env()
+    recommendation = recommendation_cache.get_recommendation_cache()
+    recommendation.backend.evict_interval = 1
+    recognition_key = recognition.make_key(b"image", "model", "prompt")
+    recognition.set(recognition_key, {"success": True, "items": []})
+
+    for index in range(3):
+        recommendation.set(recommendation.make_key("fridge_a", "fp", f"请求{index}"), RESULT, [])
+    recommendation.backend.clear()
+
+    assert recommendation.backend.namespace == "recommendation"
+    assert recognition.get(recognition_key) is not None
+
+
+def test_fallback_and_empty_results_are_not_cached():
+    cache = RecommendationCache(MemoryCacheBackend())
+    key = cache.make_key("fridge_a", "fp", "晚饭")
+
+    cache.set(key, dict(RESULT, fallback=True), [])
+    cache.set(key, dict(RESULT, meal_recommendations=[]), [])
+
+    assert cache.get(key) is None
+
+
+@pytest.mark.parametrize("days_ago, expected_hours", [(5.5, 12), (2.75, 6), (12.25, 18)])
+def test_ttl_stops_at_next_day_count_change(days_ago, expected_hours):
+    # 以本地零点后一小时为当前时间，避免与日期变化的上限相互干扰
+    now = (next_local_midnight(datetime.now(timezone.utc)) + timedelta(hours=1)).astimezone(timezone.utc)
+    put_in_time = now - timedelta(days=days_ago)
+
+    seconds = seconds_until_recommendation_change([{"put_in_time": put_in_time.isoformat()}], now)
+
+    assert seconds == pytest.approx(expected_hours * 3600)
+
+
+def test_ttl_is_capped_at_local_midnight():
+    midnight = next_local_midnight(datetime.now(timezone.utc))
+    now = midnight - timedelta(minutes=30)
+
+    assert seconds_until_recommendation_change([], now) == pytest.approx(30 * 60)
+    assert seconds_until_recommendation_change([{"put_in_time": (now - timedelta(hours=1)).isoformat()}], now) == pytest.approx(30 * 60)
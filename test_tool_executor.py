@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""tool_executor通道划分、执行顺序与屏障的单元测试"""
+
+import json
+import time
+import asyncio
+import threading
+
+import pytest
+
+from tool_executor import aexecute_tool_calls, execute_tool_calls, plan_tool_call_lanes
+
+
+def _call(name, **args):
+    return {"Id": f"{name}-{len(args)}", "Function": {"Name": name, "Arguments": json.dumps(args)}}
+
+
+def test_writes_on_different_items_get_separate_lanes():
+    calls = [
+        _call("add_fridge_item", new_item_ref="n1"),
+        _call("get_item_image_by_id", item_id=1),
+        _call("add_fridge_item", new_item_ref="n2"),
+        _call("update_fridge_item", item_id=2, new_item_ref="n3"),
+        _call("get_item_image_by_id", item_id=3),
+    ]
+
+    assert plan_tool_call_lanes(calls) == [[[0], [1], [2], [3], [4]]]
+
+
+def test_calls_on_same_item_share_a_lane_in_order():
+    calls = [
+        _call("get_item_image_by_id", item_id=5),
+        _call("delete_fridge_item", item_id=5),
+        _call("update_fridge_item", item_id=6, new_item_ref="n1"),
+        _call("get_item_image_by_id", item_id=5),
+    ]
+
+    assert plan_tool_call_lanes(calls) == [[[0, 1, 3], [2]]]
+
+
+def test_barrier_splits_stages():
+    calls = [
+        _call("delete_fridge_item", item_id=1),
+        _call("get_current_fridge_items"),
+        _call("get_item_image_by_id", item_id=1),
+        _call("add_fridge_item", new_item_ref="n1"),
+    ]
+
+    assert plan_tool_call_lanes(calls) == [[[0]], [[1]], [[2], [3]]]
+
+
+def _recording_executor(delay=0.05):
+    lock = threading.Lock()
+    active = {"writes": 0, "max_writes": 0}
+    log = []
+
+    def execute(tool_call):
+        name = tool_call["Function"]["Name"]
+        is_write = name != "get_item_image_by_id"
+        with lock:
+            log.append(("start", tool_call["Id"]))
+            if is_write:
+                active["writes"] += 1
+                active["max_writes"] = max(active["max_writes"], active["writes"])
+        time.sleep(delay)
+        with lock:
+            if is_write:
+                active["writes"] -= 1
+            log.append(("end", tool_call["Id"]))
+        return {"id": tool_call["Id"]}
+
+    return execute, active, log
+
+
+def _numbered(calls):
+    for index, call in enumerate(calls):
+        call["Id"] = str(index)
+    return calls
+
+
+def test_multi_write_turn_takes_about_as_long_as_slowest_call():
+    calls = _numbered([
+        _call("add_fridge_item", new_item_ref="n1"),
+        _call("add_fridge_item", new_item_ref="n2"),
+        _call("update_fridge_item", item_id=1, new_item_ref="n3"),
+        _call("delete_fridge_item", item_id=2),
+        _call("get_item_image_by_id", item_id=3),
+    ])
+    execute, active, _ = _recording_executor(0.1)
+
+    started = time.perf_counter()
+    results = execute_tool_calls(calls, execute)
+    elapsed = time.perf_counter() - started
+
+    assert [result["id"] for result in results] == ["0", "1", "2", "3", "4"]
+    assert active["max_writes"] == 4
+    # 四个写与一个读同时执行，整轮耗时接近单个调用而不是五个之和
+    assert elapsed < 0.1 * 2
+
+
+def test_writes_on_same_item_never_overlap():
+    calls = _numbered([
+        _call("update_fridge_item", item_id=1, new_item_ref="n1"),
+        _call("update_fridge_item", item_id=1, new_item_ref="n2"),
+        _call("delete_fridge_item", item_id=1),
+    ])
+    execute, active, log = _recording_executor(0.01)
+
+    execute_tool_calls(calls, execute)
+
+    assert active["max_writes"] == 1
+    assert [entry for entry in log if entry[0] == "start"] == [("start", "0"), ("start", "1"), ("start", "2")]
+
+
+def test_barrier_waits_for_previous_calls():
+    calls = _numbered([
+        _call("get_item_image_by_id", item_id=1),
+        _call("add_fridge_item", new_item_ref="n1"),
+        _call("get_current_fridge_items"),
+        _call("get_item_image_by_id", item_id=2),
+    ])
+    execute, _, log = _recording_executor(0.02)
+
+    execute_tool_calls(calls, execute)
+
+    barrier_start = log.index(("start", "2"))
+    assert ("end", "0") in log[:barrier_start] and ("end", "1") in log[:barrier_start]
+    assert log.index(("start", "3")) > log.index(("end", "2"))
+
+
+def test_earliest_error_is_raised_and_lane_stops():
+    calls = _numbered([
+        _call("get_item_image_by_id", item_id=1),
+        _call("update_fridge_item", item_id=2, new_item_ref="bad"),
+        _call("delete_fridge_item", item_id=2),
+    ])
+    executed = []
+
+    def execute(tool_call):
+        executed.append(tool_call["Id"])
+        if tool_call["Id"] == "1":
+            raise RuntimeError("update failed")
+        return {}
+
+    with pytest.raises(RuntimeError, match="update failed"):
+        execute_tool_calls(calls, execute)
+    assert "2" not in executed
+
+
+def test_async_variant_matches_sync_order():
+    calls = _numbered([
+        _call("add_fridge_item", new_item_ref="n1"),
+        _call("get_item_image_by_id", item_id=1),
+        _call("update_fridge_item", item_id=1, new_item_ref="n1"),
+        _call("update_fridge_item", item_id=2, new_item_ref="n2"),
+    ])
+    execute, active, log = _recording_executor(0.01)
+
+    results = asyncio.run(aexecute_tool_calls(calls, execute))
+
+    assert [result["id"] for result in results] == ["0", "1", "2", "3"]
+    assert active["max_writes"] >= 2
+    # 同一物品的读在写之前完成
+    assert log.index(("end", "1")) < log.index(("start", "2"))
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+FreshTrackAI - agent工具调用并行执行
+同一轮中模型返回的多个ToolCall按以下规则并行执行，结果仍按原顺序返回：
+- 操作同一个item_id的调用（读或写）放在同一条执行通道中按原顺序串行执行
+- 操作不同物品的写调用并行执行，各自在独立事务中提交；同一设备库存快照的刷新
+  由db._lock_device_snapshot加行锁串行化，快照不会被并发事务覆盖
+- 没有item_id的调用（如新增物品、无参数的查询）各自独立执行
+- get_current_fridge_items是屏障：等之前的调用全部完成后单独执行，之后的调用再开始
+同一通道中某个调用抛出异常时，该通道后续调用不再执行；整轮结束后按原顺序抛出第一个异常
+"""
+
+import os
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 是否默认并行执行同一轮中的工具调用
+AGENT_PARALLEL_TOOL_CALLS = os.getenv("AGENT_PARALLEL_TOOL_CALLS", "true").lower() in ("1", "true", "yes")
+# 同一轮中同时执行的工具调用数上限
+AGENT_TOOL_MAX_WORKERS = int(os.getenv("AGENT_TOOL_MAX_WORKERS", "8"))
+
+# 需要看到之前所有写入、且之后的写入要等它完成的工具
+BARRIER_TOOLS = ("get_current_fridge_items",)
+ToolExecutor = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def _tool_name(tool_call: Dict[str, Any]) -> str:
+    return tool_call.get("Function", {}).get("Name", "")
+
+
+def _conflict_key(tool_call: Dict[str, Any]) -> Optional[str]:
+    """返回调用操作的item_id，没有item_id或参数无法解析时返回None"""
+    try:
+        args = json.loads(tool_call.get("Function", {}).get("Arguments") or "{}")
+    except (TypeError, ValueError):
+        return None
+    item_id = args.get("item_id") if isinstance(args, dict) else None
+    return None if item_id is None else str(item_id)
+
+
+def plan_tool_call_lanes(tool_calls: List[Dict[str, Any]]) -> List[List[List[int]]]:
+    """
+    把一轮工具调用划分为若干阶段，每个阶段内的通道可以并行执行
+
+    Args:
+        tool_calls: 模型返回的ToolCalls
+
+    Returns:
+        List[List[List[int]]]: 阶段 -> 通道 -> 按原顺序排列的调用下标
+    """
+    stages: List[List[List[int]]] = []
+    lanes: Dict[Any, List[int]] = {}
+    for index, tool_call in enumerate(tool_calls):
+        if _tool_name(tool_call) in BARRIER_TOOLS:
+            if lanes:
+                stages.append(list(lanes.values()))
+                lanes = {}
+            stages.append([[index]])
+            continue
+        key = _conflict_key(tool_call)
+        if key is not None:
+            lanes.setdefault(("item", key), []).append(index)
+        else:
+            lanes[("call", index)] = [index]
+    if lanes:
+        stages.append(list(lanes.values()))
+    return stages
+
+
+def _run_lane(
+    tool_calls: List[Dict[str, Any]],
+    lane: List[int],
+    execute: ToolExecutor
+) -> List[Tuple[int, Optional[Dict[str, Any]], Optional[BaseException]]]:
+    outcomes = []
+    for index in lane:
+        try:
+            outcomes.append((index, execute(tool_calls[index]), None))
+        except Exception as e:
+            outcomes.append((index, None, e))
+            break
+    return outcomes
+
+
+def _collect(
+    tool_calls: List[Dict[str, Any]],
+    stage_outcomes: List[List[Tuple[int, Optional[Dict[str, Any]], Optional[BaseException]]]],
+    results: List[Optional[Dict[str, Any]]]
+):
+    errors = []
+    for outcomes in stage_outcomes:
+        for index, result, error in outcomes:
+            if error is not None:
+                errors.append((index, error))
+            else:
+                results[index] = result
+    if errors:
+        index, error = min(errors, key=lambda entry: entry[0])
+        logger.error(f"工具调用 {_tool_name(tool_calls[index])} 执行失败: {error}")
+        raise error
+
+
+def execute_tool_calls(
+    tool_calls: List[Dict[str, Any]],
+    execute: ToolExecutor,
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    在线程池中并行执行一轮工具调用
+
+    Args:
+        tool_calls: 模型返回的ToolCalls
+        execute: 执行单个ToolCall的函数
+        max_workers: 并行数上限，默认读取AGENT_TOOL_MAX_WORKERS
+
+    Returns:
+        List[Dict]: 与tool_calls一一对应的执行结果
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tool_calls)
+    stages = plan_tool_call_lanes(tool_calls)
+    workers = max(1, min(max_workers or AGENT_TOOL_MAX_WORKERS, max((len(lanes) for lanes in stages), default=1)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-tool") as executor:
+        for lanes in stages:
+            if len(lanes) == 1:
+                stage_outcomes = [_run_lane(tool_calls, lanes[0], execute)]
+            else:
+                futures = [executor.submit(_run_lane, tool_calls, lane, execute) for lane in lanes]
+                stage_outcomes = [future.result() for future in futures]
+            _collect(tool_calls, stage_outcomes, results)
+    return results  # type: ignore
+
+
+async def aexecute_tool_calls(
+    tool_calls: List[Dict[str, Any]],
+    execute: ToolExecutor,
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    execute_tool_calls的异步版本，每条通道在线程中执行，通道之间用asyncio.gather并发
+
+    参数和返回值与execute_tool_calls相同
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tool_calls)
+    semaphore = asyncio.Semaphore(max(1, max_workers or AGENT_TOOL_MAX_WORKERS))
+
+    async def run_lane(lane: List[int]):
+        async with semaphore:
+            return await asyncio.to_thread(_run_lane, tool_calls, lane, execute)
+
+    for lanes in plan_tool_call_lanes(tool_calls):
+        stage_outcomes = await asyncio.gather(*(run_lane(lane) for lane in lanes))
+        _collect(tool_calls, list(stage_outcomes), results)
+    return results  # type: ignore